@@ -0,0 +1,51 @@
+import logging
+from threading import Lock
+from app import app, db
+from models import Alert, AlertStatus
+
+logger = logging.getLogger(__name__)
+
+class ActiveAlertIndex:
+    """In-process map of sensor id to the id of its open (active) alert"""
+
+    def __init__(self):
+        self.alerts = {}
+        self._lock = Lock()
+
+    def load(self):
+        """Populate the index from the database; called once at startup"""
+        try:
+            with app.app_context():
+                rows = db.session.query(Alert.sensor_id, Alert.id).filter(
+                    Alert.sensor_id.isnot(None),
+                    Alert.status == AlertStatus.ACTIVE
+                ).all()
+        except Exception as e:
+            logger.error(f"Error loading active alerts: {e}")
+            return
+
+        with self._lock:
+            self.alerts = {sensor_id: alert_id for sensor_id, alert_id in rows}
+        logger.info(f"Loaded {len(rows)} active sensor alerts")
+
+    def get(self, sensor_id):
+        """Return the id of the sensor's active alert, or None"""
+        return self.alerts.get(sensor_id)
+
+    def add(self, sensor_id, alert_id):
+        """Record a newly created active alert for a sensor"""
+        if sensor_id is None:
+            return
+        with self._lock:
+            self.alerts[sensor_id] = alert_id
+
+    def resolve(self, alert):
+        """Forget an alert that is no longer active"""
+        if alert.sensor_id is None:
+            return
+        with self._lock:
+            if self.alerts.get(alert.sensor_id) == alert.id:
+                del self.alerts[alert.sensor_id]
+
+# Global active alert index
+active_alerts = ActiveAlertIndex()
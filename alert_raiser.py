@@ -0,0 +1,79 @@
+import logging
+from collections import OrderedDict
+from threading import Thread, Condition
+
+logger = logging.getLogger(__name__)
+
+class AlertRaiser:
+    """Creates alerts for threshold crossings on a dedicated thread.
+
+    The I/O threads (the serial multiplexer and the socket listener) only
+    queue a crossing, so a slow or stalled database delays alerts without
+    freezing every port. Crossings are never dropped; a sensor that already
+    has one waiting is not queued twice, since the first raises the alert
+    and later ones would only find it open.
+    """
+
+    def __init__(self, on_alert):
+        self.on_alert = on_alert
+        self.running = False
+        self._thread = None
+        self._pending = OrderedDict()  # sensor_id -> (sensor, channel, value, threshold, trace)
+        self._ready = Condition()
+        self.queued = 0
+        self.coalesced = 0
+        self.high_water = 0
+
+    def start(self):
+        """Start the alert thread"""
+        with self._ready:
+            if self._thread and self._thread.is_alive():
+                return
+            self.running = True
+            self._thread = Thread(target=self._run, name="alert-raiser")
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        """Stop the alert thread after raising every crossing still queued"""
+        with self._ready:
+            self.running = False
+            self._ready.notify()
+            thread, self._thread = self._thread, None
+        if thread:
+            thread.join()
+
+    def submit(self, sensor, channel, value, threshold, trace=None):
+        """Queue a crossing for the alert thread; returns False if the sensor already had one waiting"""
+        if not self.running:
+            self.start()
+        with self._ready:
+            if sensor.id in self._pending:
+                self.coalesced += 1
+                return False
+            self._pending[sensor.id] = (sensor, channel, value, threshold, trace)
+            self.queued += 1
+            self.high_water = max(self.high_water, len(self._pending))
+            self._ready.notify()
+        return True
+
+    def _run(self):
+        while True:
+            with self._ready:
+                while self.running and not self._pending:
+                    self._ready.wait()
+                if not self._pending:
+                    return
+                _, (sensor, channel, value, threshold, trace) = self._pending.popitem(last=False)
+            try:
+                self.on_alert(sensor, channel, value, threshold, trace=trace)
+            except Exception as e:
+                logger.error(f"Error raising alert for sensor {sensor.name}: {e}")
+
+    def stats(self):
+        return {
+            'depth': len(self._pending),
+            'high_water': self.high_water,
+            'queued': self.queued,
+            'coalesced': self.coalesced,
+        }
@@ -0,0 +1,90 @@
+import time
+import threading
+from contextlib import contextmanager
+
+# Stage durations stored on AlertTrace, as (column, from mark, to mark):
+#   receive_ms  - bytes read (select wakeup, socket callback) to the reading handler
+#   parse_ms    - frame classification and channel parsing
+#   check_ms    - threshold checks
+#   lookup_ms   - waiting for the alert thread, then the open-alert lookup in the index
+#                 (or the database on a miss)
+#   commit_ms   - inserting and committing the Alert
+#   dispatch_ms - starting the notification thread
+#   sms_ms / email_ms - time spent in Twilio and SMTP calls, summed over concurrent sends
+#   total_ms    - bytes read to notifications finished
+STAGES = (
+    ('receive_ms', 'received', 'dispatched'),
+    ('parse_ms', 'dispatched', 'parsed'),
+    ('check_ms', 'parsed', 'checked'),
+    ('lookup_ms', 'checked', 'looked_up'),
+    ('commit_ms', 'looked_up', 'committed'),
+    ('dispatch_ms', 'committed', 'notifying'),
+    ('total_ms', 'received', 'finished'),
+)
+
+# Stages timed by accumulation rather than marks, since contacts interleave them
+SPENT = ('sms_ms', 'email_ms')
+
+COLUMNS = tuple(column for column, _, _ in STAGES) + SPENT
+
+_received = threading.local()
+
+class TraceContext:
+    """Monotonic timestamps of one alert-triggering reading at every pipeline stage"""
+
+    __slots__ = ('source', 'marks', 'spent')
+
+    def __init__(self, source, received=None):
+        self.source = source
+        self.marks = {'received': time.monotonic() if received is None else received}
+        self.spent = dict.fromkeys(SPENT, 0.0)
+
+    def mark(self, stage):
+        self.marks[stage] = time.monotonic()
+
+    def add(self, column, seconds):
+        """Add seconds to an accumulated stage"""
+        self.spent[column] += seconds
+
+    def durations(self):
+        """{column: milliseconds} for every stage both of whose marks were reached"""
+        durations = {}
+        for column, start, end in STAGES:
+            if start in self.marks and end in self.marks:
+                durations[column] = (self.marks[end] - self.marks[start]) * 1000
+        if 'notifying' in self.marks:
+            durations.update({column: seconds * 1000 for column, seconds in self.spent.items()})
+        return durations
+
+@contextmanager
+def received(source, at=None):
+    """Mark lines handled on this thread inside the block as read at monotonic time at (default now)"""
+    previous = getattr(_received, 'value', None)
+    _received.value = (source, time.monotonic() if at is None else at)
+    try:
+        yield
+    finally:
+        _received.value = previous
+
+def begin(**marks):
+    """Start a trace for the reading being handled on this thread with marks already taken.
+
+    Readings outside a received() block, such as test readings, are traced
+    from when they were dispatched.
+    """
+    source, at = getattr(_received, 'value', None) or ('direct', marks.get('dispatched'))
+    trace = TraceContext(source, at)
+    trace.marks.update(marks)
+    return trace
+
+def percentiles(rows):
+    """p50/p95/p99/max per stage column over AlertTrace rows"""
+    report = {}
+    for column in COLUMNS:
+        values = sorted(v for v in (getattr(row, column) for row in rows) if v is not None)
+        if not values:
+            continue
+        pick = lambda fraction: round(values[min(int(fraction * len(values)), len(values) - 1)], 3)
+        report[column] = {'count': len(values), 'p50': pick(0.50), 'p95': pick(0.95),
+                          'p99': pick(0.99), 'max': round(values[-1], 3)}
+    return report
@@ -41,10 +41,11 @@ with app.app_context():
     except Exception as e:
         db.create_all()  # Recreate tables if there's an issue
 
-# Import routes, WhatsApp bot, and admin authentication
+# Import routes, WhatsApp bot, admin authentication, and gateway batch ingest
 import routes  # noqa: F401
 import whatsapp_bot  # noqa: F401
 import admin_auth  # noqa: F401
+import batch_ingest  # noqa: F401
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
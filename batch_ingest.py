@@ -0,0 +1,134 @@
+import os
+import time
+import zlib
+import logging
+from flask import request, jsonify
+from app import app
+from sensor_frames import MEASUREMENT
+from sensor_reader import sensor_reader, fire_detector
+from sensor_registry import sensor_registry
+from sensor_health import sensor_health
+from reading_buffer import reading_buffers
+from reading_writer import reading_writer
+from ingest_worker import BatchError, parse_frames, reading_rows, worst_exceedances
+from sharded_ingest import sharded_ingest
+import alert_trace
+
+logger = logging.getLogger(__name__)
+
+# Shared secret for gateways; when unset the endpoint is open like the other APIs
+INGEST_API_TOKEN = os.environ.get("INGEST_API_TOKEN")
+
+# Limits per request, applied after decompression
+INGEST_MAX_BATCH_SIZE = int(os.environ.get("INGEST_MAX_BATCH_SIZE", "50000"))
+INGEST_MAX_BATCH_BYTES = int(os.environ.get("INGEST_MAX_BATCH_BYTES", str(32 * 1024 * 1024)))
+
+def read_batch_body():
+    """Return the request body as bytes, inflating gzip-compressed batches with a size limit"""
+    body = request.get_data(cache=False)
+    compressed = request.headers.get('Content-Encoding', '').lower() == 'gzip' or \
+        request.mimetype in ('application/gzip', 'application/x-gzip')
+    if not compressed:
+        if len(body) > INGEST_MAX_BATCH_BYTES:
+            raise BatchError('Batch too large')
+        return body
+
+    # wbits=47 accepts gzip or zlib headers; max_length guards against decompression bombs
+    decompressor = zlib.decompressobj(wbits=47)
+    try:
+        data = decompressor.decompress(body, INGEST_MAX_BATCH_BYTES)
+    except zlib.error:
+        raise BatchError('Invalid gzip data')
+    if decompressor.unconsumed_tail:
+        raise BatchError('Batch too large')
+    return data
+
+def parse_batch(data):
+    """Parse NDJSON frames into [(sensor_id, value, timestamp, channels)] for known, active sensors.
+
+    Every line must be valid; the first bad line rejects the whole batch.
+    Returns the readings and the sensor snapshots they refer to, keyed by id.
+    """
+    try:
+        # Decode once so json.loads doesn't sniff the encoding of every line
+        text = data.decode('utf-8')
+    except UnicodeDecodeError:
+        raise BatchError('Batch is not valid UTF-8')
+
+    lines = [(line_number, line) for line_number, line in enumerate(text.splitlines(), 1) if line.strip()]
+    if not lines:
+        raise BatchError('Empty batch')
+    if len(lines) > INGEST_MAX_BATCH_SIZE:
+        raise BatchError(f'Batch exceeds {INGEST_MAX_BATCH_SIZE} frames')
+    return parse_frames(lines, sensor_registry.get)
+
+def process_batch(data):
+    """Parse, check and aggregate a batch in this process.
+
+    Returns (rows, deltas, latest, worst, detections) like a sharded ingest
+    worker; deltas and latest are None so the writer derives them, and
+    detections is empty because readings go to the shared fire detector.
+    """
+    readings, sensors = parse_batch(data)
+    for sensor_id, value, timestamp, channels in readings:
+        fire_detector.observe(sensors[sensor_id], timestamp, value)
+    rows = reading_rows(readings)
+    return rows, None, None, worst_exceedances(readings, sensors), []
+
+@app.route('/api/readings/batch', methods=['POST'])
+def ingest_reading_batch():
+    """Bulk ingest of NDJSON (optionally gzip-compressed) reading frames from sensor gateways"""
+    received = time.monotonic()
+    if INGEST_API_TOKEN:
+        token = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+        if token != INGEST_API_TOKEN:
+            return jsonify({'error': 'Invalid ingest token'}), 401
+
+    try:
+        data = read_batch_body()
+        dispatched = time.monotonic()
+        if sharded_ingest.workers:
+            rows, deltas, latest, worst, detections = sharded_ingest.process(data, INGEST_MAX_BATCH_SIZE)
+        else:
+            rows, deltas, latest, worst, detections = process_batch(data)
+    except BatchError as e:
+        return jsonify({'error': str(e)}), 400
+    except RuntimeError as e:
+        logger.error(f"Sharded ingest failed: {e}")
+        return jsonify({'error': 'Ingest workers unavailable'}), 503
+    parsed = time.monotonic()
+
+    # The whole batch is committed in a single transaction
+    try:
+        reading_writer.write_rows(rows, deltas, latest)
+    except Exception as e:
+        logger.error(f"Error writing batch of {len(rows)} readings: {e}")
+        return jsonify({'error': 'Failed to store readings'}), 500
+
+    sensor_ids = set()
+    for row in rows:
+        reading_buffers.record(row[0], row[2], row[1])
+        sensor_ids.add(row[0])
+    for sensor_id in sensor_ids:
+        sensor_health.record(sensor_id, MEASUREMENT)
+
+    # Threshold and alert logic runs once per sensor per batch, on its worst reading,
+    # followed by any rate-of-rise alerts from the ingest workers
+    # Traces share the batch's marks; alerts follow the write, so a batch trace's
+    # check_ms covers storing the readings too
+    checked = time.monotonic()
+    alert_ids = []
+    with alert_trace.received('batch', received):
+        for sensor_id, exceedance in list(worst.items()) + [(d[0], d[1:]) for d in detections]:
+            sensor = sensor_registry.get(sensor_id)
+            trace = alert_trace.begin(dispatched=dispatched, parsed=parsed, checked=checked)
+            alert_id = sensor and sensor_reader._create_fire_alert(sensor, *exceedance, trace=trace)
+            if alert_id:
+                alert_ids.append(alert_id)
+
+    return jsonify({
+        'success': True,
+        'accepted': len(rows),
+        'sensors': len(sensor_ids),
+        'alerts_created': alert_ids
+    })
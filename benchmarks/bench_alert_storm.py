@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Alert storm benchmark
+Raises alerts on N sensors in one building in quick succession, as a fire
+spreading through it would, through ArduinoSensorReader._create_fire_alert
+and the notification outbox, with the Twilio and SMTP calls stubbed and
+counted. Compares outbound message volume with storm coalescing off and on.
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+from threading import Lock
+
+DB_PATH = os.path.join(tempfile.gettempdir(), "bench_alert_storm.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_PATH}"
+# Components are started by the benchmark itself, not by importing the app
+os.environ["SENSOR_MONITORING"] = "0"
+# Placeholder credentials so neither channel is skipped; the provider calls are stubbed
+for name in ("TWILIO_ACCOUNT_SID", "TWILIO_AUTH_TOKEN", "TWILIO_PHONE_NUMBER", "EMAIL_ADDRESS", "EMAIL_PASSWORD"):
+    os.environ[name] = "bench"
+os.environ.setdefault("OUTBOX_POLL_INTERVAL", "0.2")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import logging
+logging.disable(logging.WARNING)
+
+from app import app, db
+from models import Sensor, SensorType, EmergencyContact, NotificationOutbox
+import notifier
+import notification_outbox as outbox_module
+from notification_outbox import notification_outbox
+from notification_dispatch import NotificationDispatcher, TokenBucket
+from sensor_reader import sensor_reader
+from sensor_registry import sensor_registry
+from alert_index import active_alerts
+
+class CountingProviders:
+    """deliver_sms / deliver_email stand-ins that count what would have been sent"""
+
+    def __init__(self):
+        self.sms = 0
+        self.emails = 0
+        self.email_recipients = 0
+        self.first = None
+        self._lock = Lock()
+
+    def _sent(self):
+        if self.first is None:
+            self.first = time.perf_counter()
+
+    def deliver_sms(self, phone_number, message):
+        with self._lock:
+            self.sms += 1
+            self._sent()
+        return {}
+
+    def deliver_email(self, recipients, text):
+        with self._lock:
+            self.emails += 1
+            self.email_recipients += len(recipients)
+            self._sent()
+        return {}
+
+def building(index, sensors):
+    """Sensors spread over one building about 60 m across"""
+    lat, lng = 40.0 + index * 0.01, -74.0
+    with app.app_context():
+        rows = [Sensor(name=f"B{index} sensor {i}", sensor_type=SensorType.TEMPERATURE, threshold_value=50.0,
+                       latitude=lat + random.uniform(0, 0.0005), longitude=lng + random.uniform(0, 0.0005),
+                       location=f"Building {index}")
+                for i in range(sensors)]
+        db.session.add_all(rows)
+        db.session.commit()
+        ids = [row.id for row in rows]
+    sensor_registry.load()
+    return [sensor_registry.get(sensor_id) for sensor_id in ids]
+
+def storm(label, sensors, spread, window, delay):
+    outbox_module.ALERT_STORM_WINDOW = window
+    outbox_module.ALERT_DIGEST_DELAY = delay
+    providers = CountingProviders()
+    notifier.deliver_sms = providers.deliver_sms
+    notifier.deliver_email = providers.deliver_email
+
+    started = time.perf_counter()
+    for sensor in sensors:
+        sensor_reader._create_fire_alert(sensor, 'temperature', random.uniform(60, 90), 50.0)
+        time.sleep(spread / len(sensors))
+    raised = time.perf_counter()
+
+    deadline = raised + delay + 60
+    with app.app_context():
+        while time.perf_counter() < deadline:
+            db.session.expire_all()
+            if not NotificationOutbox.query.filter_by(status='pending').count():
+                break
+            time.sleep(0.1)
+    finished = time.perf_counter()
+
+    print(f"{label:16} {providers.sms:>7,} SMS  {providers.emails:>4,} emails ({providers.email_recipients:,} recipients)  "
+          f"first after {(providers.first - started) * 1000:,.0f} ms, all sent after {finished - started:,.1f} s")
+    return providers
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sensors', type=int, default=40, help='sensors in the building that alert')
+    parser.add_argument('--contacts', type=int, default=50)
+    parser.add_argument('--spread', type=float, default=5, help='seconds over which the alerts are raised')
+    parser.add_argument('--digest-delay', type=float, default=10,
+                        help='ALERT_DIGEST_DELAY for the run (the default deployment uses 60)')
+    args = parser.parse_args()
+
+    # Sends aren't throttled here so the run measures volume, not rate limits
+    notifier.notification_dispatcher = NotificationDispatcher(notifier.NOTIFY_WORKERS, {
+        'sms': TokenBucket(100000, 100000), 'email': TokenBucket(100000, 100000)})
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.add_all(EmergencyContact(name=f"Responder {i}", phone=f"+1555{i:07d}",
+                                            email=f"responder{i}@bench.local")
+                           for i in range(args.contacts))
+        db.session.commit()
+    active_alerts.load()
+    notification_outbox.start()
+
+    print(f"{args.sensors} alerts in one building over {args.spread:g} s, {args.contacts} contacts")
+    print("=" * 72)
+    off = storm("coalescing off", building(0, args.sensors), args.spread, 0, 0)
+    on = storm("coalescing on", building(1, args.sensors), args.spread,
+               outbox_module.ALERT_STORM_WINDOW or 600, args.digest_delay)
+    print(f"\nOutbound messages: {off.sms + off.emails:,} -> {on.sms + on.emails:,} "
+          f"({(off.sms + off.emails) / max(on.sms + on.emails, 1):.0f}x fewer)")
+    print(f"SMS throttling at TWILIO_RATE {notifier.TWILIO_RATE:g}/s: "
+          f"{off.sms / notifier.TWILIO_RATE:,.0f} s -> {on.sms / notifier.TWILIO_RATE:,.0f} s")
+
+    notification_outbox.stop()
+    os.remove(DB_PATH)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Batch ingest load generator
+Posts gzip-compressed NDJSON batches to /api/readings/batch on a scratch
+SQLite database and reports sustained readings/sec, in-process and with
+each requested number of sharded ingest worker processes.
+"""
+
+import os
+import sys
+import json
+import gzip
+import time
+import random
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+
+DB_PATH = os.path.join(tempfile.gettempdir(), "bench_batch_ingest.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_PATH}"
+# Components are started by the benchmark itself, not by importing the app
+os.environ["SENSOR_MONITORING"] = "0"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, db
+from models import Sensor, SensorReading, SensorType
+from sharded_ingest import sharded_ingest
+
+def setup_sensors(count):
+    """Recreate the schema with count combined sensors that never cross their thresholds"""
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.add_all([
+            Sensor(name=f"Gateway Sensor {i}", sensor_type=SensorType.COMBINED, threshold_value=1000.0)
+            for i in range(count)
+        ])
+        db.session.commit()
+
+def make_batches(batches, batch_size, sensors):
+    """Pre-build compressed batches so the generator's own cost is not measured"""
+    start = datetime.utcnow() - timedelta(hours=1)
+    payloads = []
+    for b in range(batches):
+        lines = []
+        for i in range(batch_size):
+            lines.append(json.dumps({
+                'sensor_id': random.randint(1, sensors),
+                'timestamp': (start + timedelta(milliseconds=b * batch_size + i)).isoformat() + 'Z',
+                'channels': {
+                    'temperature': round(random.uniform(18, 30), 2),
+                    'humidity': round(random.uniform(30, 60), 2),
+                    'smoke_level': random.randint(80, 200),
+                    'flame_detected': False,
+                    'fire_risk': random.randint(0, 20)
+                }
+            }, separators=(',', ':')))
+        payloads.append(gzip.compress('\n'.join(lines).encode()))
+    return payloads
+
+def run(payloads, total):
+    """Post every payload; returns (readings/sec, p50 latency, max latency, rows stored)"""
+    client = app.test_client()
+    headers = {'Content-Encoding': 'gzip', 'Content-Type': 'application/x-ndjson'}
+    latencies = []
+    started = time.perf_counter()
+    for payload in payloads:
+        sent = time.perf_counter()
+        response = client.post('/api/readings/batch', data=payload, headers=headers)
+        latencies.append(time.perf_counter() - sent)
+        if response.status_code != 200:
+            raise SystemExit(f"Batch rejected: {response.status_code} {response.get_json()}")
+    elapsed = time.perf_counter() - started
+
+    with app.app_context():
+        stored = SensorReading.query.count()
+    latencies.sort()
+    return total / elapsed, latencies[len(latencies) // 2], latencies[-1], stored
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sensors', type=int, default=500)
+    parser.add_argument('--batches', type=int, default=20)
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[0],
+                        help='sharded ingest worker counts to compare (0 = in-process)')
+    args = parser.parse_args()
+
+    total = args.batches * args.batch_size
+    print(f"Batch ingest: {args.batches} batches x {args.batch_size} readings, {args.sensors} sensors, "
+          f"{os.cpu_count()} CPUs")
+    print("=" * 72)
+    print(f"{'workers':>8} {'readings/sec':>14} {'p50 batch':>12} {'max batch':>12} {'rows stored':>12}")
+    for workers in args.workers:
+        setup_sensors(args.sensors)
+        payloads = make_batches(args.batches, args.batch_size, args.sensors)
+        sharded_ingest.workers = workers
+        if workers:
+            # Start the workers and warm their sensor configs outside the measurement
+            run(payloads[:1], args.batch_size)
+            setup_sensors(args.sensors)
+        rate, p50, slowest, stored = run(payloads, total)
+        sharded_ingest.stop()
+        print(f"{workers:>8} {rate:>14,.0f} {p50 * 1000:>9.1f} ms {slowest * 1000:>9.1f} ms {stored:>12,}")
+
+    os.remove(DB_PATH)
+
+if __name__ == '__main__':
+    main()
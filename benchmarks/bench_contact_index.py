@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Contact index benchmark
+Loads N emergency contacts with coverage circles spread over a region, plus a
+fallback group notified of every alert, and times recipient selection for
+random alert points through the contact index against a haversine scan of
+every contact, as well as notifier.select_contacts end to end. Reports how
+many contacts an alert reaches compared with notifying everyone, and how
+long lookups take while a committed contact change rebuilds the index.
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+DB_PATH = os.path.join(tempfile.gettempdir(), "bench_contact_index.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_PATH}"
+# Components are started by the benchmark itself, not by importing the app
+os.environ["SENSOR_MONITORING"] = "0"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import logging
+logging.disable(logging.WARNING)
+
+from app import app, db
+from models import Alert, AlertType, EmergencyContact
+from notifier import select_contacts
+from contact_index import contact_index, distance_km
+
+# Region the contacts cover, about 220 x 170 km
+REGION = (40.0, 42.0, -75.0, -73.0)
+
+def random_point():
+    return random.uniform(*REGION[:2]), random.uniform(*REGION[2:])
+
+def percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+def timed(label, select, points):
+    samples = []
+    for point in points:
+        started = time.perf_counter()
+        selected = select(point)
+        samples.append(time.perf_counter() - started)
+    print(f"{label:28} p50 {percentile(samples, 0.5) * 1000:>9,.3f} ms  "
+          f"p99 {percentile(samples, 0.99) * 1000:>9,.3f} ms")
+    return samples, selected
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--contacts', type=int, default=100000)
+    parser.add_argument('--fallback', type=int, default=20, help='contacts notified of every alert')
+    parser.add_argument('--min-radius', type=float, default=2, help='km')
+    parser.add_argument('--max-radius', type=float, default=25, help='km')
+    parser.add_argument('--lookups', type=int, default=2000)
+    args = parser.parse_args()
+
+    random.seed(1)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        rows = []
+        for i in range(args.contacts):
+            lat, lng = random_point()
+            rows.append(dict(name=f"Responder {i}", phone=f"+1555{i:07d}", email=f"responder{i}@bench.local",
+                             coverage_latitude=lat, coverage_longitude=lng,
+                             coverage_radius_km=random.uniform(args.min_radius, args.max_radius), always_notify=False))
+        rows.extend(dict(name=f"Dispatcher {i}", phone=f"+1666{i:07d}", email=f"dispatch{i}@bench.local",
+                         coverage_latitude=None, coverage_longitude=None, coverage_radius_km=None,
+                         always_notify=True)
+                    for i in range(args.fallback))
+        db.session.execute(EmergencyContact.__table__.insert(), rows)
+        db.session.commit()
+        circles = [(row.id, row.coverage_latitude, row.coverage_longitude, row.coverage_radius_km)
+                   for row in EmergencyContact.query if not row.always_notify]
+        fallback = {row.id for row in EmergencyContact.query.filter_by(always_notify=True)}
+    total = len(circles) + len(fallback)
+
+    started = time.perf_counter()
+    grid = contact_index.load()
+    loaded = time.perf_counter() - started
+    print(f"{total:,} contacts ({len(fallback)} always notified), coverage radius "
+          f"{args.min_radius:g}-{args.max_radius:g} km, {len(grid.cells):,} grid cells, {len(grid.wide)} wide")
+    print(f"Index built in {loaded * 1000:,.0f} ms")
+    print("=" * 72)
+
+    def scan(point):
+        lat, lng = point
+        covered = {contact_id for contact_id, clat, clng, radius in circles
+                   if distance_km(lat, lng, clat, clng) <= radius}
+        return covered | fallback if covered else covered
+
+    points = [random_point() for _ in range(args.lookups)]
+    scanned, _ = timed("haversine scan", scan, points[:max(args.lookups // 20, 10)])
+    indexed, _ = timed("contact index", lambda point: contact_index.select([point]), points)
+
+    mismatched = sum(scan(point) != contact_index.select([point]) for point in points[:200])
+    reached = [len(contact_index.select([point])) for point in points]
+
+    with app.app_context():
+        alerts = []
+        for lat, lng in points[:50]:
+            alerts.append(Alert(title="Bench fire", alert_type=AlertType.SENSOR_DETECTION,
+                                latitude=lat, longitude=lng, severity='high'))
+        db.session.add_all(alerts)
+        db.session.commit()
+        started = time.perf_counter()
+        for alert in alerts:
+            select_contacts([alert])
+        end_to_end = (time.perf_counter() - started) / len(alerts)
+        started = time.perf_counter()
+        everyone = EmergencyContact.query.filter_by(is_active=True).all()
+        load_all = time.perf_counter() - started
+
+        # The commit starts a background rebuild; lookups keep using the old grid
+        everyone[0].coverage_radius_km += 1
+        db.session.commit()
+        during = []
+        started = time.perf_counter()
+        while contact_index._stale():
+            point = random.choice(points)
+            lookup = time.perf_counter()
+            contact_index.select([point])
+            during.append(time.perf_counter() - lookup)
+        rebuilt = time.perf_counter() - started
+
+    print(f"{'select_contacts (with rows)':28} mean {end_to_end * 1000:>8,.1f} ms, "
+          f"vs {load_all * 1000:,.1f} ms to load all {len(everyone):,}")
+    print(f"{'lookups during rebuild':28} max {max(during, default=0) * 1000:>9,.3f} ms  "
+          f"({len(during):,} lookups while the {rebuilt * 1000:,.0f} ms rebuild ran)")
+    print(f"\nSpeedup over scan: {percentile(scanned, 0.5) / percentile(indexed, 0.5):,.0f}x at p50")
+    print(f"Recipients per alert: mean {sum(reached) / len(reached):,.0f}, "
+          f"p99 {percentile(reached, 0.99):,} of {total:,} ({len(fallback)} fallback)")
+    print(f"Index and scan disagreed on {mismatched} of 200 points")
+    os.remove(DB_PATH)
+
+if __name__ == '__main__':
+    main()
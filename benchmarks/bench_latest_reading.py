@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Latest-reading query benchmark
+Fills a scratch SQLite database with N sensor readings and times the
+latest-reading lookup used by /api/sensors before and after the
+(sensor_id, timestamp) index, plus one bounded retention chunk and a
+retention pass with nothing expired.
+"""
+
+import os
+import sys
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+
+DB_PATH = os.path.join(tempfile.gettempdir(), "bench_latest_reading.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_PATH}"
+# Components are started by the benchmark itself, not by importing the app
+os.environ["SENSOR_MONITORING"] = "0"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, db
+from models import Sensor, SensorReading, SensorType
+import reading_rollups
+from reading_rollups import prune_batch
+
+INDEX_NAME = 'ix_sensor_reading_sensor_id_timestamp'
+
+def populate(rows, sensors):
+    """Recreate the schema and bulk-load rows readings spread over sensors"""
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.add_all([
+            Sensor(name=f"Bench Sensor {i}", sensor_type=SensorType.TEMPERATURE)
+            for i in range(sensors)
+        ])
+        db.session.commit()
+
+    # Load through sqlite3 directly; the ORM is far too slow for 10M rows
+    connection = sqlite3.connect(DB_PATH)
+    connection.execute(f"DROP INDEX IF EXISTS {INDEX_NAME}")
+    start = datetime.utcnow() - timedelta(seconds=rows)
+    chunk = 100000
+    for offset in range(0, rows, chunk):
+        connection.executemany(
+            "INSERT INTO sensor_reading (sensor_id, value, timestamp) VALUES (?, ?, ?)",
+            (
+                (i % sensors + 1, random.uniform(15, 45),
+                 (start + timedelta(seconds=i)).isoformat(sep=' '))
+                for i in range(offset, min(offset + chunk, rows))
+            )
+        )
+        connection.commit()
+    connection.close()
+
+def time_latest_lookups(sensors, iterations):
+    """Average latency of the latest-reading query for random sensors, in milliseconds"""
+    with app.app_context():
+        started = time.perf_counter()
+        for _ in range(iterations):
+            SensorReading.query.filter_by(sensor_id=random.randint(1, sensors))\
+                               .order_by(SensorReading.timestamp.desc())\
+                               .first()
+        elapsed = time.perf_counter() - started
+        db.session.remove()
+    return elapsed / iterations * 1000
+
+def time_retention_chunk(batch_size):
+    """Time one bounded retention chunk, in milliseconds"""
+    with app.app_context():
+        started = time.perf_counter()
+        deleted = prune_batch(db.session, batch_size)
+        db.session.commit()
+        elapsed = time.perf_counter() - started
+    return deleted, elapsed * 1000
+
+def time_idle_pass(rows):
+    """Time a retention pass when no reading has expired yet, in milliseconds"""
+    retention = reading_rollups.READING_RETENTION_DAYS
+    reading_rollups.READING_RETENTION_DAYS = rows // 86400 + 2
+    try:
+        return time_retention_chunk(5000)
+    finally:
+        reading_rollups.READING_RETENTION_DAYS = retention
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000000, 10000000],
+                        help='table sizes to benchmark')
+    parser.add_argument('--sensors', type=int, default=200)
+    parser.add_argument('--iterations', type=int, default=200,
+                        help='lookups per measurement with the index (fewer are run without it)')
+    args = parser.parse_args()
+
+    print("Latest-reading query benchmark (SQLite)")
+    print("=" * 60)
+    for rows in args.rows:
+        print(f"Loading {rows:,} readings for {args.sensors} sensors...")
+        populate(rows, args.sensors)
+
+        before = time_latest_lookups(args.sensors, max(args.iterations // 50, 3))
+
+        connection = sqlite3.connect(DB_PATH)
+        connection.execute(f"CREATE INDEX {INDEX_NAME} ON sensor_reading (sensor_id, timestamp)")
+        connection.commit()
+        connection.close()
+
+        after = time_latest_lookups(args.sensors, args.iterations)
+        deleted, chunk_ms = time_retention_chunk(5000)
+        _, idle_ms = time_idle_pass(rows)
+
+        print(f"  {rows:>12,} rows  no index: {before:10.3f} ms   "
+              f"(sensor_id, timestamp) index: {after:8.3f} ms   speedup: {before / after:8.0f}x")
+        print(f"  retention chunk: deleted {deleted} rows in {chunk_ms:.1f} ms; "
+              f"pass with nothing expired: {idle_ms:.1f} ms")
+
+    os.remove(DB_PATH)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Line framing micro-benchmark
+Compares per-line ser.readline() against bulk reads with LineFramer on a
+pseudo-terminal fed with bursts of fire_sensor_node.ino style frames, and
+reports lines/sec per port for each approach.
+"""
+
+import os
+import sys
+import tty
+import time
+import argparse
+import selectors
+from threading import Thread
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import serial
+from line_framer import LineFramer, decode_line
+
+# One burst as the Arduino node emits it: reading, heartbeat and alert transition
+BURST = (
+    b'{"sensor_id":1,"name":"Fire_Sensor_Node_01","location":"Building_A_Kitchen",'
+    b'"timestamp":123456,"temperature":24.5,"humidity":40.2,"smoke_level":120,'
+    b'"flame_detected":false,"fire_risk":3,"alerts":{"temperature":false,'
+    b'"smoke":false,"flame":false,"active":false}}\r\n'
+    b'{"heartbeat":true,"sensor_id":1,"uptime":123456,"free_memory":812,"alert_active":false}\r\n'
+    b'{"local_alert":"CLEARED","sensor_id":1}\r\n'
+)
+LINES_PER_BURST = BURST.count(b"\n")
+
+def open_pty():
+    """Return (master_fd, slave_path) for a raw pseudo-terminal"""
+    master, slave = os.openpty()
+    tty.setraw(slave)
+    path = os.ttyname(slave)
+    return master, slave, path
+
+def feed(master, bursts):
+    """Write bursts into the pty master from a separate thread"""
+    payload = BURST * 64
+    remaining = bursts
+    while remaining > 0:
+        chunk = payload if remaining >= 64 else BURST * remaining
+        view = memoryview(chunk)
+        while view:
+            written = os.write(master, view)
+            view = view[written:]
+        remaining -= 64
+
+def bench_readline(bursts):
+    """Baseline: one ser.readline() call per line, as the original monitor loop did"""
+    master, slave, path = open_pty()
+    ser = serial.Serial(port=path, baudrate=9600, timeout=1)
+    expected = bursts * LINES_PER_BURST
+    writer = Thread(target=feed, args=(master, bursts), daemon=True)
+
+    received = 0
+    started = time.perf_counter()
+    writer.start()
+    while received < expected:
+        if ser.in_waiting > 0:
+            line = ser.readline().decode('utf-8').strip()
+            if line:
+                received += 1
+    elapsed = time.perf_counter() - started
+
+    writer.join()
+    ser.close()
+    os.close(master)
+    os.close(slave)
+    return received / elapsed
+
+def bench_framer(bursts):
+    """Bulk reads into a reusable buffer, split with memoryview slices"""
+    master, slave, path = open_pty()
+    ser = serial.Serial(port=path, baudrate=9600, timeout=0)
+    framer = LineFramer()
+    selector = selectors.DefaultSelector()
+    selector.register(ser.fileno(), selectors.EVENT_READ)
+    expected = bursts * LINES_PER_BURST
+    writer = Thread(target=feed, args=(master, bursts), daemon=True)
+
+    received = 0
+    started = time.perf_counter()
+    writer.start()
+    while received < expected:
+        selector.select(timeout=1)
+        framer.read_from(ser.fileno())
+        for raw in framer.lines():
+            if decode_line(raw):
+                received += 1
+    elapsed = time.perf_counter() - started
+
+    writer.join()
+    selector.close()
+    ser.close()
+    os.close(master)
+    os.close(slave)
+    return received / elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--bursts', type=int, default=20000,
+                        help='bursts of reading/heartbeat/alert lines per run')
+    parser.add_argument('--runs', type=int, default=3, help='runs per approach; best is reported')
+    args = parser.parse_args()
+
+    print(f"Line framing benchmark: {args.bursts} bursts x {LINES_PER_BURST} lines per port")
+    print("=" * 60)
+    baseline = max(bench_readline(args.bursts) for _ in range(args.runs))
+    framed = max(bench_framer(args.bursts) for _ in range(args.runs))
+    print(f"readline per line : {baseline:12,.0f} lines/sec per port")
+    print(f"LineFramer bulk   : {framed:12,.0f} lines/sec per port")
+    print(f"speedup           : {framed / baseline:12.2f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Notification fan-out benchmark
+Times send_alert_notifications for one alert and N contacts with an SMS and
+an email each, with the Twilio and SMTP calls replaced by stubs that sleep
+for a simulated provider latency. Compares one dispatcher worker (the old
+one-contact-at-a-time loop) with a pool of workers, reporting wall-clock
+time, time to the last notification and time held back by the rate limits.
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+from threading import Lock
+
+DB_PATH = os.path.join(tempfile.gettempdir(), "bench_notification_fanout.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_PATH}"
+# Components are started by the benchmark itself, not by importing the app
+os.environ["SENSOR_MONITORING"] = "0"
+# Placeholder credentials so neither channel is skipped; the provider calls are stubbed
+for name in ("TWILIO_ACCOUNT_SID", "TWILIO_AUTH_TOKEN", "TWILIO_PHONE_NUMBER", "EMAIL_ADDRESS", "EMAIL_PASSWORD"):
+    os.environ[name] = "bench"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import logging
+logging.disable(logging.WARNING)
+
+from app import app, db
+from models import Alert, AlertType, EmergencyContact, NotificationDelivery
+import notifier
+from notification_dispatch import NotificationDispatcher, TokenBucket
+
+class StubProviders:
+    """deliver_sms / deliver_email stand-ins that sleep for the provider latency"""
+
+    def __init__(self, sms_ms, email_ms):
+        self.sms = sms_ms / 1000
+        self.email = email_ms / 1000
+        self.last = 0.0
+        self._lock = Lock()
+
+    def _done(self):
+        with self._lock:
+            self.last = max(self.last, time.perf_counter())
+
+    def deliver_sms(self, phone_number, message):
+        time.sleep(self.sms)
+        self._done()
+        return {}
+
+    def deliver_email(self, recipients, text):
+        time.sleep(self.email)
+        self._done()
+        return {}
+
+def new_alert():
+    """A fresh alert, since notifications skip recipients an alert already reached"""
+    with app.app_context():
+        alert = Alert(title="Bench fire", alert_type=AlertType.SENSOR_DETECTION,
+                      latitude=0.0, longitude=0.0, severity='high')
+        db.session.add(alert)
+        db.session.commit()
+        return alert.id
+
+def run(label, workers, stubs, args):
+    notifier.notification_dispatcher = NotificationDispatcher(workers, {
+        'sms': TokenBucket(args.sms_rate, args.sms_burst),
+        'email': TokenBucket(args.email_rate, args.email_burst),
+    })
+    alert_id = new_alert()
+    started = time.perf_counter()
+    notifier.send_alert_notifications(alert_id)
+    elapsed = time.perf_counter() - started
+    stats = notifier.notification_dispatcher.stats()
+    notifier.notification_dispatcher.shutdown()
+    waited = sum(stats['rate_limited_seconds'].values())
+    print(f"{label:22} {elapsed * 1000:>10,.1f} ms total  {(stubs.last - started) * 1000:>10,.1f} ms to last  "
+          f"{waited * 1000:>9,.1f} ms rate limited")
+    return elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--contacts', type=int, default=50)
+    parser.add_argument('--workers', type=int, default=notifier.NOTIFY_WORKERS)
+    parser.add_argument('--sms-ms', type=float, default=250, help='simulated Twilio API latency')
+    parser.add_argument('--email-ms', type=float, default=400, help='simulated SMTP send latency')
+    parser.add_argument('--sms-rate', type=float, default=notifier.TWILIO_RATE)
+    parser.add_argument('--sms-burst', type=int, default=notifier.TWILIO_BURST)
+    parser.add_argument('--email-rate', type=float, default=notifier.SMTP_RATE)
+    parser.add_argument('--email-burst', type=int, default=notifier.SMTP_BURST)
+    parser.add_argument('--recipients-per-email', type=int, default=notifier.SMTP_MAX_RECIPIENTS)
+    args = parser.parse_args()
+
+    notifier.SMTP_MAX_RECIPIENTS = args.recipients_per_email
+    stubs = StubProviders(args.sms_ms, args.email_ms)
+    notifier.deliver_sms = stubs.deliver_sms
+    notifier.deliver_email = stubs.deliver_email
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.add_all(EmergencyContact(name=f"Responder {i}", phone=f"+1555{i:07d}",
+                                            email=f"responder{i}@bench.local")
+                           for i in range(args.contacts))
+        db.session.commit()
+
+    print(f"send_alert_notifications, {args.contacts} contacts, SMS {args.sms_ms:g} ms, "
+          f"email {args.email_ms:g} ms per call, {args.recipients_per_email} recipients per email")
+    print(f"Rate limits: SMS {args.sms_rate:g}/s burst {args.sms_burst}, "
+          f"email {args.email_rate:g}/s burst {args.email_burst}")
+    print("=" * 72)
+    serial = run("1 worker (serial)", 1, stubs, args)
+    pooled = run(f"{args.workers} workers", args.workers, stubs, args)
+    print(f"\nSpeedup: {serial / pooled:.1f}x")
+
+    with app.app_context():
+        ok = NotificationDelivery.query.filter_by(success=True).count()
+        total = NotificationDelivery.query.count()
+    print(f"Deliveries recorded over both runs: {ok} of {total} succeeded")
+    os.remove(DB_PATH)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+SMTP notification benchmark
+Times send_alert_notifications for one alert and N email contacts against a
+local SMTP stand-in (STARTTLS with a throwaway self-signed certificate, AUTH
+and a simulated round-trip time per reply): once with a new session per
+recipient as notifier used to, then through the SMTP session pool cold,
+warm, and after the server has dropped its idle sessions.
+Requires the openssl command line tool for the certificate.
+"""
+
+import os
+import sys
+import ssl
+import time
+import smtplib
+import argparse
+import tempfile
+import subprocess
+import socketserver
+from threading import Thread
+
+DB_PATH = os.path.join(tempfile.gettempdir(), "bench_smtp_notifications.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_PATH}"
+# Components are started by the benchmark itself, not by importing the app
+os.environ["SENSOR_MONITORING"] = "0"
+os.environ["EMAIL_ADDRESS"] = "alerts@bench.local"
+os.environ["EMAIL_PASSWORD"] = "bench"
+os.environ["SMTP_SERVER"] = "127.0.0.1"
+for name in ("TWILIO_ACCOUNT_SID", "TWILIO_AUTH_TOKEN", "TWILIO_PHONE_NUMBER"):
+    os.environ.pop(name, None)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+class SMTPStandIn(socketserver.ThreadingTCPServer):
+    """Just enough ESMTP for smtplib: EHLO, STARTTLS, AUTH, MAIL/RCPT/DATA, RSET, NOOP, QUIT"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, tls, rtt, idle_timeout):
+        super().__init__(("127.0.0.1", 0), SMTPSession)
+        self.tls = tls
+        self.rtt = rtt
+        self.idle_timeout = idle_timeout
+        self.sessions = 0
+        self.messages = 0
+        self.recipients = 0
+
+class SMTPSession(socketserver.StreamRequestHandler):
+
+    def reply(self, line):
+        time.sleep(self.server.rtt)
+        self.wfile.write(line.encode() + b"\r\n")
+        self.wfile.flush()
+
+    def handle(self):
+        self.server.sessions += 1
+        self.request.settimeout(self.server.idle_timeout)
+        self.reply("220 bench.local ESMTP")
+        recipients = 0
+        try:
+            while True:
+                line = self.rfile.readline()
+                if not line:
+                    return
+                command = line.decode().strip().split(" ", 1)[0].upper()
+                if command in ("EHLO", "HELO"):
+                    tls = isinstance(self.request, ssl.SSLSocket)
+                    extensions = ["AUTH PLAIN LOGIN"] if tls else ["STARTTLS"]
+                    self.reply("\r\n".join(f"250-{e}" for e in ["bench.local"] + extensions) + "\r\n250 8BITMIME")
+                elif command == "STARTTLS":
+                    self.reply("220 Ready to start TLS")
+                    self.request = self.server.tls.wrap_socket(self.request, server_side=True)
+                    self.rfile = self.request.makefile("rb")
+                    self.wfile = self.request.makefile("wb")
+                elif command == "AUTH":
+                    self.reply("235 Authentication successful")
+                elif command == "MAIL":
+                    recipients = 0
+                    self.reply("250 OK")
+                elif command == "RCPT":
+                    recipients += 1
+                    self.reply("250 OK")
+                elif command == "DATA":
+                    self.reply("354 End data with <CR><LF>.<CR><LF>")
+                    while self.rfile.readline() not in (b".\r\n", b""):
+                        pass
+                    self.server.messages += 1
+                    self.server.recipients += recipients
+                    self.reply("250 OK queued")
+                elif command == "QUIT":
+                    self.reply("221 Bye")
+                    return
+                else:
+                    self.reply("250 OK")
+        except (TimeoutError, OSError):
+            # Idle too long: close the session the way mail servers do
+            try:
+                self.reply("421 Idle timeout, closing connection")
+            except OSError:
+                pass
+
+def self_signed_context(directory):
+    cert, key = os.path.join(directory, "cert.pem"), os.path.join(directory, "key.pem")
+    subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+                    "-subj", "/CN=bench.local", "-keyout", key, "-out", cert],
+                   check=True, capture_output=True)
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert, key)
+    return context
+
+def per_recipient(recipients, text):
+    """The previous send path: connect, STARTTLS and LOGIN for every recipient"""
+    import notifier
+    for address in recipients:
+        server = smtplib.SMTP(notifier.SMTP_SERVER, notifier.SMTP_PORT)
+        server.starttls()
+        server.login(notifier.EMAIL_ADDRESS, notifier.EMAIL_PASSWORD)
+        server.sendmail(notifier.EMAIL_ADDRESS, address, text)
+        server.quit()
+    return {}
+
+def new_alert():
+    """A fresh alert, since notifications skip recipients an alert already reached"""
+    from app import app, db
+    from models import Alert, AlertType
+    with app.app_context():
+        alert = Alert(title="Bench fire", alert_type=AlertType.SENSOR_DETECTION,
+                      latitude=0.0, longitude=0.0, severity='high')
+        db.session.add(alert)
+        db.session.commit()
+        return alert.id
+
+def timed(label, server):
+    from notifier import send_alert_notifications
+    alert_id = new_alert()
+    messages, sessions = server.messages, server.sessions
+    started = time.perf_counter()
+    send_alert_notifications(alert_id)
+    elapsed = time.perf_counter() - started
+    print(f"{label:34} {elapsed * 1000:>10,.1f} ms  {server.sessions - sessions:>5} sessions  "
+          f"{server.messages - messages:>5} messages")
+    return elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--contacts', type=int, default=50)
+    parser.add_argument('--rtt-ms', type=float, default=10, help='simulated delay before each server reply')
+    parser.add_argument('--server-idle', type=float, default=2,
+                        help='seconds the stand-in keeps an idle session open')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        server = SMTPStandIn(self_signed_context(directory), args.rtt_ms / 1000, args.server_idle)
+    Thread(target=server.serve_forever, daemon=True).start()
+    os.environ["SMTP_PORT"] = str(server.server_address[1])
+    # Keep client-side expiry out of the way so the server's idle drop is what gets exercised
+    os.environ["SMTP_IDLE_TIMEOUT"] = str(args.server_idle * 10)
+
+    import logging
+    logging.disable(logging.WARNING)
+    from app import app, db
+    from models import EmergencyContact
+    import notifier
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.add_all(EmergencyContact(name=f"Responder {i}", phone="",
+                                            email=f"responder{i}@bench.local")
+                           for i in range(args.contacts))
+        db.session.commit()
+
+    print(f"send_alert_notifications, {args.contacts} email contacts, {args.rtt_ms:g} ms per SMTP reply")
+    print("=" * 72)
+    pooled_send = notifier.deliver_email
+    notifier.deliver_email = per_recipient
+    before = timed("session per recipient", server)
+    notifier.deliver_email = pooled_send
+    cold = timed("pooled, cold", server)
+    warm = timed("pooled, warm", server)
+    time.sleep(args.server_idle + 0.5)
+    dropped = timed("pooled, after server idle drop", server)
+    print(f"\nSpeedup: {before / cold:.1f}x cold, {before / warm:.1f}x warm, {before / dropped:.1f}x after drop")
+    print(f"Pool: {notifier.smtp_pool.stats()}")
+    print(f"Server: {server.sessions} sessions, {server.messages} messages, {server.recipients} recipients")
+
+    notifier.smtp_pool.close()
+    server.shutdown()
+    os.remove(DB_PATH)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Socket listener benchmark
+Holds N idle TCP node connections open on one SensorListener, reports the
+memory they cost, then measures frames/sec over TCP and UDP while those
+connections stay open. Frames are counted, not stored, so only the
+network and framing path is measured.
+"""
+
+import os
+import sys
+import time
+import socket
+import argparse
+import resource
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from socket_listener import SensorListener
+
+FRAME = (b'{"sensor_id":1,"name":"Fire_Sensor_Node_01","temperature":24.5,"humidity":40.2,'
+         b'"smoke_level":120,"flame_detected":false,"fire_risk":3}\n')
+
+NODE = SimpleNamespace(id=1, name="Fire_Sensor_Node_01")
+
+class Counter:
+    """on_line callback that only counts frames"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, sensor, data):
+        self.count += 1
+
+def free_port(kind):
+    with socket.socket(socket.AF_INET, kind) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def wait_for(counter, expected, timeout=30):
+    deadline = time.perf_counter() + timeout
+    while counter.count < expected and time.perf_counter() < deadline:
+        time.sleep(0.001)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--connections', type=int, default=5000)
+    parser.add_argument('--frames', type=int, default=200000)
+    args = parser.parse_args()
+
+    counter = Counter()
+    tcp_port, udp_port = free_port(socket.SOCK_STREAM), free_port(socket.SOCK_DGRAM)
+    listener = SensorListener(on_line=counter, resolve_sensor=lambda sensor_id: NODE,
+                              host="127.0.0.1", tcp_port=tcp_port, udp_port=udp_port)
+    listener.start()
+    time.sleep(0.5)
+
+    print(f"Socket listener: {args.connections:,} idle TCP connections, {args.frames:,} frames")
+    print("=" * 60)
+    before = rss_mb()
+    clients = []
+    started = time.perf_counter()
+    for _ in range(args.connections):
+        clients.append(socket.create_connection(("127.0.0.1", tcp_port)))
+    while len(listener.streams) < args.connections and time.perf_counter() - started < 30:
+        time.sleep(0.05)
+    print(f"connections held   : {len(listener.streams):12,}")
+    print(f"connect time       : {time.perf_counter() - started:12.2f} s")
+    print(f"peak RSS growth    : {rss_mb() - before:12.1f} MB (both ends of every connection)")
+
+    # TCP: stream frames down one connection while the rest stay idle
+    payload = FRAME * 1000
+    started = time.perf_counter()
+    for _ in range(args.frames // 1000):
+        clients[0].sendall(payload)
+    wait_for(counter, args.frames // 1000 * 1000)
+    tcp_rate = counter.count / (time.perf_counter() - started)
+    print(f"TCP frames/sec     : {tcp_rate:12,.0f}")
+
+    # UDP: one frame per datagram, as a node would send them
+    counter.count = 0
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sent = 0
+    started = time.perf_counter()
+    for _ in range(args.frames):
+        sender.sendto(FRAME, ("127.0.0.1", udp_port))
+        sent += 1
+        if sent % 100 == 0:
+            # Pace the sender so the kernel's receive buffer doesn't drop datagrams
+            wait_for(counter, sent, timeout=0.2)
+    wait_for(counter, sent, timeout=1)
+    elapsed = time.perf_counter() - started
+    print(f"UDP frames/sec     : {counter.count / elapsed:12,.0f} ({sent - counter.count} dropped)")
+
+    for client in clients:
+        client.close()
+    sender.close()
+    listener.stop()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+Ingest and alerting benchmark suite
+Drives synthetic fire_sensor_node.ino frames through ArduinoSensorReader on a
+scratch SQLite database and measures ingest throughput, database rows written
+per second and p50/p95/p99 reading-to-alert latency (alert committed and
+notification dispatched) under background load. Results are written as JSON
+so runs of different versions can be compared with --compare.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import subprocess
+from threading import Thread, Barrier, Event
+from datetime import datetime
+
+DB_PATH = os.path.join(tempfile.gettempdir(), "bench_ingest_suite.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_PATH}"
+# Components are started by the benchmark itself, not by importing the app
+os.environ["SENSOR_MONITORING"] = "0"
+os.environ.setdefault("READING_SPOOL_PATH", DB_PATH + ".spool")
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app import app, db
+from models import Sensor, SensorReading, SensorType
+import notification_outbox as outbox_module
+from notification_outbox import notification_outbox
+from sensor_reader import sensor_reader
+from sensor_registry import sensor_registry
+from alert_index import active_alerts
+from reading_writer import reading_writer
+
+# Temperature quiet sensors report; readings arrive far faster than real nodes send
+# them, so any noise would look like a steep rate of rise to fire detection
+QUIET_TEMPERATURE = 22.0
+
+# Compared metrics: rates, where larger is better, and latencies in milliseconds
+RATE_SUFFIX = 'per_sec'
+LATENCY_MARKER = '_ms.'
+
+class AlertStamps:
+    """Records when each sensor's alert was committed and its notifications dispatched.
+
+    Notifications are replaced by a stamp so nothing is sent; dispatch is the
+    moment an outbox worker picks the alert up.
+    """
+
+    def __init__(self):
+        self.committed = {}   # sensor_id -> perf_counter()
+        self.dispatched = {}  # sensor_id -> perf_counter()
+        self.alert_sensors = {}
+        self._add = active_alerts.add
+
+    def install(self):
+        active_alerts.add = self._committed
+        outbox_module.send_alert_notifications = self._dispatched
+
+    def _committed(self, sensor_id, alert_id):
+        self.committed.setdefault(sensor_id, time.perf_counter())
+        self.alert_sensors[alert_id] = sensor_id
+        self._add(sensor_id, alert_id)
+
+    def _dispatched(self, alert_id, trace=None):
+        self.dispatched.setdefault(self.alert_sensors.get(alert_id), time.perf_counter())
+        return True
+
+def frame(sensor_id, temperature):
+    """A fire_sensor_node.ino measurement line as the serial multiplexer hands it over"""
+    return json.dumps({
+        'sensor_id': sensor_id, 'name': f"Node {sensor_id}", 'location': 'Bench',
+        'timestamp': int(time.monotonic() * 1000), 'temperature': temperature,
+        'humidity': round(random.uniform(30, 60), 2), 'smoke_level': random.randint(80, 200),
+        'flame_detected': False, 'fire_risk': random.randint(0, 20),
+    }, separators=(',', ':'))
+
+def setup_sensors(quiet, probes):
+    """Recreate the schema; returns (quiet sensor ids, probe sensor ids).
+
+    Quiet sensors report a steady value, so neither their threshold nor
+    rate-of-rise detection fires; each probe sensor crosses its threshold once.
+    """
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        sensors = [Sensor(name=f"Quiet {i}", sensor_type=SensorType.TEMPERATURE, threshold_value=1000.0)
+                   for i in range(quiet)]
+        sensors += [Sensor(name=f"Probe {i}", sensor_type=SensorType.TEMPERATURE, threshold_value=50.0)
+                    for i in range(probes)]
+        db.session.add_all(sensors)
+        db.session.commit()
+        ids = [sensor.id for sensor in sensors]
+    active_alerts.load()
+    sensor_registry.load()
+    return ids[:quiet], ids[quiet:]
+
+def wait_for_rows(expected, timeout=120):
+    """Wait until expected readings are in the database; returns the perf_counter() time they were"""
+    deadline = time.perf_counter() + timeout
+    written = 0
+    with app.app_context():
+        while time.perf_counter() < deadline:
+            written = SensorReading.query.count()
+            if written >= expected:
+                return time.perf_counter()
+            time.sleep(0.02)
+    raise SystemExit(f"Only {written} of {expected} readings were written")
+
+def throughput(threads, readings, sensors):
+    """Push readings from threads ingest threads, one sensor group per thread as with serial ports"""
+    quiet, _ = setup_sensors(sensors, 0)
+    configs = [sensor_registry.get(sensor_id) for sensor_id in quiet]
+    work = []
+    for t in range(threads):
+        group = configs[t::threads]
+        work.append([(config, frame(config.id, QUIET_TEMPERATURE))
+                     for config in (random.choice(group) for _ in range(readings // threads))])
+    total = sum(len(lines) for lines in work)
+
+    barrier = Barrier(threads + 1)
+    shed = reading_writer.queue.dropped + reading_writer.queue.coalesced
+
+    def ingest(lines):
+        barrier.wait()
+        for config, line in lines:
+            sensor_reader._process_sensor_data(config, line)
+
+    workers = [Thread(target=ingest, args=(lines,)) for lines in work]
+    for worker in workers:
+        worker.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    ingested = time.perf_counter()
+    # Readings the queue shed under READING_QUEUE_POLICY never reach the database
+    shed = reading_writer.queue.dropped + reading_writer.queue.coalesced - shed
+    written = wait_for_rows(total - shed)
+    return {
+        'threads': threads,
+        'readings': total,
+        'shed': shed,
+        'ingest_per_sec': round(total / (ingested - started), 1),
+        'rows_per_sec': round((total - shed) / (written - started), 1),
+    }
+
+def alert_latency(probes, background_rate, sensors, spacing_ms):
+    """Cross the threshold on each probe sensor in turn while background readings keep flowing"""
+    quiet, probe_ids = setup_sensors(sensors, probes)
+    quiet_configs = [sensor_registry.get(sensor_id) for sensor_id in quiet]
+    stamps = AlertStamps()
+    stamps.install()
+    notification_outbox.start()
+    stop = Event()
+
+    def background():
+        sent = 0
+        started = time.perf_counter()
+        while not stop.is_set():
+            config = random.choice(quiet_configs)
+            sensor_reader._process_sensor_data(config, frame(config.id, QUIET_TEMPERATURE))
+            sent += 1
+            ahead = sent / background_rate - (time.perf_counter() - started)
+            if ahead > 0:
+                time.sleep(ahead)
+
+    loader = Thread(target=background)
+    loader.start()
+    time.sleep(1)  # let the writer reach a steady state
+
+    sent_at = {}
+    for sensor_id in probe_ids:
+        config = sensor_registry.get(sensor_id)
+        line = frame(sensor_id, 80.0)
+        sent_at[sensor_id] = time.perf_counter()
+        sensor_reader._process_sensor_data(config, line)
+        time.sleep(spacing_ms / 1000)
+
+    deadline = time.perf_counter() + 10
+    while len(stamps.dispatched) < len(probe_ids) and time.perf_counter() < deadline:
+        time.sleep(0.01)
+    stop.set()
+    loader.join()
+    notification_outbox.stop()
+
+    commit = [(stamps.committed[s] - sent_at[s]) * 1000 for s in probe_ids if s in stamps.committed]
+    dispatch = [(stamps.dispatched[s] - sent_at[s]) * 1000 for s in probe_ids if s in stamps.dispatched]
+    return {
+        'probes': probes,
+        'background_rate': background_rate,
+        'alerts_committed': len(commit),
+        'notifications_dispatched': len(dispatch),
+        'commit_ms': percentiles(commit),
+        'dispatch_ms': percentiles(dispatch),
+    }
+
+def percentiles(values):
+    if not values:
+        return {}
+    ordered = sorted(values)
+    pick = lambda fraction: round(ordered[min(int(fraction * len(ordered)), len(ordered) - 1)], 3)
+    return {'p50': pick(0.50), 'p95': pick(0.95), 'p99': pick(0.99), 'max': round(ordered[-1], 3)}
+
+def git_version():
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+def flatten(results, prefix=''):
+    """Rates and latencies as {'path.to.metric': value}; throughput runs are keyed by thread count"""
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, list):
+            for item in value:
+                flat.update(flatten(item, f"{prefix}{key}.{item.get('threads')}t."))
+        elif (prefix + key).endswith(RATE_SUFFIX) or LATENCY_MARKER in prefix + key:
+            flat[prefix + key] = value
+    return flat
+
+def compare(baseline, current, tolerance):
+    """Print each metric against the baseline run; returns the metrics that regressed"""
+    old, new = flatten(baseline['results']), flatten(current['results'])
+    print(f"\nAgainst {baseline['version']} ({baseline['timestamp']})")
+    print(f"{'metric':44} {'baseline':>12} {'current':>12} {'change':>9}")
+    regressions = []
+    for name in sorted(old.keys() & new.keys()):
+        if not old[name]:
+            continue
+        change = (new[name] - old[name]) / old[name] * 100
+        better = change >= 0 if name.endswith(RATE_SUFFIX) else change <= 0
+        flag = '' if better or abs(change) <= tolerance else '  REGRESSION'
+        if flag:
+            regressions.append(name)
+        print(f"{name:44} {old[name]:>12,.2f} {new[name]:>12,.2f} {change:>+8.1f}%{flag}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sensors', type=int, default=500)
+    parser.add_argument('--readings', type=int, default=50000, help='readings per throughput run')
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 4],
+                        help='ingest thread counts to measure throughput with')
+    parser.add_argument('--probes', type=int, default=200, help='threshold crossings to time')
+    parser.add_argument('--background', type=int, default=2000,
+                        help='background readings/sec while crossings are timed')
+    parser.add_argument('--spacing-ms', type=float, default=20, help='pause between crossings')
+    parser.add_argument('--output', help='results file (default benchmarks/results/ingest-<version>.json)')
+    parser.add_argument('--compare', help='earlier results file to compare against')
+    parser.add_argument('--tolerance', type=float, default=25,
+                        help='percent a metric may get worse before it counts as a regression')
+    args = parser.parse_args()
+
+    # Read the baseline first so a bad path fails before the suite runs
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    version = git_version()
+    print(f"Ingest suite: {version}, {os.cpu_count()} CPUs, {args.sensors} sensors")
+    print("=" * 72)
+
+    runs = []
+    for threads in args.threads:
+        run = throughput(threads, args.readings, args.sensors)
+        runs.append(run)
+        print(f"{threads:>2} threads: {run['ingest_per_sec']:>10,.0f} readings/sec ingested, "
+              f"{run['rows_per_sec']:>10,.0f} rows/sec written, {run['shed']:,} shed")
+
+    latency = alert_latency(args.probes, args.background, args.sensors, args.spacing_ms)
+    for stage in ('commit_ms', 'dispatch_ms'):
+        p = latency[stage]
+        if p:
+            print(f"reading -> alert {stage[:-3]:9}: p50 {p['p50']:8.2f} ms  p95 {p['p95']:8.2f} ms  "
+                  f"p99 {p['p99']:8.2f} ms  max {p['max']:8.2f} ms")
+
+    with app.app_context():
+        dialect = db.engine.dialect.name
+    current = {
+        'suite': 'ingest',
+        'version': version,
+        'timestamp': datetime.utcnow().isoformat() + 'Z',
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'database': dialect,
+        'parameters': vars(args),
+        'results': {'throughput': runs, 'alert_latency': latency},
+    }
+    output = args.output or os.path.join(ROOT, 'benchmarks', 'results', f"ingest-{version}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(current, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    regressions = compare(baseline, current, args.tolerance) if baseline else []
+
+    reading_writer.flush()
+    os.remove(DB_PATH)
+    if regressions:
+        sys.exit(f"{len(regressions)} metrics regressed by more than {args.tolerance:.0f}%")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+import os
+import math
+import time
+import logging
+from itertools import chain, product
+from collections import defaultdict
+from threading import Lock, Thread
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+from app import app, db
+from models import EmergencyContact
+
+logger = logging.getLogger(__name__)
+
+# Grid cell size; each contact is bucketed under every cell its coverage circle overlaps
+CONTACT_INDEX_CELL_KM = float(os.environ.get("CONTACT_INDEX_CELL_KM", "10"))
+
+# Contacts whose coverage spans more cells than this are checked on every lookup instead
+CONTACT_INDEX_MAX_CELLS = int(os.environ.get("CONTACT_INDEX_MAX_CELLS", "1024"))
+
+# Seconds before a lookup rebuilds the index, to pick up contacts changed by other processes
+CONTACT_INDEX_MAX_AGE = float(os.environ.get("CONTACT_INDEX_MAX_AGE", "300"))
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = 111.32
+
+class ContactGrid:
+    """Immutable grid of contact coverage circles over fixed-size latitude/longitude cells"""
+
+    def __init__(self, rows, cell_km=CONTACT_INDEX_CELL_KM, max_cells=CONTACT_INDEX_MAX_CELLS):
+        self.step = cell_km / KM_PER_DEGREE
+        self.cells = defaultdict(list)  # (row, col) -> [(contact id, latitude, longitude, radius km)]
+        self.wide = []                  # circles too large to bucket
+        self.everywhere = []            # ids of contacts notified of every alert
+        for contact_id, latitude, longitude, radius_km, always_notify in rows:
+            if always_notify or latitude is None or longitude is None or radius_km is None:
+                self.everywhere.append(contact_id)
+                continue
+            circle = (contact_id, latitude, longitude, radius_km)
+            lat_span = radius_km / KM_PER_DEGREE
+            lng_span = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(latitude)), 0.01))
+            lat_cells = range(self._index(latitude - lat_span), self._index(latitude + lat_span) + 1)
+            lng_cells = range(self._index(longitude - lng_span), self._index(longitude + lng_span) + 1)
+            if len(lat_cells) * len(lng_cells) > max_cells:
+                self.wide.append(circle)
+                continue
+            for cell in product(lat_cells, lng_cells):
+                self.cells[cell].append(circle)
+
+    def _index(self, degrees):
+        return math.floor(degrees / self.step)
+
+    def covering(self, latitude, longitude):
+        """Ids of contacts whose coverage circle includes the point"""
+        cell = self.cells.get((self._index(latitude), self._index(longitude)), ())
+        return {contact_id for contact_id, lat, lng, radius_km in chain(cell, self.wide)
+                if distance_km(latitude, longitude, lat, lng) <= radius_km}
+
+class ContactIndex:
+    """In-memory spatial index of the coverage areas of active emergency contacts.
+
+    The grid is rebuilt rather than edited, on a background thread: as soon
+    as contacts are committed in this process, and on the first lookup after
+    CONTACT_INDEX_MAX_AGE seconds for changes made by other processes.
+    Lookups keep using the previous grid until the new one is ready; only
+    the very first lookup waits for a build.
+    """
+
+    def __init__(self):
+        self._grid = None
+        self._loaded_at = None
+        self._version = 0          # bumped by every contact change committed here
+        self._loaded_version = None
+        self._rebuilding = False
+        self._lock = Lock()        # guards the fields above
+        self._build_lock = Lock()  # one build at a time
+
+    def load(self):
+        """Build the grid from the active contacts in the database; called once at startup.
+
+        Returns the grid, or None if the build failed; the first lookup then
+        tries again.
+        """
+        try:
+            with self._build_lock:
+                return self._build()
+        except Exception as e:
+            logger.error(f"Error loading emergency contact index: {e}")
+            return None
+
+    def _build(self):
+        with self._lock:
+            version = self._version
+        with app.app_context():
+            rows = db.session.query(
+                EmergencyContact.id, EmergencyContact.coverage_latitude, EmergencyContact.coverage_longitude,
+                EmergencyContact.coverage_radius_km, EmergencyContact.always_notify
+            ).filter(EmergencyContact.is_active.is_(True)).all()
+        grid = ContactGrid(rows)
+        with self._lock:
+            self._grid = grid
+            self._loaded_at = time.monotonic()
+            self._loaded_version = version
+        logger.debug(f"Indexed {len(rows)} emergency contacts ({len(grid.everywhere)} notified of every alert)")
+        return grid
+
+    def invalidate(self):
+        """Rebuild the grid in the background; lookups use the current one until then"""
+        with self._lock:
+            self._version += 1
+            loaded = self._grid is not None
+        if loaded:
+            self._rebuild_in_background()
+
+    def _stale(self):
+        with self._lock:
+            return (self._loaded_version != self._version or
+                    time.monotonic() - self._loaded_at >= CONTACT_INDEX_MAX_AGE)
+
+    def _rebuild_in_background(self):
+        with self._lock:
+            if self._rebuilding:
+                return  # the running rebuild checks for changes again before it exits
+            self._rebuilding = True
+        Thread(target=self._rebuild, name="contact-index-rebuild", daemon=True).start()
+
+    def _rebuild(self):
+        try:
+            while True:
+                with self._build_lock:
+                    if self._stale():
+                        self._build()
+                with self._lock:
+                    # Contacts committed during the build need another one
+                    if self._loaded_version == self._version:
+                        self._rebuilding = False
+                        return
+        except Exception as e:
+            logger.error(f"Error rebuilding contact index: {e}")
+            with self._lock:
+                self._rebuilding = False
+
+    def select(self, points):
+        """Ids of the contacts to notify about alerts at points, [(latitude, longitude)]: those whose
+        coverage includes any of them, and those notified of every alert.
+
+        Empty when no coverage area includes any point, so the caller can
+        notify everyone instead.
+        """
+        grid = self._grid
+        if grid is None:
+            with self._build_lock:
+                # Another lookup may have built it while this one waited
+                grid = self._grid or self._build()
+        elif self._stale():
+            self._rebuild_in_background()
+        covered = set()
+        for latitude, longitude in points:
+            covered |= grid.covering(latitude, longitude)
+        if not covered:
+            return covered
+        return covered.union(grid.everywhere)
+
+def distance_km(lat1, lng1, lat2, lng2):
+    """Great-circle (haversine) distance between two points"""
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2 +
+         math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+# Global contact index
+contact_index = ContactIndex()
+
+# Contact changes committed in this process invalidate the index
+@event.listens_for(EmergencyContact, 'after_insert')
+@event.listens_for(EmergencyContact, 'after_update')
+@event.listens_for(EmergencyContact, 'after_delete')
+def _stage_contact_change(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info['contacts_changed'] = True
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_contact_index(session):
+    if session.info.pop('contacts_changed', None):
+        contact_index.invalidate()
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_contact_changes(session):
+    session.info.pop('contacts_changed', None)
@@ -0,0 +1,212 @@
+import os
+import logging
+from threading import Thread, Event
+from datetime import datetime
+import numpy as np
+from ingest_queue import IngestQueue
+
+logger = logging.getLogger(__name__)
+
+# How often queued readings are folded into the detector state
+DETECTION_TICK_MS = int(os.environ.get("DETECTION_TICK_MS", "1000"))
+
+# Smoothing factor of the per-sensor exponentially weighted moving average
+DETECTION_EWMA_ALPHA = float(os.environ.get("DETECTION_EWMA_ALPHA", "0.3"))
+
+# Readings kept per sensor for the rate-of-rise regression, and how many are needed first
+DETECTION_WINDOW = int(os.environ.get("DETECTION_WINDOW", "30"))
+DETECTION_MIN_SAMPLES = int(os.environ.get("DETECTION_MIN_SAMPLES", "5"))
+
+# Rate-of-rise alarm: a rise of this fraction of the sensor's threshold per minute
+# (0.2 on a 50 °C threshold is 10 °C/min, close to a rate-of-rise heat detector)
+DETECTION_RISE_PER_MINUTE = float(os.environ.get("DETECTION_RISE_PER_MINUTE", "0.2"))
+
+# Projection alarm: the smoothed value is on course to cross the threshold within this many seconds
+DETECTION_LEAD_SECONDS = float(os.environ.get("DETECTION_LEAD_SECONDS", "120"))
+
+# Readings waiting for the next tick; when full, each sensor's pending reading is
+# replaced by its newest (coalesce) so trends stay current at a coarser resolution
+DETECTION_QUEUE_SIZE = int(os.environ.get("DETECTION_QUEUE_SIZE", "100000"))
+DETECTION_QUEUE_POLICY = os.environ.get("DETECTION_QUEUE_POLICY", "coalesce")
+
+EPOCH = datetime(1970, 1, 1)
+
+class FireDetector:
+    """Rate-of-rise and projected-threshold detection for every sensor, updated in batches.
+
+    Per-sensor state lives in NumPy arrays indexed by a slot assigned to each
+    sensor on first sight: EWMA, a ring of recent (time, value) samples, and
+    the least-squares slope over that ring. Readings are queued by observe()
+    and folded in once per tick, so the cost per tick is a handful of array
+    operations regardless of how many sensors reported.
+
+    Absolute-level checks stay in find_exceedance so a single reading over
+    the threshold still alerts without waiting for a tick. With tick_ms=0 no
+    thread is started and the caller runs tick() itself.
+    """
+
+    def __init__(self, on_alert, window=DETECTION_WINDOW, alpha=DETECTION_EWMA_ALPHA,
+                 tick_ms=DETECTION_TICK_MS, capacity=256,
+                 queue_size=DETECTION_QUEUE_SIZE, policy=DETECTION_QUEUE_POLICY):
+        self.on_alert = on_alert
+        self.window = window
+        self.alpha = alpha
+        self.tick_interval = tick_ms / 1000.0
+        self.running = False
+        self._thread = None
+        self._wake = Event()
+        self.queue = IngestQueue(queue_size, policy, name="detection")
+        self.slots = {}     # sensor_id -> row in the state arrays
+        self.sensors = []   # row -> latest sensor object, handed to on_alert
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        """Create or grow the state arrays to hold capacity sensors"""
+        size = len(self.sensors)
+        state = {
+            'ewma': np.zeros(capacity),
+            'threshold': np.zeros(capacity),
+            'slope': np.zeros(capacity),
+            'count': np.zeros(capacity, dtype=np.int64),
+            'position': np.zeros(capacity, dtype=np.int64),
+            'times': np.zeros((capacity, self.window)),
+            'values': np.zeros((capacity, self.window)),
+        }
+        for name, array in state.items():
+            if size:
+                array[:size] = getattr(self, name)[:size]
+            setattr(self, name, array)
+
+    def start(self):
+        """Start the detection tick thread"""
+        if self._thread and self._thread.is_alive():
+            return
+        self.running = True
+        self._wake.clear()
+        self._thread = Thread(target=self._run, name="fire-detector")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop the tick thread"""
+        self.running = False
+        self._wake.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def observe(self, sensor, timestamp, value):
+        """Queue a primary reading for the next tick"""
+        if value is None or not sensor.threshold_value or sensor.threshold_value <= 0:
+            return
+        if not self.running and self.tick_interval:
+            self.start()
+        self.queue.put(sensor.id, (sensor, (timestamp - EPOCH).total_seconds(), float(value)))
+
+    def _run(self):
+        while self.running:
+            self._wake.wait(self.tick_interval)
+            try:
+                self.tick()
+            except Exception as e:
+                logger.error(f"Error in fire detection tick: {e}")
+
+    def tick(self):
+        """Fold queued readings into the state arrays and raise alerts; returns the alerts raised"""
+        pending = self.queue.drain()
+        if not pending:
+            return []
+
+        rows = np.fromiter((self._slot(sensor) for sensor, _, _ in pending),
+                           dtype=np.int64, count=len(pending))
+        times = np.fromiter((t for _, t, _ in pending), dtype=np.float64, count=len(pending))
+        values = np.fromiter((v for _, _, v in pending), dtype=np.float64, count=len(pending))
+
+        # Apply each sensor's readings in time order; round k holds every sensor's
+        # k-th reading this tick, so each round is one vectorized update
+        order = np.lexsort((times, rows))
+        rows, times, values = rows[order], times[order], values[order]
+        first = np.r_[True, rows[1:] != rows[:-1]]
+        group_start = np.maximum.accumulate(np.where(first, np.arange(len(rows)), 0))
+        rank = np.arange(len(rows)) - group_start
+        for k in range(rank.max() + 1):
+            selected = rank == k
+            self._update(rows[selected], times[selected], values[selected])
+
+        touched = rows[first]
+        self._fit_slopes(touched)
+        return self._check(touched)
+
+    def _slot(self, sensor):
+        """Return the state row for a sensor, assigning one on first sight"""
+        row = self.slots.get(sensor.id)
+        if row is None:
+            row = len(self.sensors)
+            if row == len(self.ewma):
+                self._allocate(row * 2)
+            self.slots[sensor.id] = row
+            self.sensors.append(sensor)
+        else:
+            self.sensors[row] = sensor
+        self.threshold[row] = sensor.threshold_value
+        return row
+
+    def _update(self, rows, times, values):
+        """Apply one reading to each of rows (which are unique)"""
+        seen = self.count[rows] > 0
+        self.ewma[rows] = np.where(seen, self.alpha * values + (1 - self.alpha) * self.ewma[rows], values)
+        position = self.position[rows]
+        self.times[rows, position] = times
+        self.values[rows, position] = values
+        self.position[rows] = (position + 1) % self.window
+        self.count[rows] = np.minimum(self.count[rows] + 1, self.window)
+
+    def _fit_slopes(self, rows):
+        """Least-squares slope, in units per second, over each row's sample ring"""
+        count = self.count[rows]
+        valid = np.arange(self.window) < count[:, None]
+        times = self.times[rows]
+        values = self.values[rows]
+        # Centre on the newest sample so epoch-sized times don't lose precision
+        times = np.where(valid, times - times.max(axis=1, keepdims=True), 0.0)
+        n = np.maximum(count, 1)
+        time_mean = times.sum(axis=1) / n
+        value_mean = np.where(valid, values, 0.0).sum(axis=1) / n
+        dt = np.where(valid, times - time_mean[:, None], 0.0)
+        dv = np.where(valid, values - value_mean[:, None], 0.0)
+        variance = (dt * dt).sum(axis=1)
+        slope = np.divide((dt * dv).sum(axis=1), variance,
+                          out=np.zeros(len(rows)), where=variance > 0)
+        self.slope[rows] = np.where(count >= DETECTION_MIN_SAMPLES, slope, 0.0)
+
+    def _check(self, rows):
+        """Raise alerts for rows that are rising too fast or projected to cross their threshold"""
+        slope = self.slope[rows]
+        ewma = self.ewma[rows]
+        threshold = self.threshold[rows]
+        rise_limit = threshold * DETECTION_RISE_PER_MINUTE
+        rise = slope * 60
+        projected = ewma + slope * DETECTION_LEAD_SECONDS
+        rising = (slope > 0) & (rise >= rise_limit)
+        approaching = (slope > 0) & (projected >= threshold) & (ewma < threshold)
+
+        alerts = []
+        for i in np.flatnonzero(rising | approaching):
+            sensor = self.sensors[rows[i]]
+            if rising[i]:
+                alert = (sensor, 'rate_of_rise', float(rise[i]), float(rise_limit[i]))
+            else:
+                alert = (sensor, 'projected_level', float(projected[i]), float(threshold[i]))
+            alerts.append(alert)
+            try:
+                self.on_alert(*alert)
+            except Exception as e:
+                logger.error(f"Error raising detection alert for {sensor.name}: {e}")
+        return alerts
+
+    def time_to_threshold(self, sensor_id):
+        """Seconds until a sensor's smoothed value reaches its threshold at the current slope, or None"""
+        row = self.slots.get(sensor_id)
+        if row is None or self.slope[row] <= 0:
+            return None
+        return max(float((self.threshold[row] - self.ewma[row]) / self.slope[row]), 0.0)
@@ -0,0 +1,218 @@
+import queue
+import time
+import logging
+from collections import deque
+from threading import Lock, Condition
+
+logger = logging.getLogger(__name__)
+
+# Overload policies:
+#   block      - wait for space, as queue.Queue does
+#   coalesce   - replace the sensor's pending entry with the newest one; if it has
+#                none, drop the oldest non-critical entry
+#   drop_quiet - drop the oldest non-critical entry to make room
+# Critical entries (threshold crossings) are never dropped, coalesced or blocked:
+# they take the place of a non-critical entry or, if there is none, go over the bound.
+# Producers that can't afford to classify every item up front pass is_critical instead:
+# it is asked only about an item about to be dropped, which is kept as critical if it says so.
+# Every item shed either way is handed to on_drop, if given, e.g. to spill it to disk;
+# on_drop runs after the queue's lock is released, so a slow hand-off stalls only the
+# producer whose put shed the item.
+POLICIES = ('block', 'coalesce', 'drop_quiet')
+
+class IngestQueue:
+    """Bounded FIFO between ingest stages with a configurable overload policy and counters.
+
+    Entries are put with a key (the sensor id) so the coalesce policy can
+    replace a sensor's pending entry in place. Dropped entries are left in
+    the deque as tombstones and skipped on get, so overload costs O(1) per
+    put.
+    """
+
+    def __init__(self, maxsize, policy='block', name='ingest', on_drop=None, is_critical=None):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown ingest queue policy {policy!r}; expected one of {', '.join(POLICIES)}")
+        self.maxsize = maxsize
+        self.policy = policy
+        self.name = name
+        self.on_drop = on_drop
+        self.is_critical = is_critical
+        self._entries = deque()   # [key, item, critical]; item is None once dropped
+        self._quiet = deque()     # the non-critical entries, oldest first
+        self._pending = {}        # key -> newest live non-critical entry, for coalescing
+        self._size = 0
+        self._tombstones = 0      # dropped entries still in _entries
+        self._overloaded = False
+        self._shedding = []       # items shed by the put in progress, handed off after it
+        self._lock = Lock()
+        self._not_empty = Condition(self._lock)
+        self._not_full = Condition(self._lock)
+        self.queued = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.critical = 0
+        self.high_water = 0
+
+    def put(self, key, item, critical=False):
+        """Queue an item; returns False if it was dropped instead"""
+        with self._not_full:
+            queued = self._put(key, item, critical)
+            shed, self._shedding = self._shedding, []
+        for dropped in shed:
+            try:
+                self.on_drop(dropped)
+            except Exception as e:
+                logger.error(f"Error handing off item shed by the {self.name} queue: {e}")
+        return queued
+
+    def _put(self, key, item, critical):
+        if critical:
+            self.critical += 1
+            if self._size >= self.maxsize:
+                self._drop_oldest_quiet()
+            self._append(key, item, True)
+            return True
+
+        if self._size >= self.maxsize:
+            if self.policy == 'block':
+                while self._size >= self.maxsize:
+                    self._not_full.wait()
+            elif self.policy == 'coalesce' and key in self._pending:
+                entry = self._pending[key]
+                self._shed(entry[1])
+                entry[1] = item
+                self.coalesced += 1
+                self._overload()
+                return True
+            elif not self._drop_oldest_quiet():
+                if self._promote(item):
+                    self.critical += 1
+                    self._append(key, item, True)
+                    return True
+                # Full of crossings; they outrank this reading
+                self._shed(item)
+                self.dropped += 1
+                self._overload()
+                return False
+        self._append(key, item, False)
+        return True
+
+    def _append(self, key, item, critical):
+        entry = [key, item, critical]
+        self._entries.append(entry)
+        if not critical:
+            self._quiet.append(entry)
+            self._pending[key] = entry
+        self._size += 1
+        self.queued += 1
+        self.high_water = max(self.high_water, self._size)
+        self._not_empty.notify()
+
+    def _drop_oldest_quiet(self):
+        """Tombstone the oldest live non-critical entry; returns False if there is none"""
+        while self._quiet:
+            entry = self._quiet.popleft()
+            if entry[1] is None:
+                continue
+            self._forget(entry)
+            if self._promote(entry[1]):
+                # Stays where it is, now out of reach of the drop policy
+                entry[2] = True
+                self.critical += 1
+                continue
+            self._shed(entry[1])
+            entry[1] = None
+            self._size -= 1
+            self.dropped += 1
+            self._tombstones += 1
+            if self._tombstones > self.maxsize:
+                self._entries = deque(e for e in self._entries if e[1] is not None)
+                self._tombstones = 0
+            self._overload()
+            return True
+        return False
+
+    def _promote(self, item):
+        """Whether is_critical says an item about to be dropped must be kept"""
+        if self.is_critical is None:
+            return False
+        try:
+            return self.is_critical(item)
+        except Exception as e:
+            logger.error(f"Error classifying an item in the {self.name} queue: {e}")
+            return False
+
+    def _shed(self, item):
+        if self.on_drop is not None:
+            self._shedding.append(item)
+
+    def _overload(self):
+        if not self._overloaded:
+            self._overloaded = True
+            logger.warning(f"{self.name} queue full ({self.maxsize}); applying {self.policy} policy")
+
+    def _forget(self, entry):
+        if self._pending.get(entry[0]) is entry:
+            del self._pending[entry[0]]
+
+    def get(self, timeout=None):
+        """Remove and return the oldest item, waiting up to timeout seconds; raises queue.Empty"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._not_empty:
+            while True:
+                while self._entries:
+                    entry = self._entries.popleft()
+                    item = entry[1]
+                    if item is None:
+                        self._tombstones -= 1
+                        continue
+                    if not entry[2]:
+                        self._forget(entry)
+                        # Quiet entries leave in the same order they arrived
+                        self._quiet.popleft()
+                    entry[1] = None
+                    self._size -= 1
+                    if self._overloaded and self._size <= self.maxsize // 2:
+                        self._overloaded = False
+                        logger.info(f"{self.name} queue recovered: {self.dropped} dropped, "
+                                    f"{self.coalesced} coalesced so far")
+                    self._not_full.notify()
+                    return item
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise queue.Empty
+                self._not_empty.wait(remaining)
+
+    def get_nowait(self):
+        return self.get(timeout=0)
+
+    def drain(self):
+        """Remove and return every queued item"""
+        with self._lock:
+            items = [entry[1] for entry in self._entries if entry[1] is not None]
+            self._entries.clear()
+            self._quiet.clear()
+            self._pending.clear()
+            self._size = 0
+            self._tombstones = 0
+            self._not_full.notify_all()
+            return items
+
+    def qsize(self):
+        return self._size
+
+    def empty(self):
+        return self._size == 0
+
+    def stats(self):
+        """Counters for the ingest stats endpoint"""
+        return {
+            'policy': self.policy,
+            'maxsize': self.maxsize,
+            'depth': self._size,
+            'high_water': self.high_water,
+            'queued': self.queued,
+            'dropped': self.dropped,
+            'coalesced': self.coalesced,
+            'critical': self.critical,
+        }
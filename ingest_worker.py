@@ -0,0 +1,151 @@
+import json
+import logging
+from collections import OrderedDict
+from fire_detection import FireDetector
+from rollup_buckets import aggregate, latest_readings
+from sensor_frames import parse_timestamp, reading_from_frame, reading_row, find_exceedance, exceedance_ratio
+
+# Nothing here imports the app, so worker processes start without a database
+# connection or the monitoring threads
+
+logger = logging.getLogger(__name__)
+
+class BatchError(ValueError):
+    """A batch that is rejected as a whole"""
+
+def parse_frames(lines, lookup, owns=None):
+    """Parse NDJSON frames into [(sensor_id, value, timestamp, channels)] for known, active sensors.
+
+    lines is an iterable of (line_number, line) and lookup returns the
+    SensorConfig for an id or None. Every line must be valid; the first bad
+    line rejects the whole batch, as does a sensor owns(sensor_id) says was
+    routed to the wrong shard. value is None for frames without the
+    sensor's primary channel; they are checked against thresholds but not
+    stored (see reading_rows). Returns the readings and the sensors they
+    refer to, keyed by id.
+    """
+    frames = []
+    for line_number, line in lines:
+        try:
+            frame = json.loads(line)
+            sensor_id = int(frame['sensor_id'])
+            timestamp = parse_timestamp(frame.get('timestamp'))
+            channels = frame.get('channels') or {}
+            if not isinstance(channels, dict):
+                raise ValueError('channels must be an object')
+        except (ValueError, TypeError, KeyError, AttributeError, OverflowError) as e:
+            raise BatchError(f'Invalid frame on line {line_number}: {e}')
+        if owns is not None and not owns(sensor_id):
+            # Only a frame that repeats its sensor_id key routes differently than it parses
+            raise BatchError(f'Invalid frame on line {line_number}: ambiguous sensor_id')
+        frames.append((line_number, sensor_id, timestamp, channels, frame.get('value')))
+
+    sensors = {sensor_id: lookup(sensor_id) for sensor_id in {frame[1] for frame in frames}}
+
+    readings = []
+    for line_number, sensor_id, timestamp, channels, value in frames:
+        sensor = sensors[sensor_id]
+        if sensor is None:
+            raise BatchError(f'Unknown or inactive sensor {sensor_id} on line {line_number}')
+        measurement = dict(channels)
+        if value is not None:
+            measurement['value'] = value
+        reading = reading_from_frame(measurement, sensor.sensor_type.value)
+        if reading is None:
+            raise BatchError(f'Invalid value on line {line_number}')
+        readings.append((sensor_id, reading[0], timestamp, reading[1]))
+
+    return readings, sensors
+
+def reading_rows(readings):
+    """Reading rows in READING_COLUMNS order for the readings that have a primary value"""
+    return [reading_row(*reading) for reading in readings if reading[1] is not None]
+
+def worst_exceedances(readings, sensors):
+    """Return {sensor_id: exceedance} for each sensor's reading furthest over a threshold"""
+    worst = {}
+    for sensor_id, value, timestamp, channels in readings:
+        exceedance = find_exceedance(sensors[sensor_id], value, channels)
+        if exceedance and (sensor_id not in worst or
+                           exceedance_ratio(exceedance) > exceedance_ratio(worst[sensor_id])):
+            worst[sensor_id] = exceedance
+    return worst
+
+def process_shard(lines, configs, owns=None):
+    """Do everything for one shard of a batch except the database write and fire detection.
+
+    Returns (rows, deltas, latest, worst), the readings and their sensors:
+    reading rows in READING_COLUMNS order, their rollup deltas, each
+    sensor's newest (value, timestamp) and the worst threshold exceedance
+    per sensor. The readings go to observe_shard once the whole batch has
+    been accepted.
+    """
+    readings, sensors = parse_frames(lines, lambda sensor_id: _active(configs.get(sensor_id)), owns)
+    rows = reading_rows(readings)
+    worst = worst_exceedances(readings, sensors)
+    return (rows, aggregate(rows), latest_readings(rows), worst), readings, sensors
+
+def observe_shard(readings, sensors, detector):
+    """Feed an accepted shard to the fire detector; returns its (sensor_id, channel, reading, threshold) alerts"""
+    for sensor_id, value, timestamp, channels in readings:
+        detector.observe(sensors[sensor_id], timestamp, value)
+    return [(sensor.id, channel, reading, threshold)
+            for sensor, channel, reading, threshold in detector.tick()]
+
+def _active(config):
+    return config if config is not None and config.is_active else None
+
+def run_worker(shard, shards, inbox, outbox):
+    """Worker process loop.
+
+    (job_id, configs or None, lines) is checked and answered with
+    (job_id, shard, exception or None, (rows, deltas, latest, worst)); the
+    readings are then held until the parent's (job_id, accepted) verdict on
+    the whole batch. Accepted jobs are fed to the detector in the order they
+    arrived and answered with (job_id, shard, None, detections); rejected
+    ones are dropped without an answer.
+
+    Sensors are partitioned by id, so this worker's detector sees every
+    reading of the sensors it owns and its rate-of-rise state stays whole.
+    """
+    configs = {}
+    # Ticked once per accepted job by observe_shard rather than by its own thread
+    detector = FireDetector(on_alert=lambda *alert: None, tick_ms=0)
+    held = OrderedDict()  # job_id -> [readings, sensors, verdict or None], in arrival order
+
+    def owns(sensor_id):
+        return sensor_id % shards == shard
+
+    while True:
+        job = inbox.get()
+        if job is None:
+            break
+        if len(job) == 2:
+            job_id, accepted = job
+            if job_id in held:
+                held[job_id][2] = accepted
+            # A later job can't be observed before an earlier one is settled
+            while held and next(iter(held.values()))[2] is not None:
+                job_id, (readings, sensors, accepted) = held.popitem(last=False)
+                if not accepted:
+                    continue
+                try:
+                    outbox.put((job_id, shard, None, observe_shard(readings, sensors, detector)))
+                except Exception as e:
+                    logger.error(f"Ingest worker {shard} failed on job {job_id}: {e}")
+                    outbox.put((job_id, shard, RuntimeError(f'Ingest worker {shard} failed: {e}'), None))
+            continue
+
+        job_id, new_configs, lines = job
+        if new_configs is not None:
+            configs = new_configs
+        try:
+            result, readings, sensors = process_shard(lines, configs, owns)
+        except BatchError as e:
+            outbox.put((job_id, shard, BatchError(str(e)), None))
+        except Exception as e:
+            logger.error(f"Ingest worker {shard} failed on job {job_id}: {e}")
+            outbox.put((job_id, shard, RuntimeError(f'Ingest worker {shard} failed: {e}'), None))
+        else:
+            held[job_id] = [readings, sensors, None]
+            outbox.put((job_id, shard, None, result))
@@ -0,0 +1,76 @@
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Size of the reusable read buffer per port; also the longest line accepted
+SERIAL_READ_BUFFER_SIZE = int(os.environ.get("SERIAL_READ_BUFFER_SIZE", "65536"))
+
+class LineFramer:
+    """Splits a byte stream into lines using one reusable buffer per port"""
+
+    def __init__(self, capacity=SERIAL_READ_BUFFER_SIZE):
+        self.buffer = bytearray(capacity)
+        self.view = memoryview(self.buffer)
+        self.start = 0  # first byte not yet returned as part of a line
+        self.end = 0    # end of valid data in the buffer
+
+    def read_from(self, fd):
+        """Drain whatever is waiting on fd with a single read; returns bytes read (0 at EOF)"""
+        self._make_room()
+        count = os.readv(fd, [self.view[self.end:]])
+        self.end += count
+        return count
+
+    def feed(self, data):
+        """Append bytes already read elsewhere (e.g. by a socket protocol) and yield complete lines.
+
+        Each yielded line must be handled before the generator is advanced,
+        because appending the rest of the data may reuse the buffer.
+        """
+        data = memoryview(data)
+        while data:
+            self._make_room()
+            count = min(len(data), len(self.buffer) - self.end)
+            self.view[self.end:self.end + count] = data[:count]
+            self.end += count
+            data = data[count:]
+            if data:
+                yield from self.lines()
+        yield from self.lines()
+
+    def lines(self):
+        """Yield each complete line as a memoryview into the buffer.
+
+        The views are only valid until the next read_from/feed call, so callers
+        must decode or copy them before reading again. A trailing partial line
+        stays in the buffer and is completed by the next read.
+        """
+        buffer = self.buffer
+        position = self.start
+        end = self.end
+        while True:
+            newline = buffer.find(b"\n", position, end)
+            if newline < 0:
+                break
+            yield self.view[position:newline]
+            position = newline + 1
+        self.start = position
+        if position == end:
+            self.start = self.end = 0
+
+    def _make_room(self):
+        """Move a carried-over partial line to the front of the buffer"""
+        if self.start:
+            remaining = self.end - self.start
+            # memoryview assignment uses memmove, so the overlapping copy is safe
+            self.view[:remaining] = self.view[self.start:self.end]
+            self.start = 0
+            self.end = remaining
+        if self.end == len(self.buffer):
+            logger.warning(f"Discarding {self.end} bytes without a line break")
+            self.end = 0
+
+def decode_line(line):
+    """Decode a framed line to text, dropping the trailing carriage return and whitespace"""
+    return str(line, 'utf-8', 'replace').strip()
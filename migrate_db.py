@@ -1,34 +1,65 @@
-
 from app import app, db
 from models import Alert, AdminResponse
-from sqlalchemy import text
+from sqlalchemy import text, inspect
+
+# Columns added after the first release, as (table, column, DDL type)
+ADDED_COLUMNS = [
+    ('alert', 'image_urls', 'TEXT'),
+    ('sensor', 'temperature_threshold', 'FLOAT'),
+    ('sensor', 'smoke_threshold', 'FLOAT'),
+    ('sensor', 'fire_risk_threshold', 'FLOAT'),
+    ('sensor', 'flame_alert', 'BOOLEAN'),
+    ('sensor_reading', 'temperature', 'FLOAT'),
+    ('sensor_reading', 'humidity', 'FLOAT'),
+    ('sensor_reading', 'smoke_level', 'FLOAT'),
+    ('sensor_reading', 'flame_detected', 'BOOLEAN'),
+    ('sensor_reading', 'fire_risk', 'FLOAT'),
+    ('notification_outbox', 'cell', 'VARCHAR(64)'),
+    ('notification_outbox', 'coalesced', 'BOOLEAN'),
+    ('notification_delivery', 'digest', 'BOOLEAN'),
+    ('emergency_contact', 'coverage_latitude', 'FLOAT'),
+    ('emergency_contact', 'coverage_longitude', 'FLOAT'),
+    ('emergency_contact', 'coverage_radius_km', 'FLOAT'),
+    ('emergency_contact', 'always_notify', 'BOOLEAN'),
+]
 
 def migrate_database():
-    """Add missing columns to existing database"""
+    """Add missing tables, columns and indexes to an existing database"""
     with app.app_context():
         try:
-            # Check if image_urls column exists
-            result = db.session.execute(text("SELECT column_name FROM information_schema.columns WHERE table_name='alert' AND column_name='image_urls'"))
-            if not result.fetchone():
-                # Add image_urls column
-                db.session.execute(text("ALTER TABLE alert ADD COLUMN image_urls TEXT"))
-                db.session.commit()
-                print("Added image_urls column to alert table")
-            else:
-                print("image_urls column already exists")
-            
-            # Check if AdminResponse table exists
-            result = db.session.execute(text("SELECT table_name FROM information_schema.tables WHERE table_name='admin_response'"))
-            if not result.fetchone():
-                # Create AdminResponse table
-                db.create_all()
+            # Create any missing tables, such as AdminResponse
+            inspector = inspect(db.engine)
+            existing_tables = set(inspector.get_table_names())
+            db.create_all()
+            for table in sorted(set(db.metadata.tables) - existing_tables):
+                print(f"Created {table} table")
+
+            # Add columns that create_all() does not add to existing tables
+            for table, column, column_type in ADDED_COLUMNS:
+                if table not in existing_tables:
+                    continue
+                columns = {c['name'] for c in inspector.get_columns(table)}
+                if column in columns:
+                    print(f"{column} column already exists in {table}")
+                    continue
+                db.session.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}"))
                 db.session.commit()
-                print("Created AdminResponse table")
-            else:
-                print("AdminResponse table already exists")
-                
+                print(f"Added {column} column to {table} table")
+
+            # Create indexes declared on models but missing from existing tables
+            for table in db.metadata.sorted_tables:
+                if table.name not in existing_tables:
+                    continue
+                existing_indexes = {i['name'] for i in inspector.get_indexes(table.name)}
+                for index in table.indexes:
+                    if index.name in existing_indexes:
+                        print(f"{index.name} index already exists")
+                        continue
+                    index.create(db.engine)
+                    print(f"Created {index.name} index on {table.name}")
+
             print("Database migration completed successfully!")
-                
+
         except Exception as e:
             print(f"Migration error: {e}")
             db.session.rollback()
@@ -0,0 +1,17 @@
+import enum
+
+class AlertStatus(enum.Enum):
+    ACTIVE = "active"
+    RESOLVED = "resolved"
+    FALSE_ALARM = "false_alarm"
+
+class AlertType(enum.Enum):
+    SENSOR_DETECTION = "sensor_detection"
+    COMMUNITY_REPORT = "community_report"
+    MANUAL_TRIGGER = "manual_trigger"
+
+class SensorType(enum.Enum):
+    TEMPERATURE = "temperature"
+    SMOKE = "smoke"
+    FLAME = "flame"
+    COMBINED = "combined"
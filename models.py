@@ -1,23 +1,9 @@
 from app import db
 from datetime import datetime
 from sqlalchemy import Enum
-import enum
+# Enums live in their own module so processes without the app can unpickle them
+from model_enums import AlertStatus, AlertType, SensorType  # noqa: F401
 
-class AlertStatus(enum.Enum):
-    ACTIVE = "active"
-    RESOLVED = "resolved"
-    FALSE_ALARM = "false_alarm"
-
-class AlertType(enum.Enum):
-    SENSOR_DETECTION = "sensor_detection"
-    COMMUNITY_REPORT = "community_report"
-    MANUAL_TRIGGER = "manual_trigger"
-
-class SensorType(enum.Enum):
-    TEMPERATURE = "temperature"
-    SMOKE = "smoke"
-    FLAME = "flame"
-    COMBINED = "combined"
 
 class Sensor(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -30,6 +16,11 @@ class Sensor(db.Model):
     last_reading = db.Column(db.Float)
     last_update = db.Column(db.DateTime, default=datetime.utcnow)
     threshold_value = db.Column(db.Float, default=50.0)  # Default threshold
+    # Per-channel thresholds for multi-channel nodes; unset channels are not checked
+    temperature_threshold = db.Column(db.Float)
+    smoke_threshold = db.Column(db.Float)
+    fire_risk_threshold = db.Column(db.Float)
+    flame_alert = db.Column(db.Boolean, default=True)  # Alert whenever a flame is detected
     arduino_port = db.Column(db.String(50))  # Serial port for Arduino connection
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
@@ -37,6 +28,11 @@ class Sensor(db.Model):
     alerts = db.relationship('Alert', backref='sensor', lazy=True)
 
 class Alert(db.Model):
+    __table_args__ = (
+        db.Index('ix_alert_status_created_at', 'status', 'created_at'),
+        db.Index('ix_alert_sensor_id_status', 'sensor_id', 'status'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
     description = db.Column(db.Text)
@@ -63,14 +59,104 @@ class Alert(db.Model):
     # Media fields
     image_urls = db.Column(db.Text)  # Comma-separated URLs
 
+class AlertTrace(db.Model):
+    # Per-stage latency, in milliseconds, of the reading that raised an alert (see alert_trace)
+    __table_args__ = (
+        db.Index('ix_alert_trace_created_at', 'created_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    alert_id = db.Column(db.Integer, db.ForeignKey('alert.id'), nullable=False, index=True)
+    source = db.Column(db.String(20))  # serial, tcp, udp, batch, detection or direct
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    receive_ms = db.Column(db.Float)
+    parse_ms = db.Column(db.Float)
+    check_ms = db.Column(db.Float)
+    lookup_ms = db.Column(db.Float)
+    commit_ms = db.Column(db.Float)
+    dispatch_ms = db.Column(db.Float)
+    sms_ms = db.Column(db.Float)
+    email_ms = db.Column(db.Float)
+    total_ms = db.Column(db.Float)
+    
+    alert = db.relationship('Alert', backref='traces')
+
+class NotificationOutbox(db.Model):
+    # Pending notification work for an alert, written in the alert's own transaction
+    # and drained by notification_outbox workers (see notification_outbox)
+    __table_args__ = (
+        db.Index('ix_notification_outbox_claim', 'status', 'priority', 'next_attempt_at'),
+        # Finds the alerts already notified in an area during an alert storm
+        db.Index('ix_notification_outbox_cell_created_at', 'cell', 'created_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    alert_id = db.Column(db.Integer, db.ForeignKey('alert.id'), nullable=False, index=True)
+    status = db.Column(db.String(10), nullable=False, default='pending')  # pending, done, failed
+    priority = db.Column(db.Integer, nullable=False, default=2)  # 0 (critical) is sent first
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    leased_until = db.Column(db.DateTime)  # a worker holds the entry until then
+    lease_owner = db.Column(db.String(100))
+    cell = db.Column(db.String(64))  # area the alert is coalesced by; None if its location is unknown
+    coalesced = db.Column(db.Boolean, default=False)  # rolled into the area's next digest
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    completed_at = db.Column(db.DateTime)
+    
+    alert = db.relationship('Alert', backref='outbox_entries')
+
+class NotificationDelivery(db.Model):
+    # Outcome of one alert notification to one contact over one channel
+    id = db.Column(db.Integer, primary_key=True)
+    alert_id = db.Column(db.Integer, db.ForeignKey('alert.id'), nullable=False, index=True)
+    contact_id = db.Column(db.Integer, db.ForeignKey('emergency_contact.id', ondelete='SET NULL'))
+    channel = db.Column(db.String(10), nullable=False)  # sms, email
+    recipient = db.Column(db.String(100), nullable=False)
+    success = db.Column(db.Boolean, nullable=False)
+    error = db.Column(db.String(300))
+    send_ms = db.Column(db.Float)  # provider call; shared by all recipients of one email
+    wait_ms = db.Column(db.Float)  # held back by the provider rate limit
+    digest = db.Column(db.Boolean, default=False)  # sent as part of a rolled-up storm update
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    alert = db.relationship('Alert', backref='deliveries')
+
 class SensorReading(db.Model):
+    __table_args__ = (
+        # Serves latest-reading lookups, history windows and per-sensor retention
+        db.Index('ix_sensor_reading_sensor_id_timestamp', 'sensor_id', 'timestamp'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     sensor_id = db.Column(db.Integer, db.ForeignKey('sensor.id'), nullable=False)
-    value = db.Column(db.Float, nullable=False)
+    value = db.Column(db.Float, nullable=False)  # Primary channel for the sensor type
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # Channels from multi-channel frames; unset when a frame doesn't carry them
+    temperature = db.Column(db.Float)
+    humidity = db.Column(db.Float)
+    smoke_level = db.Column(db.Float)
+    flame_detected = db.Column(db.Boolean)
+    fire_risk = db.Column(db.Float)
+    
     sensor = db.relationship('Sensor', backref='readings')
 
+class SensorRollup(db.Model):
+    __table_args__ = (
+        db.UniqueConstraint('sensor_id', 'resolution', 'bucket_start', name='uq_sensor_rollup_bucket'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    sensor_id = db.Column(db.Integer, db.ForeignKey('sensor.id'), nullable=False)
+    resolution = db.Column(db.Integer, nullable=False)  # Bucket size in seconds: 60, 3600 or 86400
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    min_value = db.Column(db.Float, nullable=False)
+    max_value = db.Column(db.Float, nullable=False)
+    sum_value = db.Column(db.Float, nullable=False)
+    count = db.Column(db.Integer, nullable=False)
+    last_value = db.Column(db.Float, nullable=False)
+    last_timestamp = db.Column(db.DateTime, nullable=False)
+
 class EmergencyContact(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
@@ -79,6 +165,13 @@ class EmergencyContact(db.Model):
     role = db.Column(db.String(50), default='responder')  # responder, admin, observer
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Area the contact responds to; alerts outside it don't reach them (see contact_index).
+    # Contacts without one, and those always notified, hear about every alert
+    coverage_latitude = db.Column(db.Float)
+    coverage_longitude = db.Column(db.Float)
+    coverage_radius_km = db.Column(db.Float)
+    always_notify = db.Column(db.Boolean, default=False)
 
 class AdminResponse(db.Model):
     id = db.Column(db.Integer, primary_key=True)
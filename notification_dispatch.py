@@ -0,0 +1,81 @@
+import time
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor
+
+class TokenBucket:
+    """Allows rate sends per second on average, with bursts of up to burst sends; a rate of 0 or less is unlimited"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = Lock()
+        self.waited = 0.0
+
+    def acquire(self):
+        """Take a token, sleeping until one is available; returns the seconds waited"""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Take the token now, going into debt, so waiters are served in arrival order
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            self.waited += wait
+        if wait:
+            time.sleep(wait)
+        return wait
+
+class NotificationDispatcher:
+    """Bounded worker pool that sends notifications concurrently, each provider behind its own token bucket.
+
+    Every alert's notification thread submits all of its sends at once and
+    waits for them, so the last contact hears about a fire after the slowest
+    single send rather than after every send before theirs.
+    """
+
+    def __init__(self, workers, limits):
+        self.workers = workers
+        self.limits = limits  # provider -> TokenBucket
+        self._executor = None
+        self._lock = Lock()
+        self.sent = dict.fromkeys(limits, 0)
+
+    def submit(self, provider, send, *args):
+        """Run send(*args) on the pool after taking a provider token.
+
+        Returns a Future of (send's result, seconds the send took, seconds
+        spent waiting for the rate limit).
+        """
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="notify")
+        return self._executor.submit(self._run, provider, send, args)
+
+    def _run(self, provider, send, args):
+        waited = self.limits[provider].acquire() if provider in self.limits else 0.0
+        started = time.monotonic()
+        result = send(*args)
+        with self._lock:
+            self.sent[provider] = self.sent.get(provider, 0) + 1
+        return result, time.monotonic() - started, waited
+
+    def shutdown(self):
+        """Wait for queued sends, then stop the workers"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def stats(self):
+        with self._lock:
+            sent = dict(self.sent)
+        return {
+            'workers': self.workers,
+            'sent': sent,
+            'rate_limited_seconds': {provider: round(bucket.waited, 3)
+                                     for provider, bucket in self.limits.items()},
+        }
@@ -0,0 +1,373 @@
+import os
+import math
+import zlib
+import time
+import socket
+import logging
+from itertools import count
+from collections import OrderedDict
+from threading import Thread, Lock, RLock, Condition, Event
+from datetime import datetime, timedelta
+from sqlalchemy import update, or_, event, text
+from sqlalchemy.orm import Session
+from app import app, db
+from models import NotificationOutbox
+from notifier import send_alert_notifications, send_digest_notifications
+
+logger = logging.getLogger(__name__)
+
+# Worker threads sending alert notifications, however many alerts are raised at once
+OUTBOX_WORKERS = int(os.environ.get("OUTBOX_WORKERS", "4"))
+
+# Seconds a worker holds an entry; one whose worker died is picked up again after this.
+# Leases of sends still in progress are renewed every third of this
+OUTBOX_LEASE_SECONDS = int(os.environ.get("OUTBOX_LEASE_SECONDS", "120"))
+
+# Attempts before an entry is given up as failed; retries back off from
+# OUTBOX_RETRY_BASE seconds, doubling up to OUTBOX_RETRY_MAX
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get("OUTBOX_MAX_ATTEMPTS", "6"))
+OUTBOX_RETRY_BASE = float(os.environ.get("OUTBOX_RETRY_BASE", "15"))
+OUTBOX_RETRY_MAX = float(os.environ.get("OUTBOX_RETRY_MAX", "900"))
+
+# Seconds idle workers wait before looking for due retries and entries added by other processes
+OUTBOX_POLL_INTERVAL = float(os.environ.get("OUTBOX_POLL_INTERVAL", "2"))
+
+# Days finished entries are kept
+OUTBOX_RETENTION_DAYS = int(os.environ.get("OUTBOX_RETENTION_DAYS", "7"))
+
+# Alert storms: an alert within ALERT_STORM_WINDOW seconds of one already notified in
+# the same ALERT_STORM_CELL_METERS grid cell or one of the eight around it (or, without
+# coordinates, at the same address) is not sent on its own but rolled into a digest that
+# goes out ALERT_DIGEST_DELAY seconds later with every other alert coalesced there by then.
+# A more severe alert than any notified in the area is still sent at once; 0 disables.
+ALERT_STORM_WINDOW = float(os.environ.get("ALERT_STORM_WINDOW", "600"))
+ALERT_STORM_CELL_METERS = float(os.environ.get("ALERT_STORM_CELL_METERS", "250"))
+ALERT_DIGEST_DELAY = float(os.environ.get("ALERT_DIGEST_DELAY", "60"))
+
+# Locks serializing the storm checks of nearby alerts, shared by cells hashing alike.
+# Across processes they are PostgreSQL advisory locks in this namespace, or SQLite's
+# write lock; on other databases only alerts raised in the same process are serialized
+STORM_LOCK_STRIPES = 64
+STORM_LOCK_NAMESPACE = 0x53544f52
+
+# Seconds an alert's trace waits for a worker in this process to send the alert, and
+# how many may wait at once; traces of alerts sent elsewhere are dropped after this
+OUTBOX_TRACE_TTL = float(os.environ.get("OUTBOX_TRACE_TTL", "3600"))
+OUTBOX_MAX_TRACES = int(os.environ.get("OUTBOX_MAX_TRACES", "10000"))
+
+# Alert severity -> outbox priority; lower is sent first
+SEVERITY_PRIORITY = {'critical': 0, 'high': 1, 'medium': 2, 'low': 3}
+
+class Outbox:
+    """Durable queue of alert notifications drained by a fixed pool of worker threads.
+    
+    Entries are NotificationOutbox rows committed with their Alert, so a crash
+    or restart loses nothing. Workers claim the most urgent due entry with a
+    lease; an entry whose notifications partly failed is retried with
+    backoff, resending only to the recipients not yet reached. During an
+    alert storm, entries after the first in an area are coalesced and sent
+    together as one digest.
+    """
+
+    def __init__(self, workers=OUTBOX_WORKERS):
+        self.workers = workers
+        self.running = False
+        self._threads = []
+        self._traces = OrderedDict()  # alert_id -> (TraceContext, monotonic time), oldest first
+        self._leases = set()  # lease owners of the sends in progress here
+        self._lock = Lock()
+        self._wake = Condition(self._lock)
+        self._stopping = Event()
+        self._owner = f"{socket.gethostname()[:60]}:{os.getpid()}"
+        self._claims = count(1)
+        self._storm_locks = [RLock() for _ in range(STORM_LOCK_STRIPES)]
+        self._next_prune = datetime.utcnow()
+        self.sent = 0
+        self.digests = 0
+        self.coalesced = 0
+        self.retried = 0
+        self.failed = 0
+
+    def enqueue(self, alert):
+        """Add an entry for alert to the current session, to be committed along with it.
+
+        The storm check locks the alert's area until the session's transaction
+        ends, so of two alerts committed there at once only one is sent as the
+        first of a storm. A coalesced entry takes the cell of the storm it
+        joins, so the whole storm goes out in one digest.
+        """
+        now = datetime.utcnow()
+        priority = SEVERITY_PRIORITY.get(alert.severity, 2)
+        cell = alert_cell(alert)
+        coalesced = False
+        if cell and ALERT_STORM_WINDOW > 0:
+            cells = nearby_cells(alert)
+            self._lock_area(cells)
+            # Most severe alert notified on its own nearby within the window
+            head = db.session.query(NotificationOutbox.cell, NotificationOutbox.priority).filter(
+                NotificationOutbox.cell.in_(cells),
+                NotificationOutbox.coalesced.isnot(True),
+                NotificationOutbox.created_at >= now - timedelta(seconds=ALERT_STORM_WINDOW)
+            ).order_by(NotificationOutbox.priority, NotificationOutbox.created_at.desc()).first()
+            if head is not None and priority >= head.priority:
+                coalesced = True
+                cell = head.cell
+        
+        db.session.add(NotificationOutbox(
+            alert=alert, priority=priority, cell=cell, coalesced=coalesced, created_at=now,
+            next_attempt_at=now + timedelta(seconds=ALERT_DIGEST_DELAY) if coalesced else now))
+        if coalesced:
+            self.coalesced += 1
+
+    def _lock_area(self, cells):
+        """Hold the storm locks of cells until the current transaction ends (see _release_storm_locks).
+
+        Other processes are held off by PostgreSQL advisory locks on the same
+        stripes, released with the transaction, or on SQLite by flushing the
+        new alert first, which takes the database's single write lock.
+        """
+        # Stable across processes, unlike hash() of a string
+        stripes = sorted({zlib.crc32(cell.encode()) % STORM_LOCK_STRIPES for cell in cells})
+        held = db.session.info.setdefault('storm_locks', [])
+        # Always taken in the same order, so overlapping areas can't deadlock
+        for stripe in stripes:
+            lock = self._storm_locks[stripe]
+            lock.acquire()
+            held.append(lock)
+
+        dialect = db.session.get_bind().dialect.name
+        if dialect == 'postgresql':
+            for stripe in stripes:
+                db.session.execute(text("SELECT pg_advisory_xact_lock(:namespace, :stripe)"),
+                                   {'namespace': STORM_LOCK_NAMESPACE, 'stripe': stripe})
+        elif dialect == 'sqlite':
+            db.session.flush()
+
+    def wake(self, alert_id, trace=None):
+        """Once the alert is committed, wake a worker and hand it the alert's trace, if any"""
+        with self._lock:
+            if trace is not None and self.running:
+                now = time.monotonic()
+                self._traces[alert_id] = (trace, now)
+                # Another process may send the alert, so not every trace is collected here
+                while self._traces:
+                    _, stored = next(iter(self._traces.values()))
+                    if len(self._traces) <= OUTBOX_MAX_TRACES and now - stored < OUTBOX_TRACE_TTL:
+                        break
+                    self._traces.popitem(last=False)
+            self._wake.notify()
+
+    def start(self):
+        """Start the worker threads; entries left over from before a restart are sent first"""
+        if self.running:
+            return
+        self.running = True
+        self._stopping.clear()
+        self._threads = [Thread(target=self._work, name=f"notification-outbox-{i}", daemon=True)
+                         for i in range(self.workers)]
+        self._threads.append(Thread(target=self._renew, name="notification-outbox-lease", daemon=True))
+        for thread in self._threads:
+            thread.start()
+        logger.info(f"Notification outbox started with {self.workers} workers")
+
+    def stop(self):
+        """Stop the workers after the sends in progress; unsent entries stay in the table"""
+        with self._lock:
+            self.running = False
+            self._wake.notify_all()
+        self._stopping.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def _work(self):
+        while self.running:
+            try:
+                with app.app_context():
+                    entry = self._claim()
+                    if entry:
+                        self._deliver(*entry)
+                        continue
+                    self._prune()
+            except Exception as e:
+                logger.error(f"Notification outbox error: {e}")
+            with self._lock:
+                if self.running:
+                    self._wake.wait(OUTBOX_POLL_INTERVAL)
+
+    def _claim(self):
+        """Lease the most urgent due entry, and with a digest entry every other one pending in its area.
+        
+        Returns (lease owner, [(entry id, alert id)], coalesced, attempts) or None.
+        """
+        now = datetime.utcnow()
+        available = or_(NotificationOutbox.leased_until.is_(None), NotificationOutbox.leased_until < now)
+        candidates = db.session.query(NotificationOutbox.id).filter(
+            NotificationOutbox.status == 'pending',
+            NotificationOutbox.next_attempt_at <= now,
+            available
+        ).order_by(
+            NotificationOutbox.priority, NotificationOutbox.next_attempt_at, NotificationOutbox.id
+        ).limit(self.workers).all()
+        
+        # Other workers, here or in other processes, race for the same rows;
+        # the conditional update lets exactly one of them win each
+        for (entry_id,) in candidates:
+            # Unique per claim, so a takeover of an expired lease in this process isn't mistaken for the holder
+            owner = f"{self._owner}:{next(self._claims)}"
+            lease = {'leased_until': now + timedelta(seconds=OUTBOX_LEASE_SECONDS),
+                     'lease_owner': owner, 'attempts': NotificationOutbox.attempts + 1}
+            claimed = db.session.execute(
+                update(NotificationOutbox)
+                .where(NotificationOutbox.id == entry_id, NotificationOutbox.status == 'pending', available)
+                .values(**lease)
+            )
+            db.session.commit()
+            if claimed.rowcount != 1:
+                continue
+            
+            entry = db.session.get(NotificationOutbox, entry_id)
+            if entry.coalesced:
+                # The rest of the area's storm goes out in the same digest, due yet or not
+                db.session.execute(
+                    update(NotificationOutbox)
+                    .where(NotificationOutbox.cell == entry.cell, NotificationOutbox.coalesced.is_(True),
+                           NotificationOutbox.status == 'pending', available)
+                    .values(**lease)
+                )
+                db.session.commit()
+                entries = db.session.query(NotificationOutbox.id, NotificationOutbox.alert_id).filter_by(
+                    cell=entry.cell, lease_owner=owner).order_by(NotificationOutbox.id).all()
+            else:
+                entries = [(entry.id, entry.alert_id)]
+            return owner, entries, entry.coalesced, entry.attempts
+        return None
+
+    def _deliver(self, owner, entries, coalesced, attempts):
+        alert_ids = [alert_id for _, alert_id in entries]
+        with self._lock:
+            traces = {alert_id: self._traces.pop(alert_id)[0] for alert_id in alert_ids if alert_id in self._traces}
+            self._leases.add(owner)
+        try:
+            if coalesced:
+                delivered = send_digest_notifications(alert_ids, traces)
+            else:
+                delivered = send_alert_notifications(alert_ids[0], traces.get(alert_ids[0]))
+        finally:
+            with self._lock:
+                self._leases.discard(owner)
+        
+        covered = f"digest of alerts {', '.join(map(str, alert_ids))}" if coalesced else f"alert {alert_ids[0]}"
+        now = datetime.utcnow()
+        values = {'leased_until': None, 'lease_owner': None}
+        if delivered:
+            values.update(status='done', completed_at=now)
+            self.sent += 1
+            self.digests += coalesced
+        elif attempts >= OUTBOX_MAX_ATTEMPTS:
+            values.update(status='failed', completed_at=now)
+            self.failed += 1
+            logger.error(f"Giving up on notifications for {covered} after {attempts} attempts")
+        else:
+            delay = min(OUTBOX_RETRY_BASE * 2 ** (attempts - 1), OUTBOX_RETRY_MAX)
+            values.update(next_attempt_at=now + timedelta(seconds=delay))
+            self.retried += 1
+            logger.warning(f"Some notifications for {covered} failed; retrying in {delay:g}s")
+        
+        db.session.execute(
+            update(NotificationOutbox)
+            .where(NotificationOutbox.id.in_([entry_id for entry_id, _ in entries]),
+                   NotificationOutbox.lease_owner == owner)
+            .values(**values)
+        )
+        db.session.commit()
+
+    def _renew(self):
+        """Extend the leases of sends in progress, so a large fan-out that outlasts
+        OUTBOX_LEASE_SECONDS isn't taken over and sent again by another worker"""
+        while not self._stopping.wait(OUTBOX_LEASE_SECONDS / 3):
+            with self._lock:
+                owners = list(self._leases)
+            if not owners:
+                continue
+            try:
+                with app.app_context():
+                    db.session.execute(
+                        update(NotificationOutbox)
+                        .where(NotificationOutbox.lease_owner.in_(owners), NotificationOutbox.status == 'pending')
+                        .values(leased_until=datetime.utcnow() + timedelta(seconds=OUTBOX_LEASE_SECONDS))
+                    )
+                    db.session.commit()
+            except Exception as e:
+                logger.error(f"Error renewing notification outbox leases: {e}")
+
+    def _prune(self):
+        """Delete finished entries past OUTBOX_RETENTION_DAYS, at most hourly"""
+        with self._lock:
+            now = datetime.utcnow()
+            if now < self._next_prune:
+                return
+            self._next_prune = now + timedelta(hours=1)
+        cutoff = now - timedelta(days=OUTBOX_RETENTION_DAYS)
+        NotificationOutbox.query.filter(
+            NotificationOutbox.status != 'pending',
+            NotificationOutbox.completed_at < cutoff
+        ).delete(synchronize_session=False)
+        db.session.commit()
+
+    def stats(self):
+        """Entries by status and this process's send counters"""
+        counts = dict(db.session.query(NotificationOutbox.status, db.func.count())
+                      .group_by(NotificationOutbox.status).all())
+        return {
+            'workers': self.workers,
+            'pending': counts.get('pending', 0),
+            'done': counts.get('done', 0),
+            'failed': counts.get('failed', 0),
+            'sent': self.sent,
+            'coalesced': self.coalesced,
+            'digests': self.digests,
+            'retried': self.retried,
+            'gave_up': self.failed,
+        }
+
+def alert_cell(alert):
+    """Grid cell key of an alert's location for storm coalescing; None if it has no location.
+    
+    Alerts without coordinates (stored as 0, 0) are grouped by address instead.
+    """
+    if alert.latitude or alert.longitude:
+        row = math.floor(alert.latitude / _lat_step())
+        return f"{row}:{math.floor(alert.longitude / _lng_step(row))}"
+    if alert.address:
+        return f"address:{alert.address[:55]}"
+    return None
+
+def nearby_cells(alert):
+    """Keys of the alert's cell and the eight around it; just the alert's own cell for an address"""
+    if not (alert.latitude or alert.longitude):
+        return [alert_cell(alert)]
+    row = math.floor(alert.latitude / _lat_step())
+    cells = []
+    for neighbour in (row - 1, row, row + 1):
+        column = math.floor(alert.longitude / _lng_step(neighbour))
+        cells.extend(f"{neighbour}:{column + offset}" for offset in (-1, 0, 1))
+    return cells
+
+def _lat_step():
+    return ALERT_STORM_CELL_METERS / 111320
+
+def _lng_step(row):
+    # Cells keep their width in meters away from the equator
+    lat_step = _lat_step()
+    return lat_step / max(math.cos(math.radians((row + 0.5) * lat_step)), 0.01)
+
+# Global notification outbox
+notification_outbox = Outbox()
+
+# Storm locks taken by enqueue are held until the alert's transaction commits or rolls back
+@event.listens_for(Session, 'after_transaction_end')
+def _release_storm_locks(session, transaction):
+    if transaction.parent is None:
+        for lock in session.info.pop('storm_locks', ()):
+            lock.release()
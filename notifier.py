@@ -1,11 +1,18 @@
 import os
 import smtplib
 import logging
+from threading import Lock
+from concurrent.futures import wait, FIRST_COMPLETED
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
+from requests.adapters import HTTPAdapter
 from twilio.rest import Client
+from twilio.http.http_client import TwilioHttpClient
 from app import app, db
-from models import Alert, EmergencyContact
+from models import Alert, AlertTrace, EmergencyContact, NotificationDelivery
+from smtp_pool import SMTPPool
+from notification_dispatch import NotificationDispatcher, TokenBucket
+from contact_index import contact_index
 
 logger = logging.getLogger(__name__)
 
@@ -13,6 +20,7 @@ logger = logging.getLogger(__name__)
 TWILIO_ACCOUNT_SID = os.environ.get("TWILIO_ACCOUNT_SID")
 TWILIO_AUTH_TOKEN = os.environ.get("TWILIO_AUTH_TOKEN")
 TWILIO_PHONE_NUMBER = os.environ.get("TWILIO_PHONE_NUMBER")
+TWILIO_TIMEOUT = float(os.environ.get("TWILIO_TIMEOUT", "15"))
 
 # Email configuration
 SMTP_SERVER = os.environ.get("SMTP_SERVER", "smtp.gmail.com")
@@ -20,110 +28,270 @@ SMTP_PORT = int(os.environ.get("SMTP_PORT", "587"))
 EMAIL_ADDRESS = os.environ.get("EMAIL_ADDRESS")
 EMAIL_PASSWORD = os.environ.get("EMAIL_PASSWORD")
 
+# Authenticated SMTP sessions kept open for reuse, seconds one may sit idle before
+# it is closed instead (servers drop idle sessions), and the socket timeout
+SMTP_POOL_SIZE = int(os.environ.get("SMTP_POOL_SIZE", "4"))
+SMTP_IDLE_TIMEOUT = float(os.environ.get("SMTP_IDLE_TIMEOUT", "60"))
+SMTP_TIMEOUT = float(os.environ.get("SMTP_TIMEOUT", "30"))
+
+# Recipients per alert email; larger contact lists are sent as several messages
+SMTP_MAX_RECIPIENTS = int(os.environ.get("SMTP_MAX_RECIPIENTS", "50"))
+
+# Alerts listed one by one in a digest SMS; the rest are counted
+DIGEST_SMS_ALERTS = int(os.environ.get("DIGEST_SMS_ALERTS", "5"))
+
+# Sends in flight at once across all alerts
+NOTIFY_WORKERS = int(os.environ.get("NOTIFY_WORKERS", "16"))
+
+# Provider rate limits: sustained sends per second and burst size. An SMS is one
+# send; an email is one send however many recipients it carries. A rate of 0 disables the limit
+TWILIO_RATE = float(os.environ.get("TWILIO_RATE", "10"))
+TWILIO_BURST = int(os.environ.get("TWILIO_BURST", "20"))
+SMTP_RATE = float(os.environ.get("SMTP_RATE", "5"))
+SMTP_BURST = int(os.environ.get("SMTP_BURST", "10"))
+
+# Global SMTP session pool shared by all notification threads
+smtp_pool = SMTPPool(SMTP_SERVER, SMTP_PORT, EMAIL_ADDRESS, EMAIL_PASSWORD, size=SMTP_POOL_SIZE,
+                     idle_timeout=SMTP_IDLE_TIMEOUT, timeout=SMTP_TIMEOUT)
+
+# Global worker pool every alert's notifications are sent through
+notification_dispatcher = NotificationDispatcher(NOTIFY_WORKERS, {
+    'sms': TokenBucket(TWILIO_RATE, TWILIO_BURST),
+    'email': TokenBucket(SMTP_RATE, SMTP_BURST),
+})
+
+_twilio_client = None
+_twilio_lock = Lock()
+
+def twilio_client():
+    """Shared Twilio client; its HTTP session keeps connections to the API alive"""
+    global _twilio_client
+    with _twilio_lock:
+        if _twilio_client is None:
+            http_client = TwilioHttpClient(pool_connections=True, timeout=TWILIO_TIMEOUT)
+            # Room for a kept-alive connection per dispatcher worker
+            http_client.session.mount("https://", HTTPAdapter(pool_maxsize=NOTIFY_WORKERS))
+            _twilio_client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, http_client=http_client)
+        return _twilio_client
+
 def send_sms_alert(phone_number, message):
     """Send SMS alert using Twilio"""
+    return not deliver_sms(phone_number, message)
+
+def deliver_sms(phone_number, message):
+    """Send one SMS; returns {phone_number: error} if it was not sent, else {}"""
+    if not all([TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, TWILIO_PHONE_NUMBER]):
+        logger.warning("Twilio credentials not configured")
+        return {phone_number: "Twilio credentials not configured"}
+    
     try:
-        if not all([TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, TWILIO_PHONE_NUMBER]):
-            logger.warning("Twilio credentials not configured")
-            return False
-            
-        client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
-        
-        message = client.messages.create(
+        sent = twilio_client().messages.create(
             body=message,
             from_=TWILIO_PHONE_NUMBER,
             to=phone_number
         )
-        
-        logger.info(f"SMS sent successfully to {phone_number}. SID: {message.sid}")
-        return True
-        
     except Exception as e:
         logger.error(f"Error sending SMS to {phone_number}: {e}")
-        return False
+        return {phone_number: str(e)}
+    
+    logger.info(f"SMS sent successfully to {phone_number}. SID: {sent.sid}")
+    return {}
 
 def send_email_alert(email_address, subject, message):
     """Send email alert using SMTP"""
+    return send_email_alerts([email_address], subject, message, to_header=email_address) == 1
+
+def send_email_alerts(email_addresses, subject, message, to_header="undisclosed-recipients:;"):
+    """Send one email to many recipients over pooled SMTP sessions; returns how many were accepted"""
+    text = build_email(subject, message, to_header)
+    accepted = 0
+    for start in range(0, len(email_addresses), SMTP_MAX_RECIPIENTS):
+        recipients = email_addresses[start:start + SMTP_MAX_RECIPIENTS]
+        accepted += len(recipients) - len(deliver_email(recipients, text))
+    return accepted
+
+def build_email(subject, message, to_header="undisclosed-recipients:;"):
+    """Alert email as text; recipients go on the envelope only, so they don't see each other"""
+    msg = MIMEMultipart()
+    msg['From'] = EMAIL_ADDRESS
+    msg['To'] = to_header
+    msg['Subject'] = subject
+    msg.attach(MIMEText(message, 'plain'))
+    return msg.as_string()
+
+def deliver_email(recipients, text):
+    """Send one email to up to SMTP_MAX_RECIPIENTS recipients; returns {address: error} for those it did not reach"""
+    if not all([EMAIL_ADDRESS, EMAIL_PASSWORD]):
+        logger.warning("Email credentials not configured")
+        return dict.fromkeys(recipients, "Email credentials not configured")
+    
     try:
-        if not all([EMAIL_ADDRESS, EMAIL_PASSWORD]):
-            logger.warning("Email credentials not configured")
-            return False
-            
-        # Create message
-        msg = MIMEMultipart()
-        msg['From'] = EMAIL_ADDRESS
-        msg['To'] = email_address
-        msg['Subject'] = subject
-        
-        # Add body to email
-        msg.attach(MIMEText(message, 'plain'))
-        
-        # Setup SMTP server
-        server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT)
-        server.starttls()
-        server.login(EMAIL_ADDRESS, EMAIL_PASSWORD)
-        
-        # Send email
-        text = msg.as_string()
-        server.sendmail(EMAIL_ADDRESS, email_address, text)
-        server.quit()
-        
-        logger.info(f"Email sent successfully to {email_address}")
-        return True
-        
+        refused = smtp_pool.sendmail(EMAIL_ADDRESS, recipients, text)
+    except smtplib.SMTPRecipientsRefused as e:
+        refused = e.recipients
     except Exception as e:
-        logger.error(f"Error sending email to {email_address}: {e}")
-        return False
+        logger.error(f"Error sending email to {', '.join(recipients)}: {e}")
+        return dict.fromkeys(recipients, str(e))
+    
+    errors = {address: f"{code} {reply.decode(errors='replace')}" for address, (code, reply) in refused.items()}
+    for address, error in errors.items():
+        logger.error(f"Email to {address} refused: {error}")
+    if len(errors) < len(recipients):
+        logger.info(f"Email sent successfully to {len(recipients) - len(errors)} of {len(recipients)} recipients")
+    return errors
+
+def send_alert_notifications(alert_id, trace=None):
+    """Send all notifications for a given alert; trace, if given, is completed and saved.
+    
+    Recipients an earlier attempt already reached are skipped, so a retry only
+    resends what failed. Returns False if a send failed and should be retried.
+    """
+    return _send_notifications([alert_id], {alert_id: trace} if trace else {}, digest=False)
+
+def send_digest_notifications(alert_ids, traces=None):
+    """Send one rolled-up update covering alerts coalesced during an alert storm.
+    
+    traces maps alert ids to their TraceContext. Recipients every alert in the
+    digest already reached are skipped; returns False if a send failed.
+    """
+    return _send_notifications(alert_ids, traces or {}, digest=True)
 
-def send_alert_notifications(alert_id):
-    """Send all notifications for a given alert"""
+def _send_notifications(alert_ids, traces, digest):
+    for trace in traces.values():
+        trace.mark('notifying')
     try:
         with app.app_context():
-            alert = Alert.query.get(alert_id)
-            if not alert:
-                logger.error(f"Alert {alert_id} not found")
-                return
+            alerts = Alert.query.filter(Alert.id.in_(alert_ids)).order_by(Alert.created_at).all()
+            if not alerts:
+                logger.error(f"Alert {', '.join(map(str, alert_ids))} not found")
+                return True
             
-            # Get all active emergency contacts
-            contacts = EmergencyContact.query.filter_by(is_active=True).all()
+            # Active emergency contacts covering where the alerts are
+            contacts = select_contacts(alerts)
             
             if not contacts:
                 logger.warning("No emergency contacts configured")
-                return
+                return True
             
-            # Create notification messages
-            sms_message = create_sms_message(alert)
-            email_subject = f"🚨 FIRE ALERT - {alert.severity.upper()}"
-            email_message = create_email_message(alert)
+            # Recipients already told about every one of these alerts
+            reached = {}
+            for d in NotificationDelivery.query.filter(NotificationDelivery.alert_id.in_(alert_ids),
+                                                       NotificationDelivery.success.is_(True)):
+                reached.setdefault((d.channel, d.recipient), set()).add(d.alert_id)
+            delivered = {pair for pair, ids in reached.items() if len(ids) == len(alerts)}
             
-            sms_success = False
-            email_success = False
+            # Channels without credentials are skipped rather than failed, so they aren't retried
+            send_sms = all([TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, TWILIO_PHONE_NUMBER])
+            send_email = all([EMAIL_ADDRESS, EMAIL_PASSWORD])
+            if not send_sms:
+                logger.warning("Twilio credentials not configured")
+            if not send_email:
+                logger.warning("Email credentials not configured")
             
-            # Send notifications to all contacts
+            # Create notification messages
+            if digest:
+                sms_message = create_digest_sms_message(alerts)
+                email_subject = f"🚨 FIRE ALERT UPDATE - {len(alerts)} more alerts"
+                email_message = create_digest_email_message(alerts)
+            else:
+                sms_message = create_sms_message(alerts[0])
+                email_subject = f"🚨 FIRE ALERT - {alerts[0].severity.upper()}"
+                email_message = create_email_message(alerts[0])
+            
+            # Send to every contact at once: an SMS each, and an email per SMTP_MAX_RECIPIENTS.
+            # Ids are taken up front since the per-send commits below expire the rows
+            covered_ids = [alert.id for alert in alerts]
+            sends = []
             for contact in contacts:
-                if contact.phone:
-                    try:
-                        if send_sms_alert(contact.phone, sms_message):
-                            sms_success = True
-                    except Exception as e:
-                        logger.error(f"Error sending SMS to {contact.name}: {e}")
-                
-                if contact.email:
+                if send_sms and contact.phone and ('sms', contact.phone) not in delivered:
+                    future = notification_dispatcher.submit('sms', deliver_sms, contact.phone, sms_message)
+                    sends.append(('sms', [(contact.id, contact.phone)], future))
+            
+            emailed = [(contact.id, contact.email) for contact in contacts
+                       if send_email and contact.email and ('email', contact.email) not in delivered]
+            email_text = build_email(email_subject, email_message)
+            for start in range(0, len(emailed), SMTP_MAX_RECIPIENTS):
+                recipients = emailed[start:start + SMTP_MAX_RECIPIENTS]
+                future = notification_dispatcher.submit('email', deliver_email,
+                                                        [address for _, address in recipients], email_text)
+                sends.append(('email', recipients, future))
+            
+            # Record each send's outcome as soon as it completes, against every alert the
+            # message covered, so a worker taking over an expired lease skips who was reached
+            failed = 0
+            pending = {future: (channel, recipients) for channel, recipients, future in sends}
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    channel, recipients = pending.pop(future)
                     try:
-                        if send_email_alert(contact.email, email_subject, email_message):
-                            email_success = True
+                        errors, seconds, waited = future.result()
                     except Exception as e:
-                        logger.error(f"Error sending email to {contact.name}: {e}")
+                        logger.error(f"Error sending {channel} notifications for alert {covered_ids[0]}: {e}")
+                        errors, seconds, waited = {address: str(e) for _, address in recipients}, 0.0, 0.0
+                    for trace in traces.values():
+                        trace.add(f'{channel}_ms', seconds)
+                    for contact_id, address in recipients:
+                        error = errors.get(address)
+                        db.session.add_all(NotificationDelivery(
+                            alert_id=alert_id, contact_id=contact_id, channel=channel, recipient=address,
+                            success=error is None, error=error and error[:300],
+                            send_ms=seconds * 1000, wait_ms=waited * 1000, digest=digest)
+                            for alert_id in covered_ids)
+                        if error is None:
+                            delivered.add((channel, address))
+                        else:
+                            failed += 1
+                db.session.commit()
+            
+            sms_success = any(channel == 'sms' for channel, _ in delivered)
+            email_success = any(channel == 'email' for channel, _ in delivered)
             
             # Update alert notification status
-            alert.sms_sent = sms_success
-            alert.email_sent = email_success
+            for alert in alerts:
+                alert.sms_sent = sms_success
+                alert.email_sent = email_success
             db.session.commit()
             
-            logger.info(f"Notifications sent for alert {alert_id} - SMS: {sms_success}, Email: {email_success}")
+            covered = f"digest of {len(alerts)} alerts" if digest else f"alert {alerts[0].id}"
+            logger.info(f"Notifications sent for {covered} - SMS: {sms_success}, Email: {email_success}"
+                        + (f", {failed} failed" if failed else ""))
+            return not failed
             
     except Exception as e:
         logger.error(f"Error sending alert notifications: {e}")
+        return False
+    finally:
+        for alert_id, trace in traces.items():
+            trace.mark('finished')
+            save_trace(alert_id, trace)
+
+def select_contacts(alerts):
+    """Active contacts whose coverage includes an alert, plus those notified of every alert.
+    
+    Alerts without a location, or that no contact covers, go to every active contact.
+    """
+    if all(alert.latitude or alert.longitude for alert in alerts):
+        ids = contact_index.select([(alert.latitude, alert.longitude) for alert in alerts])
+        if ids:
+            contacts = EmergencyContact.query.filter(EmergencyContact.id.in_(ids),
+                                                     EmergencyContact.is_active.is_(True)).all()
+            if contacts:
+                return contacts
+            # The index predates the deactivation of every contact it found
+            logger.warning(f"Every contact covering alert {alerts[0].id} is inactive; notifying all active contacts")
+        else:
+            logger.warning(f"No emergency contact covers alert {alerts[0].id}; notifying all active contacts")
+    return EmergencyContact.query.filter_by(is_active=True).all()
+
+def save_trace(alert_id, trace):
+    """Persist an alert's stage timings as an AlertTrace row"""
+    try:
+        with app.app_context():
+            db.session.add(AlertTrace(alert_id=alert_id, source=trace.source, **trace.durations()))
+            db.session.commit()
+    except Exception as e:
+        logger.error(f"Error saving trace for alert {alert_id}: {e}")
 
 def create_sms_message(alert):
     """Create SMS message for alert"""
@@ -181,6 +349,40 @@ IMMEDIATE ACTION REQUIRED:
 3. Coordinate with local fire department
 4. Monitor the situation until resolved
 
+This is an automated alert from the Fire Response and Monitoring System.
+"""
+    
+    return message
+
+def create_digest_sms_message(alerts):
+    """Create the SMS rolling up alerts coalesced in one area"""
+    area = alerts[0].address or f"{alerts[0].latitude:.4f}, {alerts[0].longitude:.4f}"
+    message = f"🚨 FIRE ALERT UPDATE - {len(alerts)} more alerts near {area}\n"
+    for alert in alerts[:DIGEST_SMS_ALERTS]:
+        message += f"{alert.created_at.strftime('%H:%M:%S')} {alert.title} ({alert.severity})\n"
+    if len(alerts) > DIGEST_SMS_ALERTS:
+        message += f"+{len(alerts) - DIGEST_SMS_ALERTS} more\n"
+    message += "Respond immediately!"
+    return message
+
+def create_digest_email_message(alerts):
+    """Create the email rolling up alerts coalesced in one area"""
+    area = alerts[0].address or f"Coordinates: {alerts[0].latitude:.6f}, {alerts[0].longitude:.6f}"
+    message = f"""
+FIRE ALERT UPDATE
+
+{len(alerts)} more alerts were raised near {area} since the last notification:
+"""
+    for alert in alerts:
+        message += f"\n- {alert.created_at.strftime('%Y-%m-%d %H:%M:%S UTC')} {alert.title} ({alert.severity.upper()})"
+        if alert.sensor_reading:
+            message += f", reading {alert.sensor_reading:.2f}"
+    
+    message += """
+
+The incident is still developing. Verify the affected area and coordinate
+with responders already dispatched.
+
 This is an automated alert from the Fire Response and Monitoring System.
 """
     
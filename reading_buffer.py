@@ -0,0 +1,158 @@
+import os
+import logging
+from array import array
+from threading import Lock
+from datetime import datetime, timedelta
+from app import app
+from models import SensorReading
+
+logger = logging.getLogger(__name__)
+
+# Number of recent (timestamp, value) pairs kept in memory per sensor (16 bytes each)
+READING_BUFFER_SIZE = int(os.environ.get("READING_BUFFER_SIZE", "120"))
+
+EPOCH = datetime(1970, 1, 1)
+
+def to_epoch(timestamp):
+    """Convert a naive UTC datetime to seconds since the epoch"""
+    return (timestamp - EPOCH).total_seconds()
+
+def from_epoch(seconds):
+    """Convert seconds since the epoch back to a naive UTC datetime"""
+    return EPOCH + timedelta(seconds=seconds)
+
+class ReadingRingBuffer:
+    """Fixed-size ring of (timestamp, value) pairs stored interleaved in one array('d')"""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.data = array('d', [0.0]) * (capacity * 2)
+        self.next = 0
+        self.count = 0
+
+    def append(self, timestamp, value):
+        """Store a pair in timestamp order, overwriting the oldest one once the ring is full.
+
+        A pair older than the newest is slotted in among the older ones; it is
+        dropped if it is older than everything in a full ring.
+        """
+        capacity, data = self.capacity, self.data
+        start = self.next - self.count
+        position = self.count
+        while position and data[((start + position - 1) % capacity) * 2] > timestamp:
+            position -= 1
+
+        if position == self.count:
+            index = self.next * 2
+            data[index] = timestamp
+            data[index + 1] = value
+            self.next = (self.next + 1) % capacity
+            if self.count < capacity:
+                self.count += 1
+            return
+
+        if self.count == capacity:
+            if not position:
+                return
+            # Slide the pairs older than this one down over the oldest
+            for offset in range(position - 1):
+                self._move(start + offset + 1, start + offset)
+            position -= 1
+        else:
+            # Slide the newer pairs up into the free slot
+            for offset in range(self.count, position, -1):
+                self._move(start + offset - 1, start + offset)
+            self.next = (self.next + 1) % capacity
+            self.count += 1
+        index = ((start + position) % capacity) * 2
+        data[index] = timestamp
+        data[index + 1] = value
+
+    def _move(self, source, target):
+        source = (source % self.capacity) * 2
+        target = (target % self.capacity) * 2
+        self.data[target:target + 2] = self.data[source:source + 2]
+
+    def latest(self):
+        """Return the newest (timestamp, value) pair, or None when empty"""
+        if not self.count:
+            return None
+        index = ((self.next - 1) % self.capacity) * 2
+        return self.data[index], self.data[index + 1]
+
+    def items(self, limit=None):
+        """Return up to limit pairs, oldest first"""
+        count = self.count if limit is None else min(limit, self.count)
+        start = (self.next - count) % self.capacity
+        data = self.data
+        pairs = []
+        for offset in range(count):
+            index = ((start + offset) % self.capacity) * 2
+            pairs.append((data[index], data[index + 1]))
+        return pairs
+
+class ReadingBufferStore:
+    """In-memory recent readings for every sensor, warmed from the database after a restart"""
+
+    def __init__(self, capacity=READING_BUFFER_SIZE):
+        self.capacity = capacity
+        self.buffers = {}
+        self.warm = set()
+        self._lock = Lock()
+
+    def record(self, sensor_id, timestamp, value):
+        """Add a reading from the ingest path"""
+        with self._lock:
+            buffer = self.buffers.get(sensor_id)
+            if buffer is None:
+                buffer = self.buffers[sensor_id] = ReadingRingBuffer(self.capacity)
+            buffer.append(to_epoch(timestamp), value)
+
+    def latest(self, sensor_id):
+        """Return the newest (datetime, value) for a sensor, or None"""
+        self._ensure_warm(sensor_id)
+        with self._lock:
+            buffer = self.buffers.get(sensor_id)
+            pair = buffer.latest() if buffer else None
+        if pair is None:
+            return None
+        return from_epoch(pair[0]), pair[1]
+
+    def recent(self, sensor_id, limit=None):
+        """Return recent (datetime, value) pairs for a sensor, oldest first"""
+        self._ensure_warm(sensor_id)
+        with self._lock:
+            buffer = self.buffers.get(sensor_id)
+            pairs = buffer.items(limit) if buffer else []
+        return [(from_epoch(timestamp), value) for timestamp, value in pairs]
+
+    def _ensure_warm(self, sensor_id):
+        """Load a sensor's recent history from the database the first time it is read"""
+        if sensor_id in self.warm:
+            return
+
+        try:
+            with app.app_context():
+                rows = SensorReading.query.filter_by(sensor_id=sensor_id)\
+                                          .order_by(SensorReading.timestamp.desc())\
+                                          .limit(self.capacity)\
+                                          .all()
+                history = [(to_epoch(row.timestamp), row.value) for row in reversed(rows)]
+        except Exception as e:
+            logger.error(f"Error loading recent readings for sensor {sensor_id}: {e}")
+            return
+
+        with self._lock:
+            buffer = self.buffers.get(sensor_id)
+            current = buffer.items() if buffer else []
+            # Readings that arrived since startup are newer than anything loaded here
+            if current:
+                history = [pair for pair in history if pair[0] < current[0][0]]
+            merged = ReadingRingBuffer(self.capacity)
+            for timestamp, value in (history + current)[-self.capacity:]:
+                merged.append(timestamp, value)
+            self.buffers[sensor_id] = merged
+            self.warm.add(sensor_id)
+
+# Global recent-readings store
+reading_buffers = ReadingBufferStore()
@@ -0,0 +1,170 @@
+import os
+import math
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy import case, delete, select
+from sqlalchemy.dialects import postgresql, sqlite
+from app import db
+from models import Sensor, SensorReading, SensorRollup
+# Bucket math lives in a module without app imports so ingest workers can use it
+from rollup_buckets import ROLLUP_RESOLUTIONS, bucket_start, aggregate, latest_readings  # noqa: F401
+
+logger = logging.getLogger(__name__)
+
+# How long raw readings and each rollup resolution are kept, in days (0 keeps forever)
+READING_RETENTION_DAYS = int(os.environ.get("READING_RETENTION_DAYS", "7"))
+ROLLUP_RETENTION_DAYS = {
+    60: int(os.environ.get("ROLLUP_MINUTE_RETENTION_DAYS", "30")),
+    3600: int(os.environ.get("ROLLUP_HOUR_RETENTION_DAYS", "365")),
+    86400: int(os.environ.get("ROLLUP_DAY_RETENTION_DAYS", "0")),
+}
+
+# Rows deleted per pruning transaction, so pruning never holds a long write lock
+PRUNE_BATCH_SIZE = int(os.environ.get("PRUNE_BATCH_SIZE", "5000"))
+
+# Default number of points returned by the history API
+HISTORY_MAX_POINTS = int(os.environ.get("HISTORY_MAX_POINTS", "500"))
+
+def write_rollups(session, deltas):
+    """Merge rollup deltas into the rollup table within the caller's transaction"""
+    if not deltas:
+        return
+
+    dialect = session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        stmt = postgresql.insert(SensorRollup)
+    elif dialect == 'sqlite':
+        stmt = sqlite.insert(SensorRollup)
+    else:
+        _merge_rollups(session, deltas)
+        return
+
+    new = stmt.excluded
+    table = SensorRollup.__table__.c
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['sensor_id', 'resolution', 'bucket_start'],
+        set_={
+            'min_value': case((new.min_value < table.min_value, new.min_value), else_=table.min_value),
+            'max_value': case((new.max_value > table.max_value, new.max_value), else_=table.max_value),
+            'sum_value': table.sum_value + new.sum_value,
+            'count': table.count + new.count,
+            'last_value': case((new.last_timestamp >= table.last_timestamp, new.last_value),
+                               else_=table.last_value),
+            'last_timestamp': case((new.last_timestamp >= table.last_timestamp, new.last_timestamp),
+                                   else_=table.last_timestamp),
+        }
+    )
+    session.execute(stmt, deltas)
+
+def _merge_rollups(session, deltas):
+    """Row-by-row merge for databases without INSERT ... ON CONFLICT"""
+    for delta in deltas:
+        rollup = SensorRollup.query.filter_by(
+            sensor_id=delta['sensor_id'],
+            resolution=delta['resolution'],
+            bucket_start=delta['bucket_start']
+        ).first()
+        if rollup is None:
+            session.add(SensorRollup(**delta))
+            continue
+        rollup.min_value = min(rollup.min_value, delta['min_value'])
+        rollup.max_value = max(rollup.max_value, delta['max_value'])
+        rollup.sum_value += delta['sum_value']
+        rollup.count += delta['count']
+        if delta['last_timestamp'] >= rollup.last_timestamp:
+            rollup.last_value = delta['last_value']
+            rollup.last_timestamp = delta['last_timestamp']
+
+def choose_resolution(start, end, max_points):
+    """Pick the finest rollup resolution whose bucket count over the window fits max_points"""
+    window = max((end - start).total_seconds(), 1)
+    for resolution in ROLLUP_RESOLUTIONS:
+        if math.ceil(window / resolution) <= max_points:
+            return resolution
+    return ROLLUP_RESOLUTIONS[-1]
+
+def load_history(sensor_id, start, end, max_points=HISTORY_MAX_POINTS):
+    """Return (resolution, points) for a sensor's history between start and end.
+
+    Raw readings are returned when the window is still inside raw retention
+    and holds no more than max_points rows; otherwise the finest rollup that
+    fits the point budget is used. Each point has min/max/avg/count/last.
+    """
+    raw_cutoff = datetime.utcnow() - timedelta(days=READING_RETENTION_DAYS)
+    if not READING_RETENTION_DAYS or start >= raw_cutoff:
+        readings = SensorReading.query.filter(
+            SensorReading.sensor_id == sensor_id,
+            SensorReading.timestamp >= start,
+            SensorReading.timestamp < end
+        ).order_by(SensorReading.timestamp).limit(max_points + 1).all()
+        if len(readings) <= max_points:
+            return 'raw', [{
+                'timestamp': reading.timestamp.isoformat(),
+                'min': reading.value,
+                'max': reading.value,
+                'avg': reading.value,
+                'count': 1,
+                'last': reading.value
+            } for reading in readings]
+
+    resolution = choose_resolution(start, end, max_points)
+    rollups = SensorRollup.query.filter(
+        SensorRollup.sensor_id == sensor_id,
+        SensorRollup.resolution == resolution,
+        SensorRollup.bucket_start >= bucket_start(start, resolution),
+        SensorRollup.bucket_start < end
+    ).order_by(SensorRollup.bucket_start).all()
+
+    return resolution, [{
+        'timestamp': rollup.bucket_start.isoformat(),
+        'min': rollup.min_value,
+        'max': rollup.max_value,
+        'avg': rollup.sum_value / rollup.count,
+        'count': rollup.count,
+        'last': rollup.last_value
+    } for rollup in rollups]
+
+def prune_batch(session, batch_size=PRUNE_BATCH_SIZE):
+    """Delete up to batch_size expired readings and rollups; returns the number deleted.
+
+    Rows are deleted sensor by sensor, oldest first, so every chunk is a
+    range scan on the (sensor_id, timestamp) index rather than a table scan,
+    like dropping the oldest partition of each sensor. Only sensors that
+    have expired rows are visited, found with one index probe per sensor,
+    so a pass with nothing to delete issues no DELETEs.
+    """
+    now = datetime.utcnow()
+    targets = []
+
+    if READING_RETENTION_DAYS:
+        cutoff = now - timedelta(days=READING_RETENTION_DAYS)
+        targets.append((SensorReading, SensorReading.timestamp, cutoff, ()))
+
+    for resolution, days in ROLLUP_RETENTION_DAYS.items():
+        if days:
+            cutoff = now - timedelta(days=days)
+            targets.append((SensorRollup, SensorRollup.bucket_start, cutoff,
+                            (SensorRollup.resolution == resolution,)))
+
+    deleted = 0
+    for model, time_column, cutoff, filters in targets:
+        if deleted >= batch_size:
+            break
+        expired_sensors = session.execute(select(Sensor.id).where(
+            select(model.id).where(model.sensor_id == Sensor.id, *filters, time_column < cutoff).exists()
+        )).scalars().all()
+        for sensor_id in expired_sensors:
+            if deleted >= batch_size:
+                return deleted
+            expired = select(model.id).where(
+                model.sensor_id == sensor_id,
+                *filters,
+                time_column < cutoff
+            ).order_by(time_column).limit(batch_size - deleted)
+            result = session.execute(
+                delete(model).where(model.id.in_(expired.scalar_subquery())),
+                execution_options={'synchronize_session': False}
+            )
+            deleted += result.rowcount
+
+    return deleted
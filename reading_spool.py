@@ -0,0 +1,211 @@
+import os
+import math
+import mmap
+import fcntl
+import struct
+import logging
+from threading import Lock
+from datetime import timedelta
+from sensor_frames import EPOCH
+
+logger = logging.getLogger(__name__)
+
+# File header: magic, format version, record size, byte offset replay has reached
+HEADER = struct.Struct('<8sIIQ')
+HEADER_SIZE = 64
+MAGIC = b'FIRESPL1'
+VERSION = 1
+
+# One reading per fixed-size record, in READING_COLUMNS order after the marker:
+# marker, flame_detected (-1 unset), padding, sensor_id, value, timestamp (epoch
+# seconds), temperature, humidity, smoke_level, fire_risk (NaN unset)
+RECORD = struct.Struct('<BbxxIdddddd')
+
+# Written last, so a record torn by a crash is never read back
+COMMITTED = 0xA5
+
+class ReadingSpool:
+    """Memory-mapped, append-only file of readings the database could not take.
+
+    Records are fixed size, so appending is a memory copy and replay reads
+    them back in file order from the offset stored in the header. When replay
+    catches up the file is cleared and shrunk. The file is locked, so only
+    one process spools into it.
+    """
+
+    def __init__(self, path, max_bytes, initial_bytes=4 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max(max_bytes, HEADER_SIZE + RECORD.size)
+        self.initial_bytes = min(initial_bytes, self.max_bytes)
+        self.spooled = 0
+        self.replayed = 0
+        self.dropped = 0
+        self._file = None
+        self._map = None
+        self._unavailable = False  # open failed; readings are dropped rather than retrying each time
+        self._read = HEADER_SIZE
+        self._write = HEADER_SIZE
+        self._lock = Lock()
+
+    def open(self):
+        """Open or create the spool and find where its records end; returns False if unavailable"""
+        with self._lock:
+            if self._map is not None:
+                return True
+            handle = None
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                handle = open(self.path, 'a+b')
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError as e:
+                if handle:
+                    handle.close()
+                self._unavailable = True
+                logger.error(f"Reading spool {self.path} unavailable: {e}")
+                return False
+
+            self._file = handle
+            if os.fstat(handle.fileno()).st_size < HEADER_SIZE:
+                handle.truncate(self.initial_bytes)
+            self._map = mmap.mmap(handle.fileno(), 0)
+            magic, version, record_size, read = HEADER.unpack_from(self._map)
+            if magic != MAGIC:
+                self._map[:HEADER_SIZE] = bytes(HEADER_SIZE)
+                read = HEADER_SIZE
+                self._write_header(read)
+            elif version != VERSION or record_size != RECORD.size:
+                logger.error(f"Reading spool {self.path} has an unknown format; not using it")
+                self._unavailable = True
+                self._close()
+                return False
+
+            self._unavailable = False
+            self._read = read
+            self._write = read
+            while (self._write + RECORD.size <= len(self._map) and
+                   self._map[self._write] == COMMITTED):
+                self._write += RECORD.size
+            if self.pending:
+                logger.warning(f"Reading spool holds {self.pending} readings to replay")
+            return True
+
+    def _write_header(self, read):
+        HEADER.pack_into(self._map, 0, MAGIC, VERSION, RECORD.size, read)
+
+    @property
+    def pending(self):
+        """Readings appended but not yet replayed"""
+        return (self._write - self._read) // RECORD.size
+
+    def append(self, rows):
+        """Append reading rows laid out by sensor_frames.reading_row; returns how many fit"""
+        if self._map is None and (self._unavailable or not self.open()):
+            self.dropped += len(rows)
+            return 0
+        with self._lock:
+            written = 0
+            for row in rows:
+                if self._write + RECORD.size > len(self._map) and not self._grow():
+                    break
+                self._map[self._write + 1:self._write + RECORD.size] = pack_row(row)[1:]
+                self._map[self._write] = COMMITTED
+                self._write += RECORD.size
+                written += 1
+            self.spooled += written
+            if written < len(rows):
+                self.dropped += len(rows) - written
+                logger.error(f"Reading spool full at {len(self._map)} bytes; "
+                             f"dropped {len(rows) - written} readings")
+            return written
+
+    def _grow(self):
+        """Double the file up to max_bytes; returns False if it is already that size"""
+        size = len(self._map)
+        if size >= self.max_bytes:
+            return False
+        self._remap(min(size * 2, self.max_bytes))
+        return True
+
+    def _remap(self, size):
+        self._map.flush()
+        self._map.close()
+        self._file.truncate(size)
+        self._map = mmap.mmap(self._file.fileno(), 0)
+
+    def read(self, limit):
+        """Return (rows, offset) for up to limit of the oldest unreplayed readings.
+
+        Nothing is consumed until commit(offset) is called after the rows are
+        safely in the database, so a failed replay is retried from the same place.
+        """
+        with self._lock:
+            if self._map is None:
+                return [], self._read
+            end = min(self._write, self._read + limit * RECORD.size)
+            rows = [unpack_row(self._map, offset) for offset in range(self._read, end, RECORD.size)]
+            return rows, end
+
+    def commit(self, offset):
+        """Mark readings up to offset as replayed; clears the file once replay catches up"""
+        with self._lock:
+            self.replayed += (offset - self._read) // RECORD.size
+            self._read = offset
+            if self._read >= self._write:
+                self._map[HEADER_SIZE:self._write] = bytes(self._write - HEADER_SIZE)
+                self._read = self._write = HEADER_SIZE
+                if len(self._map) > self.initial_bytes:
+                    self._remap(self.initial_bytes)
+            self._write_header(self._read)
+
+    def close(self):
+        """Flush the spool to disk and release it"""
+        with self._lock:
+            self._close()
+
+    def _close(self):
+        if self._map is not None:
+            self._map.flush()
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()  # releases the lock
+            self._file = None
+
+    def stats(self):
+        """Counters for the ingest stats endpoint"""
+        return {
+            'path': self.path,
+            'pending': self.pending,
+            'bytes': len(self._map) if self._map is not None else 0,
+            'spooled': self.spooled,
+            'replayed': self.replayed,
+            'dropped': self.dropped,
+        }
+
+def pack_row(row):
+    """Pack a reading row into a committed record"""
+    sensor_id, value, timestamp, temperature, humidity, smoke_level, flame_detected, fire_risk = row
+    return RECORD.pack(
+        COMMITTED,
+        -1 if flame_detected is None else int(bool(flame_detected)),
+        sensor_id,
+        value,
+        (timestamp - EPOCH).total_seconds(),
+        _float(temperature), _float(humidity), _float(smoke_level), _float(fire_risk),
+    )
+
+def unpack_row(buffer, offset):
+    """Unpack the record at offset into a reading row"""
+    _, flame, sensor_id, value, seconds, temperature, humidity, smoke_level, fire_risk = \
+        RECORD.unpack_from(buffer, offset)
+    return (
+        sensor_id, value, EPOCH + timedelta(seconds=seconds),
+        _none(temperature), _none(humidity), _none(smoke_level),
+        None if flame < 0 else bool(flame), _none(fire_risk),
+    )
+
+def _float(value):
+    return math.nan if value is None else float(value)
+
+def _none(value):
+    return None if math.isnan(value) else value
@@ -0,0 +1,297 @@
+import os
+import time
+import queue
+import logging
+from threading import Thread, Lock
+from datetime import datetime
+from sqlalchemy import update
+from sqlalchemy.exc import OperationalError, InterfaceError, DisconnectionError, TimeoutError as PoolTimeoutError
+from app import app, db
+from models import Sensor, SensorReading
+from sensor_frames import reading_row, READING_COLUMNS
+from reading_rollups import aggregate, latest_readings, write_rollups, prune_batch
+from ingest_queue import IngestQueue
+from reading_spool import ReadingSpool
+
+logger = logging.getLogger(__name__)
+
+# Write-behind configuration
+READING_QUEUE_SIZE = int(os.environ.get("READING_QUEUE_SIZE", "10000"))
+READING_FLUSH_INTERVAL_MS = int(os.environ.get("READING_FLUSH_INTERVAL_MS", "500"))
+READING_FLUSH_BATCH_SIZE = int(os.environ.get("READING_FLUSH_BATCH_SIZE", "500"))
+
+# What a full queue does during a database stall: block, coalesce or drop_quiet
+# (see ingest_queue); readings that cross a threshold are never dropped
+READING_QUEUE_POLICY = os.environ.get("READING_QUEUE_POLICY", "drop_quiet")
+
+# Append-only file that absorbs readings the database can't take (outage, or the
+# queue shedding under overload) until they can be replayed; empty disables it
+READING_SPOOL_PATH = os.environ.get(
+    "READING_SPOOL_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "instance", "reading_spool.dat"))
+READING_SPOOL_MAX_MB = int(os.environ.get("READING_SPOOL_MAX_MB", "512"))
+
+# Spooled readings written back per transaction once the database takes writes again,
+# and seconds to wait after a failed write before trying
+READING_SPOOL_REPLAY_BATCH = int(os.environ.get("READING_SPOOL_REPLAY_BATCH", "20000"))
+READING_SPOOL_RETRY = float(os.environ.get("READING_SPOOL_RETRY", "5"))
+
+# Replays of the same spooled batch that may fail, other than for the database being
+# unavailable, before it is moved to the quarantine file (READING_SPOOL_PATH.quarantine,
+# same format) so replay can move on
+READING_SPOOL_REPLAY_ATTEMPTS = int(os.environ.get("READING_SPOOL_REPLAY_ATTEMPTS", "3"))
+
+# Errors meaning the database can't take writes right now (down, locked, out of
+# connections), as opposed to rejecting the rows themselves
+UNAVAILABLE_ERRORS = (OperationalError, InterfaceError, DisconnectionError, PoolTimeoutError)
+
+# Seconds between retention runs; expired rows are then deleted one batch per loop
+PRUNE_INTERVAL = int(os.environ.get("PRUNE_INTERVAL", "3600"))
+
+class ReadingWriter:
+    """Write-behind writer that batches sensor readings from all ingest threads"""
+
+    def __init__(self, queue_size=READING_QUEUE_SIZE,
+                 flush_interval_ms=READING_FLUSH_INTERVAL_MS,
+                 batch_size=READING_FLUSH_BATCH_SIZE, policy=READING_QUEUE_POLICY,
+                 spool_path=READING_SPOOL_PATH):
+        self.spool = ReadingSpool(spool_path, READING_SPOOL_MAX_MB * 1024 * 1024) if spool_path else None
+        # Opened on first use
+        self.quarantine = ReadingSpool(spool_path + ".quarantine", READING_SPOOL_MAX_MB * 1024 * 1024) \
+            if spool_path else None
+        self.queue = IngestQueue(queue_size, policy, name="reading",
+                                 on_drop=self._spill if self.spool else None)
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.batch_size = batch_size
+        self.running = False
+        self._thread = None
+        self._lock = Lock()
+        self._next_prune = time.monotonic() + PRUNE_INTERVAL
+        self._replay_after = 0
+        self._replay_failures = 0  # consecutive failed replays of the batch at the spool's read offset
+
+    def start(self):
+        """Start the background flush thread"""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self.running = True
+            if self.spool:
+                # Readings spooled before a restart are replayed by the writer thread
+                self.spool.open()
+            self._thread = Thread(target=self._run, name="reading-writer")
+            self._thread.daemon = True
+            self._thread.start()
+            logger.info(f"Reading writer started (batch size {self.batch_size}, "
+                        f"flush interval {self.flush_interval * 1000:.0f} ms)")
+
+    def stop(self):
+        """Stop the flush thread after writing everything still queued"""
+        with self._lock:
+            self.running = False
+            thread = self._thread
+            self._thread = None
+        if thread:
+            thread.join()
+        # Anything submitted after the thread exited is written here
+        self.flush()
+        if self.spool:
+            self.spool.close()
+            self.quarantine.close()
+
+    def submit(self, sensor_id, value, timestamp=None, channels=None, critical=False):
+        """Queue a reading for the next batch; a full queue applies the queue's policy.
+
+        Critical readings (threshold crossings) are always queued. Returns
+        False if the reading was dropped.
+        """
+        if not self.running:
+            self.start()
+        return self.queue.put(sensor_id, (sensor_id, value, timestamp or datetime.utcnow(), channels), critical)
+
+    def flush(self):
+        """Synchronously write every reading currently queued"""
+        batch = self.queue.drain()
+        if batch:
+            self._write_batch(batch)
+
+    def _run(self):
+        """Collect readings and flush them every N milliseconds or M rows"""
+        while self.running:
+            batch = self._collect_batch()
+            if batch:
+                self._write_batch(batch)
+            if (self.spool and self.spool.pending and time.monotonic() >= self._replay_after
+                    and self.queue.qsize() < self.batch_size):
+                self._replay()
+            if time.monotonic() >= self._next_prune:
+                self._prune()
+
+    def _prune(self):
+        """Delete one batch of expired rows; pruning continues next loop until nothing is left.
+
+        Running in the writer thread interleaves short delete transactions with
+        reading flushes instead of competing with them for the write lock.
+        """
+        with app.app_context():
+            try:
+                deleted = prune_batch(db.session)
+                db.session.commit()
+            except Exception as e:
+                logger.error(f"Error pruning expired readings: {e}")
+                db.session.rollback()
+                deleted = 0
+
+        if deleted:
+            logger.debug(f"Pruned {deleted} expired readings and rollups")
+        else:
+            self._next_prune = time.monotonic() + PRUNE_INTERVAL
+
+    def _collect_batch(self):
+        """Wait for the first reading, then gather more until the batch is full or the interval expires"""
+        try:
+            first = self.queue.get(timeout=self.flush_interval)
+        except queue.Empty:
+            return []
+
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def write(self, batch):
+        """Write a batch of (sensor_id, value, timestamp, channels) readings in one transaction.
+
+        Used directly by callers that need the rows committed before they
+        answer, such as the HTTP batch ingest endpoint; raises on failure.
+        """
+        rows = [reading_row(*reading) for reading in batch]
+        self.write_rows(rows)
+
+    def write_rows(self, rows, deltas=None, latest=None):
+        """Commit reading rows laid out by reading_row, their rollup deltas and each sensor's latest value.
+
+        Sharded ingest workers compute deltas and latest themselves; both are
+        derived from rows when not given. Raises on failure.
+        """
+        if deltas is None:
+            deltas = aggregate(rows)
+        if latest is None:
+            latest = latest_readings(rows)
+
+        sensor_updates = [
+            {'id': sensor_id, 'last_reading': value, 'last_update': timestamp}
+            for sensor_id, (value, timestamp) in latest.items()
+        ]
+
+        with app.app_context():
+            try:
+                insert_rows(db.session, rows)
+                write_rollups(db.session, deltas)
+                if sensor_updates:
+                    db.session.execute(update(Sensor), sensor_updates)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+        logger.debug(f"Wrote {len(rows)} readings for {len(sensor_updates)} sensors")
+
+    def _write_batch(self, batch):
+        """Write a queued batch; spool it for replay if the database is unavailable.
+
+        A batch the database rejects would fail again on replay, so it is
+        quarantined instead.
+        """
+        rows = [reading_row(*reading) for reading in batch]
+        try:
+            self.write_rows(rows)
+        except UNAVAILABLE_ERRORS as e:
+            self._replay_after = time.monotonic() + READING_SPOOL_RETRY
+            if self.spool:
+                spooled = self.spool.append(rows)
+                logger.error(f"Error writing batch of {len(batch)} sensor readings, "
+                             f"spooled {spooled} for replay: {e}")
+            else:
+                logger.error(f"Error writing batch of {len(batch)} sensor readings: {e}")
+        except Exception as e:
+            if self.quarantine:
+                quarantined = self.quarantine.append(rows)
+                logger.error(f"Database rejected a batch of {len(batch)} sensor readings, "
+                             f"quarantined {quarantined} in {self.quarantine.path}: {e}")
+            else:
+                logger.error(f"Database rejected a batch of {len(batch)} sensor readings: {e}")
+
+    def _spill(self, reading):
+        """Spool a reading the queue shed under overload"""
+        self.spool.append([reading_row(*reading)])
+
+    def _replay(self):
+        """Write one large batch of spooled readings back to the database"""
+        rows, offset = self.spool.read(READING_SPOOL_REPLAY_BATCH)
+        if not rows:
+            return
+        try:
+            # Live readings written since have newer values; leave last_reading to them
+            self.write_rows(rows, latest={})
+        except Exception as e:
+            self._replay_after = time.monotonic() + READING_SPOOL_RETRY
+            logger.error(f"Error replaying {len(rows)} spooled readings: {e}")
+            if isinstance(e, UNAVAILABLE_ERRORS):
+                return
+            self._replay_failures += 1
+            if self._replay_failures < READING_SPOOL_REPLAY_ATTEMPTS:
+                return
+            # The rows themselves are rejected; set them aside rather than retry forever
+            quarantined = self.quarantine.append(rows)
+            logger.error(f"Quarantined {quarantined} spooled readings in {self.quarantine.path} "
+                         f"after {self._replay_failures} failed replays")
+            self._replay_failures = 0
+            self.spool.commit(offset)
+            return
+        self._replay_failures = 0
+        self.spool.commit(offset)
+        logger.info(f"Replayed {len(rows)} spooled readings ({self.spool.pending} left)")
+
+# Compiled per dialect on first use
+_insert_statements = {}
+
+def insert_rows(session, rows):
+    """executemany reading rows straight through the DB driver.
+
+    SQLAlchemy's per-row parameter handling costs more than SQLite's own
+    insert, so the INSERT is compiled once per dialect and only the
+    timestamp column goes through its bind processor.
+    """
+    if not rows:
+        return
+    connection = session.connection()
+    dialect = connection.dialect
+    prepared = _insert_statements.get(dialect.name)
+    if prepared is None:
+        table = SensorReading.__table__
+        compiled = table.insert().values({name: None for name in READING_COLUMNS}).compile(dialect=dialect)
+        order = [READING_COLUMNS.index(name) for name in compiled.positiontup] if compiled.positional else None
+        timestamp_type = table.c.timestamp.type.dialect_impl(dialect)
+        prepared = (str(compiled), order, timestamp_type.bind_processor(dialect))
+        _insert_statements[dialect.name] = prepared
+    sql, order, process_timestamp = prepared
+
+    if process_timestamp:
+        rows = [row[:2] + (process_timestamp(row[2]),) + row[3:] for row in rows]
+    if order is None:
+        params = [dict(zip(READING_COLUMNS, row)) for row in rows]
+    elif order == list(range(len(READING_COLUMNS))):
+        params = rows
+    else:
+        params = [tuple(row[i] for i in order) for row in rows]
+    connection.exec_driver_sql(sql, params)
+
+# Global reading writer instance
+reading_writer = ReadingWriter()
@@ -0,0 +1,58 @@
+from datetime import datetime, timedelta
+
+# Rollup bucket sizes in seconds, finest first
+ROLLUP_RESOLUTIONS = (60, 3600, 86400)
+
+EPOCH = datetime(1970, 1, 1)
+
+def bucket_start(timestamp, resolution):
+    """Return the start of the bucket containing timestamp"""
+    seconds = int((timestamp - EPOCH).total_seconds())
+    return EPOCH + timedelta(seconds=seconds - seconds % resolution)
+
+def aggregate(rows):
+    """Fold reading rows into per-bucket rollup deltas for every resolution.
+
+    Rows are tuples starting with (sensor_id, value, timestamp), as built by
+    sensor_frames.reading_row.
+    """
+    buckets = {}
+    for row in rows:
+        sensor_id, value, timestamp = row[0], row[1], row[2]
+        seconds = int((timestamp - EPOCH).total_seconds())
+        for resolution in ROLLUP_RESOLUTIONS:
+            key = (sensor_id, resolution, seconds - seconds % resolution)
+            bucket = buckets.get(key)
+            if bucket is None:
+                buckets[key] = {
+                    'sensor_id': sensor_id,
+                    'resolution': resolution,
+                    'bucket_start': EPOCH + timedelta(seconds=key[2]),
+                    'min_value': value,
+                    'max_value': value,
+                    'sum_value': value,
+                    'count': 1,
+                    'last_value': value,
+                    'last_timestamp': timestamp,
+                }
+                continue
+            if value < bucket['min_value']:
+                bucket['min_value'] = value
+            elif value > bucket['max_value']:
+                bucket['max_value'] = value
+            bucket['sum_value'] += value
+            bucket['count'] += 1
+            if timestamp >= bucket['last_timestamp']:
+                bucket['last_value'] = value
+                bucket['last_timestamp'] = timestamp
+    return list(buckets.values())
+
+def latest_readings(rows):
+    """Return {sensor_id: (value, timestamp)} of the newest row per sensor"""
+    latest = {}
+    for row in rows:
+        sensor_id, value, timestamp = row[0], row[1], row[2]
+        previous = latest.get(sensor_id)
+        if previous is None or timestamp >= previous[1]:
+            latest[sensor_id] = (value, timestamp)
+    return latest
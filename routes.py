@@ -1,15 +1,31 @@
 from flask import render_template, request, jsonify, redirect, url_for, flash
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from app import app, db
-from models import Sensor, Alert, SensorReading, EmergencyContact, AlertStatus, AlertType, SensorType
-from sensor_reader import test_sensor_reading, sensor_reader
-from notifier import send_alert_notifications, send_test_notifications
+from models import (Sensor, Alert, AlertTrace, SensorReading, EmergencyContact, NotificationDelivery,
+                    AlertStatus, AlertType, SensorType)
+from sensor_reader import test_sensor_reading, sensor_reader, fire_detector, alert_raiser, listener
+from reading_writer import reading_writer
+from reading_buffer import reading_buffers
+from alert_index import active_alerts
+from sensor_health import sensor_health
+from reading_rollups import load_history, HISTORY_MAX_POINTS
+from notifier import send_test_notifications, notification_dispatcher, smtp_pool
+from notification_outbox import notification_outbox
 from gps_navigator import get_navigation_to_alert, geocode_address, reverse_geocode, find_fire_stations
 from admin_auth import login_required
+import alert_trace
 import logging
+import math
+import os
 
 logger = logging.getLogger(__name__)
 
+# Set to 0 to import the app without starting sensor monitoring (benchmarks, scripts)
+SENSOR_MONITORING = os.environ.get("SENSOR_MONITORING", "1") != "0"
+
+# Longest look-back the history and trace APIs accept for ?hours=, ten years
+MAX_QUERY_HOURS = 24 * 365 * 10
+
 @app.route('/')
 def index():
     """Main dashboard page"""
@@ -111,13 +127,11 @@ def api_report_fire():
         )
         
         db.session.add(alert)
+        notification_outbox.enqueue(alert)
         db.session.commit()
         
         # Send notifications
-        from threading import Thread
-        notification_thread = Thread(target=send_alert_notifications, args=(alert.id,))
-        notification_thread.daemon = True
-        notification_thread.start()
+        notification_outbox.wake(alert.id)
         
         return jsonify({
             'success': True,
@@ -138,6 +152,7 @@ def resolve_alert(alert_id):
         alert.status = AlertStatus.RESOLVED
         alert.resolved_at = datetime.utcnow()
         db.session.commit()
+        active_alerts.resolve(alert)
         
         return jsonify({'success': True, 'message': 'Alert resolved successfully'})
         
@@ -171,10 +186,15 @@ def get_sensors():
     
     sensor_data = []
     for sensor in sensors:
-        # Get latest reading
-        latest_reading = SensorReading.query.filter_by(sensor_id=sensor.id)\
-                                           .order_by(SensorReading.timestamp.desc())\
-                                           .first()
+        # Recent readings come from the in-memory ring buffer, not the database
+        recent_readings = reading_buffers.recent(sensor.id)
+        latest_reading = recent_readings[-1] if recent_readings else None
+        
+        # Liveness comes from the last frame of any kind, heartbeats included;
+        # before a sensor is seen after a restart, fall back to its last reading
+        is_online = sensor_health.is_online(sensor.id)
+        if is_online is None:
+            is_online = (datetime.utcnow() - sensor.last_update).total_seconds() < 300 if sensor.last_update else False
         
         sensor_info = {
             'id': sensor.id,
@@ -186,16 +206,62 @@ def get_sensors():
             'threshold': sensor.threshold_value,
             'last_reading': sensor.last_reading,
             'last_update': sensor.last_update.isoformat() if sensor.last_update else None,
-            'is_online': (datetime.utcnow() - sensor.last_update).total_seconds() < 300 if sensor.last_update else False,
+            'is_online': is_online,
+            'health': sensor_health.get(sensor.id),
             'latest_reading': {
-                'value': latest_reading.value,
-                'timestamp': latest_reading.timestamp.isoformat()
-            } if latest_reading else None
+                'value': latest_reading[1],
+                'timestamp': latest_reading[0].isoformat()
+            } if latest_reading else None,
+            'recent_readings': [
+                {'value': value, 'timestamp': timestamp.isoformat()}
+                for timestamp, value in recent_readings
+            ]
         }
         sensor_data.append(sensor_info)
     
     return jsonify(sensor_data)
 
+@app.route('/api/sensors/<int:sensor_id>/history')
+def get_sensor_history(sensor_id):
+    """Get sensor history at the finest resolution that fits the point budget"""
+    try:
+        end = _parse_utc(request.args.get('end')) or datetime.utcnow()
+        start = _parse_utc(request.args.get('start')) or \
+            end - timedelta(hours=_parse_hours(request.args.get('hours', 24)))
+        max_points = min(int(request.args.get('points', HISTORY_MAX_POINTS)), 10000)
+    except (TypeError, ValueError, OverflowError):
+        return jsonify({'error': 'Invalid history window'}), 400
+    
+    if start >= end or max_points < 1:
+        return jsonify({'error': 'Invalid history window'}), 400
+    
+    Sensor.query.get_or_404(sensor_id)
+    resolution, points = load_history(sensor_id, start, end, max_points)
+    
+    return jsonify({
+        'sensor_id': sensor_id,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'resolution': resolution,
+        'points': points
+    })
+
+def _parse_hours(value):
+    """Parse an ?hours= query argument; raises ValueError unless it is in (0, MAX_QUERY_HOURS]"""
+    hours = float(value)
+    if not math.isfinite(hours) or not 0 < hours <= MAX_QUERY_HOURS:
+        raise ValueError(f'hours must be between 0 and {MAX_QUERY_HOURS}')
+    return hours
+
+def _parse_utc(value):
+    """Parse an ISO timestamp query argument into a naive UTC datetime"""
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
 @app.route('/api/alerts')
 def get_alerts():
     """Get alerts with optional filtering"""
@@ -259,6 +325,57 @@ def test_sensor(sensor_id):
         logger.error(f"Error testing sensor {sensor_id}: {e}")
         return jsonify({'error': 'Failed to test sensor'}), 500
 
+@app.route('/api/ingest/stats')
+@login_required
+def get_ingest_stats():
+    """Depth and queued/dropped/coalesced counters of the ingest queues, and the reading spool and quarantine"""
+    return jsonify({
+        'readings': reading_writer.queue.stats(),
+        'detection': fire_detector.queue.stats(),
+        'alerts': alert_raiser.stats(),
+        'listener': listener.queue.stats(),
+        'spool': reading_writer.spool.stats() if reading_writer.spool else None,
+        'quarantine': reading_writer.quarantine.stats() if reading_writer.quarantine else None,
+    })
+
+@app.route('/api/alert-traces/stats')
+@login_required
+def get_alert_trace_stats():
+    """Stage latency percentiles of recent alert pipeline traces, optionally for one source"""
+    try:
+        hours = _parse_hours(request.args.get('hours', 24))
+        limit = min(int(request.args.get('limit', 10000)), 100000)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid trace window'}), 400
+    
+    since = datetime.utcnow() - timedelta(hours=hours)
+    query = AlertTrace.query.filter(AlertTrace.created_at >= since)
+    source = request.args.get('source')
+    if source:
+        query = query.filter_by(source=source)
+    traces = query.order_by(AlertTrace.created_at.desc()).limit(limit).all()
+    
+    sources = {}
+    for trace in traces:
+        sources[trace.source] = sources.get(trace.source, 0) + 1
+    
+    return jsonify({
+        'since': since.isoformat(),
+        'traces': len(traces),
+        'sources': sources,
+        'stages': alert_trace.percentiles(traces),
+    })
+
+@app.route('/api/notifications/stats')
+@login_required
+def get_notification_stats():
+    """Outbox backlog and counters, dispatcher rate limiting and SMTP session reuse"""
+    return jsonify({
+        'outbox': notification_outbox.stats(),
+        'dispatcher': notification_dispatcher.stats(),
+        'smtp': smtp_pool.stats(),
+    })
+
 @app.route('/api/test-notifications')
 @login_required
 def test_notifications():
@@ -362,6 +479,24 @@ def get_alert_responses(alert_id):
         logger.error(f"Error getting alert responses {alert_id}: {e}")
         return jsonify({'error': 'Failed to get alert responses'}), 500
 
+@app.route('/api/alerts/<int:alert_id>/deliveries')
+@login_required
+def get_alert_deliveries(alert_id):
+    """Get the per-recipient notification results for a specific alert"""
+    deliveries = NotificationDelivery.query.filter_by(alert_id=alert_id)\
+                                           .order_by(NotificationDelivery.id).all()
+    
+    return jsonify([{
+        'contact_id': delivery.contact_id,
+        'channel': delivery.channel,
+        'recipient': delivery.recipient,
+        'success': delivery.success,
+        'error': delivery.error,
+        'send_ms': delivery.send_ms,
+        'wait_ms': delivery.wait_ms,
+        'created_at': delivery.created_at.isoformat(),
+    } for delivery in deliveries])
+
 @app.route('/api/admin-response', methods=['POST'])
 @login_required
 def send_admin_response():
@@ -450,6 +585,16 @@ def internal_error(error):
 # Initialize sensor monitoring on startup
 def initialize_monitoring():
     """Initialize sensor monitoring when the app starts"""
+    import multiprocessing
+    if multiprocessing.current_process().name != 'MainProcess':
+        # Spawned worker processes (e.g. sharded ingest) may import the app via __main__;
+        # only the parent process reads sensors. The name is set before that import,
+        # parent_process() only after it
+        return
+    if not SENSOR_MONITORING:
+        logger.info("Sensor monitoring disabled (SENSOR_MONITORING=0)")
+        return
+    
     try:
         from sensor_reader import start_sensor_monitoring
         import threading
@@ -0,0 +1,33 @@
+# Sensor columns copied into each snapshot
+SNAPSHOT_FIELDS = (
+    'id', 'name', 'sensor_type', 'location', 'latitude', 'longitude', 'is_active',
+    'arduino_port', 'threshold_value', 'temperature_threshold', 'smoke_threshold',
+    'fire_risk_threshold', 'flame_alert',
+)
+
+class SensorConfig:
+    """Immutable snapshot of the sensor settings the ingest path reads"""
+
+    __slots__ = SNAPSHOT_FIELDS + ('version',)
+
+    def __init__(self, values, version):
+        for name in SNAPSHOT_FIELDS:
+            object.__setattr__(self, name, values[name])
+        object.__setattr__(self, 'version', version)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"SensorConfig is read-only; cannot set {name}")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"SensorConfig is read-only; cannot delete {name}")
+
+    def __reduce__(self):
+        # Rebuild through __init__ so snapshots can be sent to ingest worker processes
+        return SensorConfig, ({name: getattr(self, name) for name in SNAPSHOT_FIELDS}, self.version)
+
+    def __repr__(self):
+        return f"<SensorConfig {self.id} {self.name!r} v{self.version}>"
+
+def snapshot_values(sensor):
+    """Copy the snapshot fields off a loaded Sensor row"""
+    return {name: getattr(sensor, name) for name in SNAPSHOT_FIELDS}
@@ -0,0 +1,184 @@
+import json
+import math
+from datetime import datetime, timedelta, timezone
+
+# Measurement channels in a fire_sensor_node.ino frame and their types
+CHANNELS = {
+    'temperature': float,
+    'humidity': float,
+    'smoke_level': float,
+    'flame_detected': bool,
+    'fire_risk': float,
+}
+
+# Channel stored as SensorReading.value for each sensor type
+PRIMARY_CHANNELS = {
+    'temperature': 'temperature',
+    'smoke': 'smoke_level',
+    'flame': 'flame_detected',
+    'combined': 'fire_risk',
+}
+
+def empty_channels():
+    """Return a channel dict with every channel unset"""
+    return dict.fromkeys(CHANNELS)
+
+# SensorReading columns in the order reading_row lays them out
+READING_COLUMNS = ('sensor_id', 'value', 'timestamp') + tuple(CHANNELS)
+
+def reading_row(sensor_id, value, timestamp, channels):
+    """Lay a reading out as a tuple in READING_COLUMNS order"""
+    if not channels:
+        return (sensor_id, value, timestamp) + (None,) * len(CHANNELS)
+    return (sensor_id, value, timestamp) + tuple(channels.get(name) for name in CHANNELS)
+
+EPOCH = datetime(1970, 1, 1)
+
+def parse_timestamp(value):
+    """Parse an ISO-8601 string or epoch seconds into a naive UTC datetime.
+
+    Raises ValueError for anything else, including epoch seconds outside
+    the datetime range.
+    """
+    if value is None:
+        return datetime.utcnow()
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        try:
+            return EPOCH + timedelta(seconds=value)
+        except OverflowError:
+            raise ValueError(f'timestamp {value} out of range')
+    timestamp = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    if timestamp.tzinfo:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+# Frame kind for real measurements; everything else is a control frame
+MEASUREMENT = 'measurement'
+
+# Keys that mark control frames from fire_sensor_node.ino, checked in order
+CONTROL_KEYS = ('heartbeat', 'status', 'local_alert', 'config_updated', 'error', 'test_alert')
+
+def parse_frame(data, sensor_type):
+    """Parse and classify one line in a single pass.
+
+    Returns (MEASUREMENT, (value, channels)) for readings, (kind, frame) for
+    control frames such as heartbeats, or None if the line can't be parsed.
+    Bare numbers are readings with that value. Frames the caller has already
+    decoded can be passed as a dict.
+    """
+    if isinstance(data, dict):
+        frame = data
+    else:
+        try:
+            frame = json.loads(data)
+        except ValueError:
+            frame = None
+
+    if not isinstance(frame, dict):
+        # If not a JSON object, try to parse as plain number
+        try:
+            value = float(data)
+        except (TypeError, ValueError):
+            return None
+        return (MEASUREMENT, (value, empty_channels())) if math.isfinite(value) else None
+
+    kind = classify_frame(frame)
+    if kind != MEASUREMENT:
+        return kind, frame
+
+    reading = reading_from_frame(frame, sensor_type)
+    if reading is None:
+        return None
+    return MEASUREMENT, reading
+
+def classify_frame(frame):
+    """Return the control kind of a decoded frame, or MEASUREMENT"""
+    for key in CONTROL_KEYS:
+        if key in frame:
+            return key
+    # Frames without any value, such as GET_STATUS replies, are status reports
+    if 'value' not in frame and not any(name in frame for name in CHANNELS):
+        return 'status'
+    return MEASUREMENT
+
+def reading_from_frame(frame, sensor_type):
+    """Extract (value, channels) from a decoded measurement frame.
+
+    The primary value is 'value' when present, otherwise the sensor type's
+    primary channel; it is None when the frame carries neither, so the other
+    channels can still be checked without storing a made-up reading. Returns
+    None if 'value' is not a finite number; other channels that aren't are
+    left unset.
+    """
+    channels = empty_channels()
+    for name, kind in CHANNELS.items():
+        raw = frame.get(name)
+        if raw is None:
+            continue
+        try:
+            reading = bool(raw) if kind is bool else float(raw)
+        except (TypeError, ValueError):
+            continue
+        if kind is bool or math.isfinite(reading):
+            channels[name] = reading
+
+    try:
+        if 'value' in frame:
+            value = float(frame['value'])
+        else:
+            value = channel_value(channels, PRIMARY_CHANNELS.get(sensor_type))
+    except (TypeError, ValueError):
+        return None
+    if value is not None and not math.isfinite(value):
+        return None
+
+    return value, channels
+
+def channel_value(channels, name):
+    """Return a channel as a float (flame_detected as 1.0/0.0), or None if unset"""
+    value = channels.get(name) if name else None
+    if value is None:
+        return None
+    return float(value)
+
+# Sensor columns holding optional per-channel thresholds
+CHANNEL_THRESHOLDS = {
+    'temperature': 'temperature_threshold',
+    'smoke_level': 'smoke_threshold',
+    'fire_risk': 'fire_risk_threshold',
+}
+
+# A detected flame is checked as 1.0 against this threshold
+FLAME_THRESHOLD = 0.5
+
+def find_exceedance(sensor, value, channels):
+    """Return (channel, reading, threshold) for the reading furthest over its threshold, or None.
+
+    The primary value, if any, is checked against threshold_value as before;
+    every other channel is checked only when the sensor has a threshold for it.
+    """
+    primary = PRIMARY_CHANNELS.get(sensor.sensor_type.value)
+    candidates = []
+
+    if value is not None and sensor.threshold_value is not None and value > sensor.threshold_value:
+        candidates.append((primary or 'value', value, sensor.threshold_value))
+
+    for name, attribute in CHANNEL_THRESHOLDS.items():
+        threshold = getattr(sensor, attribute, None)
+        reading = channels.get(name)
+        if threshold is None or reading is None:
+            continue
+        if reading > threshold:
+            candidates.append((name, reading, threshold))
+
+    if channels.get('flame_detected') and getattr(sensor, 'flame_alert', True) is not False:
+        candidates.append(('flame_detected', 1.0, FLAME_THRESHOLD))
+
+    if not candidates:
+        return None
+    return max(candidates, key=exceedance_ratio)
+
+def exceedance_ratio(exceedance):
+    """How far a (channel, reading, threshold) exceedance is over its threshold"""
+    _, reading, threshold = exceedance
+    return reading / threshold if threshold > 0 else float('inf')
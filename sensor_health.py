@@ -0,0 +1,88 @@
+import os
+import time
+import logging
+from threading import Lock
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# A sensor is offline when no frame of any kind arrived for this many seconds
+SENSOR_OFFLINE_AFTER = int(os.environ.get("SENSOR_OFFLINE_AFTER", "300"))
+
+class SensorHealth:
+    """Liveness and device status reported by one sensor node"""
+
+    def __init__(self):
+        self.last_seen = None
+        self.last_seen_monotonic = None
+        self.status = None
+        self.uptime = None
+        self.free_memory = None
+        self.alert_active = None
+        self.last_error = None
+        self.device_config = {}
+
+    def to_dict(self):
+        return {
+            'last_seen': self.last_seen.isoformat() if self.last_seen else None,
+            'status': self.status,
+            'uptime': self.uptime,
+            'free_memory': self.free_memory,
+            'alert_active': self.alert_active,
+            'last_error': self.last_error,
+            'device_config': dict(self.device_config),
+        }
+
+class SensorHealthTable:
+    """In-memory health of every sensor, fed by heartbeat and status frames"""
+
+    def __init__(self, offline_after=SENSOR_OFFLINE_AFTER):
+        self.offline_after = offline_after
+        self.sensors = {}
+        self._lock = Lock()
+
+    def record(self, sensor_id, kind, frame=None):
+        """Mark a sensor as seen and apply what a control frame reports"""
+        with self._lock:
+            health = self.sensors.get(sensor_id)
+            if health is None:
+                health = self.sensors[sensor_id] = SensorHealth()
+            health.last_seen = datetime.utcnow()
+            health.last_seen_monotonic = time.monotonic()
+
+            if not frame:
+                return
+
+            if kind == 'heartbeat':
+                health.uptime = frame.get('uptime', health.uptime)
+                health.free_memory = frame.get('free_memory', health.free_memory)
+                health.alert_active = frame.get('alert_active', health.alert_active)
+            elif kind == 'status':
+                health.status = frame.get('status', health.status)
+                health.uptime = frame.get('uptime', health.uptime)
+                health.alert_active = frame.get('alert_active', health.alert_active)
+                if isinstance(frame.get('thresholds'), dict):
+                    health.device_config.update(frame['thresholds'])
+            elif kind == 'local_alert':
+                health.alert_active = frame.get('local_alert') == 'TRIGGERED'
+            elif kind == 'config_updated':
+                health.device_config[frame.get('config_updated')] = frame.get('value')
+            elif kind == 'error':
+                health.last_error = frame.get('error')
+                logger.warning(f"Sensor {sensor_id} reported error: {health.last_error}")
+
+    def get(self, sensor_id):
+        """Return a sensor's health as a dict, or None if it hasn't been seen since startup"""
+        with self._lock:
+            health = self.sensors.get(sensor_id)
+            return health.to_dict() if health else None
+
+    def is_online(self, sensor_id):
+        """True/False from the last frame seen, or None if the sensor hasn't been seen since startup"""
+        health = self.sensors.get(sensor_id)
+        if health is None:
+            return None
+        return time.monotonic() - health.last_seen_monotonic < self.offline_after
+
+# Global sensor health table
+sensor_health = SensorHealthTable()
@@ -19,38 +19,75 @@ except ImportError:
             pass
     
     serial = MockSerialModule()
+import os
 import json
 import time
 import logging
-from threading import Thread
+from threading import Thread, Lock, Event
 from datetime import datetime
 from app import app, db
-from models import Sensor, SensorReading, Alert, AlertType, AlertStatus
-from notifier import send_alert_notifications
+from models import Alert, AlertType, AlertStatus
+from notification_outbox import notification_outbox
+from contact_index import contact_index
+from reading_writer import reading_writer
+from reading_buffer import reading_buffers
+from alert_index import active_alerts
+from sensor_frames import parse_frame, find_exceedance, MEASUREMENT
+from sensor_health import sensor_health
+from serial_multiplexer import SerialMultiplexer
+from socket_listener import SensorListener
+from fire_detection import FireDetector
+from alert_raiser import AlertRaiser
+from sensor_registry import sensor_registry
+import alert_trace
 
 logger = logging.getLogger(__name__)
 
+# Seconds between reconciling serial readers against the sensor table
+SENSOR_RECONCILE_INTERVAL = int(os.environ.get("SENSOR_RECONCILE_INTERVAL", "30"))
+
+# Exponential backoff for reconnecting failed or unplugged serial ports, in seconds
+RECONNECT_BACKOFF_INITIAL = float(os.environ.get("RECONNECT_BACKOFF_INITIAL", "1"))
+RECONNECT_BACKOFF_MAX = float(os.environ.get("RECONNECT_BACKOFF_MAX", "300"))
+
 class ArduinoSensorReader:
     def __init__(self):
         self.active_connections = {}
+        self.sensor_ports = {}  # sensor_id -> port its reader is running on
+        self.retries = {}  # sensor_id -> (sensor, failed attempts, monotonic time of next attempt)
         self.running = False
+        self._lock = Lock()
+        self._wake = Event()
+        self._supervisor = None
         
     def start_monitoring(self):
         """Start monitoring all active sensors"""
         self.running = True
-        with app.app_context():
-            sensors = Sensor.query.filter_by(is_active=True).all()
-            
-            for sensor in sensors:
-                if sensor.arduino_port:
-                    thread = Thread(target=self._monitor_sensor, args=(sensor,))
-                    thread.daemon = True
-                    thread.start()
-                    logger.info(f"Started monitoring sensor {sensor.name} on port {sensor.arduino_port}")
+        reading_writer.start()
+        notification_outbox.start()
+        active_alerts.load()
+        contact_index.load()
+        alert_raiser.start()
+        multiplexer.start()
+        listener.start()
+        fire_detector.start()
+        
+        # The supervisor connects the sensors and keeps them in step with the database
+        self._wake.clear()
+        self._supervisor = Thread(target=self._supervise, name="sensor-supervisor")
+        self._supervisor.daemon = True
+        self._supervisor.start()
     
     def stop_monitoring(self):
         """Stop all sensor monitoring"""
         self.running = False
+        self._wake.set()
+        if self._supervisor:
+            self._supervisor.join()
+            self._supervisor = None
+        multiplexer.stop()
+        listener.stop()
+        fire_detector.stop()
         for port, connection in self.active_connections.items():
             try:
                 connection.close()
@@ -58,144 +95,325 @@ class ArduinoSensorReader:
             except Exception as e:
                 logger.error(f"Error closing connection to {port}: {e}")
         self.active_connections.clear()
+        self.sensor_ports.clear()
+        self.retries.clear()
+        alert_raiser.stop()
+        notification_outbox.stop()
+        reading_writer.stop()
+    
+    def _supervise(self):
+        """Reconcile readers every SENSOR_RECONCILE_INTERVAL and reconnect dropped ports when due"""
+        next_reconcile = 0
+        while self.running:
+            if time.monotonic() >= next_reconcile:
+                try:
+                    self.reconcile()
+                except Exception as e:
+                    logger.error(f"Error reconciling sensors: {e}")
+                next_reconcile = time.monotonic() + SENSOR_RECONCILE_INTERVAL
+            else:
+                self._retry_due()
+            
+            wait = next_reconcile - time.monotonic()
+            with self._lock:
+                if self.retries:
+                    wait = min(wait, min(due for _, _, due in self.retries.values()) - time.monotonic())
+            self._wake.wait(max(wait, 0))
+            self._wake.clear()
     
-    def _monitor_sensor(self, sensor):
-        """Monitor a single sensor"""
+    def reconcile(self):
+        """Start, stop and refresh serial readers to match the active sensors in the database.
+        
+        Readers whose sensor and port are unchanged keep their connection and
+        only get the fresh sensor row, so thresholds apply without a reconnect.
+        """
+        sensors = {
+            sensor.id: sensor
+            for sensor in sensor_registry.load()
+            if sensor.is_active and sensor.arduino_port
+        }
+        
+        with self._lock:
+            running = dict(self.sensor_ports)
+            for sensor_id in set(self.retries) - set(sensors):
+                del self.retries[sensor_id]
+        
+        for sensor_id, port in running.items():
+            sensor = sensors.get(sensor_id)
+            if sensor is None or sensor.arduino_port != port:
+                self._disconnect_sensor(sensor_id, port)
+            else:
+                multiplexer.update_context(port, sensor)
+        
+        for sensor_id, sensor in sensors.items():
+            if running.get(sensor_id) == sensor.arduino_port:
+                continue
+            with self._lock:
+                retry = self.retries.get(sensor_id)
+                if retry and retry[2] > time.monotonic():
+                    # Backing off; keep the newest row for the next attempt
+                    self.retries[sensor_id] = (sensor, retry[1], retry[2])
+                    continue
+            self._connect_sensor(sensor)
+    
+    def _retry_due(self):
+        """Reconnect sensors whose backoff has expired"""
+        now = time.monotonic()
+        with self._lock:
+            due = [sensor for sensor, _, at in self.retries.values() if at <= now]
+        for sensor in due:
+            self._connect_sensor(sensor)
+    
+    def _schedule_retry(self, sensor):
+        """Back off exponentially before the next connection attempt for a sensor"""
+        with self._lock:
+            attempts = self.retries.get(sensor.id, (None, 0, 0))[1] + 1
+            delay = min(RECONNECT_BACKOFF_INITIAL * 2 ** (attempts - 1), RECONNECT_BACKOFF_MAX)
+            self.retries[sensor.id] = (sensor, attempts, time.monotonic() + delay)
+        logger.info(f"Retrying sensor {sensor.name} on {sensor.arduino_port} in {delay:.0f}s "
+                    f"(attempt {attempts})")
+        self._wake.set()
+    
+    def _connect_sensor(self, sensor):
+        """Open a sensor's serial port and register it with the multiplexer"""
         try:
-            # Initialize serial connection
+            # Non-blocking reads: the multiplexer only reads when data is waiting
             ser = serial.Serial(
                 port=sensor.arduino_port,
                 baudrate=9600,
-                timeout=1
+                timeout=0
             )
-            self.active_connections[sensor.arduino_port] = ser
-            
-            logger.info(f"Connected to sensor {sensor.name} on {sensor.arduino_port}")
-            
-            while self.running:
-                try:
-                    if ser.in_waiting > 0:
-                        line = ser.readline().decode('utf-8').strip()
-                        
-                        if line:
-                            self._process_sensor_data(sensor, line)
-                    
-                    time.sleep(0.1)  # Small delay to prevent CPU overload
-                    
-                except serial.SerialException as e:
-                    logger.error(f"Serial error for sensor {sensor.name}: {e}")
-                    break
-                except Exception as e:
-                    logger.error(f"Error reading from sensor {sensor.name}: {e}")
-                    time.sleep(1)  # Wait before retrying
-                    
         except serial.SerialException as e:
             logger.error(f"Could not connect to sensor {sensor.name} on {sensor.arduino_port}: {e}")
+            self._schedule_retry(sensor)
+            return False
         except Exception as e:
-            logger.error(f"Unexpected error monitoring sensor {sensor.name}: {e}")
-        finally:
-            if sensor.arduino_port in self.active_connections:
-                try:
-                    self.active_connections[sensor.arduino_port].close()
-                    del self.active_connections[sensor.arduino_port]
-                except:
-                    pass
+            logger.error(f"Unexpected error connecting to sensor {sensor.name}: {e}")
+            self._schedule_retry(sensor)
+            return False
+        
+        if not multiplexer.add(sensor.arduino_port, ser, sensor):
+            ser.close()
+            self._schedule_retry(sensor)
+            return False
+        
+        with self._lock:
+            self.active_connections[sensor.arduino_port] = ser
+            self.sensor_ports[sensor.id] = sensor.arduino_port
+            self.retries.pop(sensor.id, None)
+        logger.info(f"Started monitoring sensor {sensor.name} on port {sensor.arduino_port}")
+        return True
     
-    def _process_sensor_data(self, sensor, data):
-        """Process incoming sensor data"""
+    def _disconnect_sensor(self, sensor_id, port):
+        """Stop reading a sensor that was removed, deactivated or moved to another port"""
+        multiplexer.remove(port)
+        with self._lock:
+            connection = self.active_connections.pop(port, None)
+            self.sensor_ports.pop(sensor_id, None)
+        if connection:
+            try:
+                connection.close()
+            except Exception:
+                pass
+        logger.info(f"Stopped monitoring sensor {sensor_id} on {port}")
+    
+    def _handle_disconnect(self, port, sensor, connection):
+        """Close a port the multiplexer reported as failed and schedule a reconnect.
+
+        The failure may belong to a connection that was stopped or replaced
+        while its removal was still queued with the multiplexer; that one is
+        only closed, so it can't drop the current connection or bring back a
+        removed sensor.
+        """
+        with self._lock:
+            current = (self.active_connections.get(port) is connection and
+                       self.sensor_ports.get(sensor.id) == port)
+            if current:
+                del self.active_connections[port]
+                del self.sensor_ports[sensor.id]
         try:
-            with app.app_context():
-                # Try to parse JSON data first
-                try:
-                    sensor_data = json.loads(data)
-                    value = float(sensor_data.get('value', 0))
-                    sensor_type = sensor_data.get('type', 'temperature')
-                except (json.JSONDecodeError, ValueError):
-                    # If not JSON, try to parse as plain number
-                    try:
-                        value = float(data)
-                    except ValueError:
-                        logger.warning(f"Could not parse sensor data: {data}")
-                        return
-                
-                # Update sensor last reading
-                sensor.last_reading = value
-                sensor.last_update = datetime.utcnow()
-                
-                # Store reading in database
-                reading = SensorReading(
-                    sensor_id=sensor.id,
-                    value=value,
-                    timestamp=datetime.utcnow()
-                )
-                db.session.add(reading)
-                
-                # Check if value exceeds threshold
-                if value > sensor.threshold_value:
-                    self._create_fire_alert(sensor, value)
-                
-                db.session.commit()
-                logger.debug(f"Processed reading for {sensor.name}: {value}")
-                
-        except Exception as e:
-            logger.error(f"Error processing sensor data for {sensor.name}: {e}")
-            db.session.rollback()
+            connection.close()
+        except Exception:
+            pass
+        if not current:
+            logger.debug(f"Ignoring failure of a stale connection to sensor {sensor.name} on {port}")
+            return
+        logger.warning(f"Lost connection to sensor {sensor.name} on {port}")
+        if self.running:
+            self._schedule_retry(sensor)
+    
+    def _network_sensor(self, sensor_id):
+        """Return the active sensor a network node's sensor_id refers to, or None"""
+        try:
+            sensor_id = int(sensor_id)
+        except (TypeError, ValueError, OverflowError):
+            return None
+        
+        return sensor_registry.get(sensor_id)
+    
+    def _is_crossing(self, line, sensor):
+        """Whether a network node's line crosses a threshold, judged from the registry snapshot alone.
+
+        Asked by the listener's queue before it drops the line under overload,
+        so it must never reach the database.
+        """
+        try:
+            frame = json.loads(line)
+        except ValueError:
+            frame = None
+        if not isinstance(frame, dict):
+            frame = line  # bare value, judged against the connection's sensor
+        elif 'sensor_id' in frame:
+            try:
+                sensor = sensor_registry.snapshot()[1].get(int(frame['sensor_id']))
+            except (TypeError, ValueError, OverflowError):
+                return False
+        if sensor is None or not sensor.is_active:
+            return False
+        parsed = parse_frame(frame, sensor.sensor_type.value)
+        return (parsed is not None and parsed[0] == MEASUREMENT and
+                find_exceedance(sensor, *parsed[1]) is not None)
     
-    def _create_fire_alert(self, sensor, reading_value):
-        """Create a fire alert when sensor threshold is exceeded"""
+    def _process_sensor_data(self, sensor, data):
+        """Process incoming sensor data"""
         try:
-            # Check if there's already an active alert for this sensor
-            existing_alert = Alert.query.filter_by(
-                sensor_id=sensor.id,
-                status=AlertStatus.ACTIVE
-            ).first()
+            dispatched = time.monotonic()
+            # Pick up edits committed since the caller got its snapshot
+            sensor = sensor_registry.current(sensor)
             
-            if existing_alert:
-                logger.debug(f"Alert already exists for sensor {sensor.name}")
+            # Classify the frame and parse every channel in one pass
+            frame = parse_frame(data, sensor.sensor_type.value)
+            parsed = time.monotonic()
+            if frame is None:
+                logger.warning(f"Could not parse sensor data: {data}")
                 return
+            kind, payload = frame
             
-            # Determine severity based on how much the threshold is exceeded
-            threshold_ratio = reading_value / sensor.threshold_value
-            if threshold_ratio >= 3:
-                severity = 'critical'
-            elif threshold_ratio >= 2:
-                severity = 'high'
-            elif threshold_ratio >= 1.5:
-                severity = 'medium'
-            else:
-                severity = 'low'
+            # Heartbeats and status frames only update the in-memory health table
+            if kind != MEASUREMENT:
+                sensor_health.record(sensor.id, kind, payload)
+                logger.debug(f"Processed {kind} frame for {sensor.name}")
+                return
             
-            # Create new alert
-            alert = Alert(
-                title=f"Fire Detected - {sensor.name}",
-                description=f"Sensor {sensor.name} detected reading of {reading_value:.2f} "
-                           f"(threshold: {sensor.threshold_value:.2f})",
-                alert_type=AlertType.SENSOR_DETECTION,
-                status=AlertStatus.ACTIVE,
-                severity=severity,
-                latitude=sensor.latitude or 0.0,
-                longitude=sensor.longitude or 0.0,
-                address=sensor.location,
-                sensor_id=sensor.id,
-                sensor_reading=reading_value
-            )
+            sensor_health.record(sensor.id, kind)
+            value, channels = payload
             
-            db.session.add(alert)
-            db.session.commit()
+            timestamp = datetime.utcnow()
             
-            logger.warning(f"FIRE ALERT CREATED: {alert.title} - Severity: {severity}")
+            # Check thresholds before queueing so batching never delays alerts; the
+            # alert itself is created on the alert thread, off the I/O threads
+            exceedance = find_exceedance(sensor, value, channels)
+            if exceedance:
+                # Only readings that raise an alert carry a trace
+                trace = alert_trace.begin(dispatched=dispatched, parsed=parsed)
+                trace.mark('checked')
+                alert_raiser.submit(sensor, *exceedance, trace=trace)
             
-            # Send notifications asynchronously
-            notification_thread = Thread(target=send_alert_notifications, args=(alert.id,))
-            notification_thread.daemon = True
-            notification_thread.start()
+            if value is None:
+                # No reading of the sensor's own channel to store, buffer or trend
+                logger.debug(f"Frame for {sensor.name} carries no primary value")
+                return
             
+            # Recent values are served from memory; the reading and the sensor's
+            # last_reading/last_update are written to the database in batches.
+            # Under overload quiet readings may be shed, crossings never are
+            reading_buffers.record(sensor.id, timestamp, value)
+            reading_writer.submit(sensor.id, value, timestamp, channels, critical=exceedance is not None)
+            
+            # Rate-of-rise and projected-threshold checks run in batches each tick
+            fire_detector.observe(sensor, timestamp, value)
+            logger.debug(f"Processed reading for {sensor.name}: {value}")
+                
         except Exception as e:
-            logger.error(f"Error creating fire alert: {e}")
-            db.session.rollback()
+            logger.error(f"Error processing sensor data for {sensor.name}: {e}")
+    
+    def _create_fire_alert(self, sensor, channel, reading_value, threshold, trace=None):
+        """Create a fire alert when a sensor channel exceeds its threshold; returns the new alert id.
+        
+        trace carries the stage timings of the reading that crossed the threshold;
+        detector alerts start one here.
+        """
+        if trace is None:
+            trace = alert_trace.TraceContext('detection')
+        
+        # An alert is already open for this sensor; no database round trip needed
+        if active_alerts.get(sensor.id):
+            logger.debug(f"Alert already exists for sensor {sensor.name}")
+            return
+        
+        with app.app_context():
+            try:
+                # Not in the index: check for one opened by another process
+                existing_alert = Alert.query.filter_by(
+                    sensor_id=sensor.id,
+                    status=AlertStatus.ACTIVE
+                ).first()
+                
+                if existing_alert:
+                    active_alerts.add(sensor.id, existing_alert.id)
+                    logger.debug(f"Alert already exists for sensor {sensor.name}")
+                    return
+                trace.mark('looked_up')
+                
+                # Determine severity based on how much the threshold is exceeded
+                threshold_ratio = reading_value / threshold if threshold > 0 else float('inf')
+                if threshold_ratio >= 3:
+                    severity = 'critical'
+                elif threshold_ratio >= 2:
+                    severity = 'high'
+                elif threshold_ratio >= 1.5:
+                    severity = 'medium'
+                else:
+                    severity = 'low'
+                
+                # Create new alert
+                alert = Alert(
+                    title=f"Fire Detected - {sensor.name}",
+                    description=f"Sensor {sensor.name} detected {channel.replace('_', ' ')} reading of "
+                               f"{reading_value:.2f} (threshold: {threshold:.2f})",
+                    alert_type=AlertType.SENSOR_DETECTION,
+                    status=AlertStatus.ACTIVE,
+                    severity=severity,
+                    latitude=sensor.latitude or 0.0,
+                    longitude=sensor.longitude or 0.0,
+                    address=sensor.location,
+                    sensor_id=sensor.id,
+                    sensor_reading=reading_value
+                )
+                
+                db.session.add(alert)
+                notification_outbox.enqueue(alert)
+                db.session.commit()
+                trace.mark('committed')
+                active_alerts.add(sensor.id, alert.id)
+                alert_id = alert.id
+                
+                logger.warning(f"FIRE ALERT CREATED: {alert.title} - Severity: {severity}")
+                
+                # Notifications go out from the outbox committed with the alert
+                notification_outbox.wake(alert_id, trace)
+                
+                return alert_id
+                
+            except Exception as e:
+                logger.error(f"Error creating fire alert: {e}")
+                db.session.rollback()
 
-# Global sensor reader instance
+# Global sensor reader instance; one multiplexer thread serves every serial port,
+# one event loop thread serves every Wi-Fi node, one detector tracks trends and
+# one alert thread creates the alerts their crossings raise
 sensor_reader = ArduinoSensorReader()
+alert_raiser = AlertRaiser(on_alert=sensor_reader._create_fire_alert)
+multiplexer = SerialMultiplexer(
+    on_line=sensor_reader._process_sensor_data,
+    on_disconnect=sensor_reader._handle_disconnect
+)
+listener = SensorListener(
+    on_line=sensor_reader._process_sensor_data,
+    resolve_sensor=sensor_reader._network_sensor,
+    is_crossing=sensor_reader._is_crossing
+)
+fire_detector = FireDetector(on_alert=sensor_reader._create_fire_alert)
 
 def start_sensor_monitoring():
     """Start the sensor monitoring system"""
@@ -207,9 +425,8 @@ def stop_sensor_monitoring():
 
 def test_sensor_reading(sensor_id, test_value):
     """Test function to simulate sensor reading"""
-    with app.app_context():
-        sensor = Sensor.query.get(sensor_id)
-        if sensor:
-            sensor_reader._process_sensor_data(sensor, str(test_value))
-            return True
+    sensor = sensor_registry.get(sensor_id)
+    if sensor:
+        sensor_reader._process_sensor_data(sensor, str(test_value))
+        return True
     return False
@@ -0,0 +1,123 @@
+import os
+import time
+import logging
+from threading import Lock
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+from app import app
+from models import Sensor
+from sensor_config import SensorConfig, snapshot_values
+
+logger = logging.getLogger(__name__)
+
+# Minimum seconds between full reloads triggered by lookups of unknown sensor ids
+SENSOR_REGISTRY_MISS_RELOAD = float(os.environ.get("SENSOR_REGISTRY_MISS_RELOAD", "5"))
+
+# Seconds an id a reload did not find is answered as unknown without reloading again,
+# so a node repeating a bad sensor_id doesn't force a reload every SENSOR_REGISTRY_MISS_RELOAD
+SENSOR_REGISTRY_MISS_TTL = float(os.environ.get("SENSOR_REGISTRY_MISS_TTL", "60"))
+
+# Unknown ids remembered at most; the list is cleared when it fills up
+SENSOR_REGISTRY_MAX_MISSES = 10000
+
+class SensorRegistry:
+    """Versioned in-memory map of sensor id to SensorConfig.
+
+    The whole map is swapped on every change, so readers never lock and a
+    snapshot a thread holds never changes under it. Commits of Sensor rows
+    in this process publish new snapshots immediately; load() picks up
+    changes made by other processes.
+    """
+
+    def __init__(self):
+        self.version = 0
+        self._configs = {}
+        self._lock = Lock()
+        self._loaded_at = None
+        self._misses = {}  # unknown sensor id -> monotonic time a reload didn't find it
+
+    def load(self):
+        """Snapshot every sensor from the database; returns the snapshots"""
+        with app.app_context():
+            rows = [snapshot_values(sensor) for sensor in Sensor.query.all()]
+        with self._lock:
+            self.version += 1
+            self._configs = {values['id']: SensorConfig(values, self.version) for values in rows}
+            self._loaded_at = time.monotonic()
+            configs = list(self._configs.values())
+        logger.debug(f"Loaded {len(configs)} sensor configs (version {self.version})")
+        return configs
+
+    def get(self, sensor_id):
+        """Return the snapshot of an active sensor, or None.
+
+        An unknown id triggers a reload at most every SENSOR_REGISTRY_MISS_RELOAD
+        seconds, so sensors added by another process are found without a
+        database query per lookup, and the same unknown id at most every
+        SENSOR_REGISTRY_MISS_TTL seconds. Sensors committed in this process
+        are found at once either way.
+        """
+        config = self._configs.get(sensor_id)
+        if config is None:
+            now = time.monotonic()
+            missed = self._misses.get(sensor_id)
+            if ((missed is None or now - missed >= SENSOR_REGISTRY_MISS_TTL) and
+                    (self._loaded_at is None or now - self._loaded_at >= SENSOR_REGISTRY_MISS_RELOAD)):
+                self.load()
+                config = self._configs.get(sensor_id)
+                if config is None:
+                    if len(self._misses) >= SENSOR_REGISTRY_MAX_MISSES:
+                        self._misses.clear()
+                    self._misses[sensor_id] = now
+        if config is None or not config.is_active:
+            return None
+        return config
+
+    def snapshot(self):
+        """Return (version, {sensor_id: SensorConfig}); the map is replaced on change, never mutated"""
+        with self._lock:
+            return self.version, self._configs
+
+    def current(self, config):
+        """Return the newest snapshot of the sensor a (possibly stale) snapshot refers to"""
+        return self._configs.get(config.id, config)
+
+    def publish(self, changes):
+        """Apply committed changes, given as {sensor_id: snapshot values or None if deleted}"""
+        with self._lock:
+            self.version += 1
+            configs = dict(self._configs)
+            for sensor_id, values in changes.items():
+                if values is None:
+                    configs.pop(sensor_id, None)
+                else:
+                    configs[sensor_id] = SensorConfig(values, self.version)
+            self._configs = configs
+
+# Global registry instance
+sensor_registry = SensorRegistry()
+
+# Sensor rows flushed in a session are held until its transaction commits,
+# so rolled-back edits never reach the registry
+@event.listens_for(Sensor, 'after_insert')
+@event.listens_for(Sensor, 'after_update')
+def _stage_sensor_change(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault('sensor_changes', {})[target.id] = snapshot_values(target)
+
+@event.listens_for(Sensor, 'after_delete')
+def _stage_sensor_delete(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault('sensor_changes', {})[target.id] = None
+
+@event.listens_for(Session, 'after_commit')
+def _publish_sensor_changes(session):
+    changes = session.info.pop('sensor_changes', None)
+    if changes:
+        sensor_registry.publish(changes)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_sensor_changes(session):
+    session.info.pop('sensor_changes', None)
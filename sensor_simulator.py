@@ -0,0 +1,456 @@
+#!/usr/bin/env python3
+"""
+Virtual sensor fleet simulator for end-to-end load testing
+Runs thousands of virtual fire_sensor_node.ino nodes against the full ingest
+pipeline in this process: readings, heartbeats and local alert transitions
+go over pseudo-terminals (read by the serial multiplexer) or the TCP/UDP
+listener, through threshold checks, fire detection and the reading writer
+into the database. Reports readings/sec, how long after each simulated
+fire crossed its threshold the alert was created (negative when fire
+detection warned first) and how long after ignition.
+
+Sensors are created as SIM-00001, SIM-00002, ... and deactivated again when
+the run ends. Runs use a fresh scratch SQLite database unless --database-url
+is given; alerts raise notifications as usual, so only point it at a
+database without emergency contacts.
+"""
+
+import os
+import sys
+import json
+import time
+import heapq
+import random
+import socket
+import tty
+import argparse
+import resource
+import tempfile
+from datetime import datetime
+
+# Database used unless --database-url is given; recreated for every run
+SCRATCH_DB_PATH = os.path.join(tempfile.gettempdir(), "sensor_simulator.db")
+
+# Fire scenarios: how a node's channels change per second after ignition.
+# flame_after is seconds until the flame sensor trips, or None.
+SCENARIOS = {
+    'smouldering': {'temperature': 0.05, 'smoke_level': 6.0, 'humidity': -0.05, 'flame_after': None},
+    'flaming': {'temperature': 1.5, 'smoke_level': 20.0, 'humidity': -0.3, 'flame_after': 30},
+    'flashover': {'temperature': 6.0, 'smoke_level': 60.0, 'humidity': -1.0, 'flame_after': 3},
+}
+
+# Node-side thresholds from fire_sensor_node.ino; simulated sensors get the same ones
+TEMPERATURE_THRESHOLD = 50.0
+SMOKE_THRESHOLD = 300
+
+TRANSPORTS = ('tcp', 'udp', 'pty')
+
+def fire_risk(temperature, smoke, flame):
+    """calculateFireRisk() from fire_sensor_node.ino, including its integer map()"""
+    risk = 0
+    if temperature > 25:
+        risk += int((min(max(temperature, 25), 100) - 25) * 40 / 75)
+    if smoke > 100:
+        risk += (min(max(smoke, 100), 1000) - 100) * 40 // 900
+    if flame:
+        risk += 20
+    return min(max(risk, 0), 100)
+
+class VirtualNode:
+    """One simulated fire_sensor_node.ino: ambient noise, optionally a fire, and its frames"""
+
+    def __init__(self, sensor_id, name, location, scenario=None, ignite_at=None, rng=None):
+        self.sensor_id = sensor_id
+        self.name = name
+        self.location = location
+        self.scenario = SCENARIOS[scenario] if scenario else None
+        self.ignite_at = ignite_at  # seconds after boot
+        self.rng = rng or random.Random(sensor_id)
+        self.ambient = (self.rng.uniform(19, 26), self.rng.uniform(35, 55), self.rng.uniform(80, 140))
+        self.alert_active = False
+        self.crossed_at = None  # UTC time of the first reading over a threshold
+        self.next_heartbeat = None
+        self.boot = None
+        self.booted_at = None  # UTC time of boot, so ignition can be placed on the wall clock
+
+    def online_frame(self, now):
+        """The SENSOR_ONLINE line a node prints from setup()"""
+        self.boot = now
+        self.booted_at = datetime.utcnow()
+        return self._line({"status": "SENSOR_ONLINE", "sensor_id": self.sensor_id, "name": self.name})
+
+    def channels(self, elapsed):
+        """Temperature, humidity, smoke level and flame state elapsed seconds after boot"""
+        temperature, humidity, smoke = self.ambient
+        flame = False
+        if self.scenario and elapsed >= self.ignite_at:
+            burning = elapsed - self.ignite_at
+            temperature += self.scenario['temperature'] * burning
+            humidity += self.scenario['humidity'] * burning
+            smoke += self.scenario['smoke_level'] * burning
+            flame_after = self.scenario['flame_after']
+            flame = flame_after is not None and burning >= flame_after
+        temperature = min(temperature + self.rng.gauss(0, 0.15), 125.0)
+        humidity = min(max(humidity + self.rng.gauss(0, 0.5), 5.0), 100.0)
+        smoke = int(min(max(smoke + self.rng.gauss(0, 4), 0), 1023))
+        return temperature, humidity, smoke, flame
+
+    def frames(self, now, heartbeat_interval):
+        """Lines the node prints for a reading taken at monotonic time now"""
+        elapsed = now - self.boot
+        uptime = int(elapsed * 1000)
+        temperature, humidity, smoke, flame = self.channels(elapsed)
+        alerts = {
+            "temperature": temperature > TEMPERATURE_THRESHOLD,
+            "smoke": smoke > SMOKE_THRESHOLD,
+            "flame": flame,
+        }
+        alerts["active"] = any(alerts.values())
+        lines = [self._line({
+            "sensor_id": self.sensor_id,
+            "name": self.name,
+            "location": self.location,
+            "timestamp": uptime,
+            "temperature": round(temperature, 2),
+            "humidity": round(humidity, 2),
+            "smoke_level": smoke,
+            "flame_detected": flame,
+            "fire_risk": fire_risk(temperature, smoke, flame),
+            "alerts": alerts,
+        })]
+
+        if alerts["active"] != self.alert_active:
+            self.alert_active = alerts["active"]
+            if self.alert_active and self.crossed_at is None:
+                self.crossed_at = datetime.utcnow()
+            state = "TRIGGERED" if self.alert_active else "CLEARED"
+            lines.append(self._line({"local_alert": state, "sensor_id": self.sensor_id}))
+
+        if self.next_heartbeat is None:
+            self.next_heartbeat = now + heartbeat_interval
+        elif now >= self.next_heartbeat:
+            self.next_heartbeat = now + heartbeat_interval
+            lines.append(self._line({
+                "heartbeat": True,
+                "sensor_id": self.sensor_id,
+                "uptime": uptime,
+                "free_memory": self.rng.randint(900, 1100),
+                "alert_active": self.alert_active,
+            }))
+        return lines
+
+    def _line(self, frame):
+        # ArduinoJson prints compact JSON; Serial.println ends lines with CRLF
+        return json.dumps(frame, separators=(',', ':')).encode() + b'\r\n'
+
+class Fleet:
+    """Drives a set of VirtualNodes over one transport from a single thread.
+
+    Each node reports every interval seconds at its own phase, so load is
+    spread evenly. Lines a transport can't take immediately (a full pty
+    buffer) are counted as dropped rather than stalling the whole fleet.
+    """
+
+    def __init__(self, nodes, transport, host='127.0.0.1', tcp_port=None, udp_port=None,
+                 interval=5.0, heartbeat_interval=30.0):
+        self.nodes = nodes
+        self.transport = transport
+        self.host = host
+        self.tcp_port = tcp_port
+        self.udp_port = udp_port
+        self.interval = interval
+        self.heartbeat_interval = heartbeat_interval
+        self.ports = {}  # node index -> pty slave path
+        self.readings_sent = 0
+        self.control_sent = 0
+        self.dropped = 0
+        self._senders = {}  # node index -> callable that writes bytes
+        self._connections = []
+        self._ptys = []
+        self._udp = None
+
+    def open(self):
+        """Create the node ends of every connection; ptys must exist before their sensors do"""
+        if self.transport == 'pty':
+            for index in range(len(self.nodes)):
+                master, slave = os.openpty()
+                tty.setraw(slave)
+                os.set_blocking(master, False)
+                self._ptys.append((master, slave))
+                self.ports[index] = os.ttyname(slave)
+                self._senders[index] = lambda data, fd=master: os.write(fd, data)
+        elif self.transport == 'udp':
+            self._udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            for index in range(len(self.nodes)):
+                self._senders[index] = self._send_datagrams
+
+    def connect(self, timeout=10):
+        """Open one TCP connection per node once the listener is accepting"""
+        if self.transport != 'tcp':
+            return
+        deadline = time.monotonic() + timeout
+        for index in range(len(self.nodes)):
+            while True:
+                try:
+                    connection = socket.create_connection((self.host, self.tcp_port))
+                    break
+                except OSError:
+                    if time.monotonic() > deadline:
+                        raise
+                    time.sleep(0.1)
+            self._connections.append(connection)
+            self._senders[index] = connection.sendall
+
+    def _send_datagrams(self, data):
+        # fire_sensor_node.ino over Wi-Fi sends one line per datagram
+        for line in data.splitlines(keepends=True):
+            self._udp.sendto(line, (self.host, self.udp_port))
+
+    def run(self, duration):
+        """Send every node's frames for duration seconds"""
+        started = time.monotonic()
+        schedule = []
+        for index, node in enumerate(self.nodes):
+            self._send(index, node.online_frame(started))
+            self.control_sent += 1
+            phase = self.interval * index / len(self.nodes)
+            schedule.append((started + phase, index))
+        heapq.heapify(schedule)
+
+        end = started + duration
+        while schedule and schedule[0][0] < end:
+            due, index = schedule[0]
+            now = time.monotonic()
+            if due > now:
+                time.sleep(min(due - now, 0.05))
+                continue
+            node = self.nodes[index]
+            lines = node.frames(now, self.heartbeat_interval)
+            if self._send(index, b''.join(lines)):
+                self.readings_sent += 1
+                self.control_sent += len(lines) - 1
+            heapq.heapreplace(schedule, (due + self.interval, index))
+        return time.monotonic() - started
+
+    def _send(self, index, data):
+        try:
+            self._senders[index](data)
+            return True
+        except (BlockingIOError, OSError):
+            self.dropped += 1
+            return False
+
+    def close(self):
+        """Close every node connection"""
+        for connection in self._connections:
+            connection.close()
+        if self._udp:
+            self._udp.close()
+        for master, slave in self._ptys:
+            os.close(master)
+            os.close(slave)
+        self._senders.clear()
+        self._connections, self._ptys = [], []
+
+def build_nodes(count, fires, scenario, fire_window, seed=1):
+    """Create count nodes, fires of which ignite at random times within fire_window seconds"""
+    rng = random.Random(seed)
+    burning = set(rng.sample(range(count), min(fires, count)))
+    nodes = []
+    for index in range(count):
+        if index in burning:
+            chosen = rng.choice(sorted(SCENARIOS)) if scenario == 'mixed' else scenario
+            ignite_at = rng.uniform(*fire_window)
+        else:
+            chosen, ignite_at = None, None
+        nodes.append(VirtualNode(0, f"SIM-{index + 1:05d}", "Simulated Fleet", chosen, ignite_at,
+                                 random.Random(rng.random())))
+    return nodes
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+def free_port(kind):
+    with socket.socket(socket.AF_INET, kind) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def raise_file_limit(needed):
+    """Raise the soft open-file limit toward needed (each TCP/pty node costs up to three)"""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < needed:
+        target = needed if hard == resource.RLIM_INFINITY else min(needed, hard)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+
+def simulate(count=1000, transport='tcp', duration=60.0, interval=5.0, heartbeat_interval=30.0,
+             fires=None, scenario='flaming', fire_window=None, lat=40.7128, lng=-74.0060,
+             spread=0.05, keep=False, seed=1):
+    """Run a fleet against the in-process pipeline and return the results as a dict.
+
+    Starts sensor monitoring by importing the app, so call it before anything
+    else imports the app.
+    """
+    if fires is None:
+        fires = max(count // 100, 1)
+    if fire_window is None:
+        fire_window = (duration * 0.1, duration * 0.5)
+    raise_file_limit(count * 3 + 256)
+
+    tcp_port, udp_port = None, None
+    if transport == 'tcp':
+        tcp_port = int(os.environ.setdefault("SENSOR_TCP_PORT", str(free_port(socket.SOCK_STREAM))))
+    elif transport == 'udp':
+        udp_port = int(os.environ.setdefault("SENSOR_UDP_PORT", str(free_port(socket.SOCK_DGRAM))))
+
+    nodes = build_nodes(count, fires, scenario, fire_window, seed)
+    fleet = Fleet(nodes, transport, tcp_port=tcp_port, udp_port=udp_port,
+                  interval=interval, heartbeat_interval=heartbeat_interval)
+    fleet.open()
+
+    # Importing the app starts sensor monitoring, which reads the listener ports set above
+    from app import app, db
+    from models import Sensor, SensorReading, Alert, AlertStatus, SensorType
+    from sensor_reader import sensor_reader, stop_sensor_monitoring
+    from reading_writer import reading_writer
+    from alert_index import active_alerts
+
+    rng = random.Random(seed)
+    with app.app_context():
+        existing = {sensor.name: sensor for sensor in
+                    Sensor.query.filter(Sensor.name.like('SIM-%')).all()}
+        sensors = []
+        for index, node in enumerate(nodes):
+            sensor = existing.get(node.name)
+            if sensor is None:
+                sensor = Sensor(name=node.name)
+                db.session.add(sensor)
+            sensor.sensor_type = SensorType.TEMPERATURE
+            sensor.location = node.location
+            sensor.latitude = lat + rng.uniform(-spread, spread)
+            sensor.longitude = lng + rng.uniform(-spread, spread)
+            sensor.threshold_value = TEMPERATURE_THRESHOLD
+            sensor.smoke_threshold = SMOKE_THRESHOLD
+            sensor.flame_alert = True
+            sensor.arduino_port = fleet.ports.get(index)
+            sensor.is_active = True
+            sensors.append(sensor)
+        db.session.flush()
+        for node, sensor in zip(nodes, sensors):
+            node.sensor_id = sensor.id
+        ids = [node.sensor_id for node in nodes]
+        # Alerts left open by an earlier run would suppress this run's
+        Alert.query.filter(Alert.sensor_id.in_(ids), Alert.status == AlertStatus.ACTIVE).update(
+            {Alert.status: AlertStatus.RESOLVED}, synchronize_session=False)
+        db.session.commit()
+    active_alerts.load()
+
+    while not sensor_reader.running:
+        time.sleep(0.05)
+    if transport == 'pty':
+        sensor_reader.reconcile()
+    fleet.connect()
+
+    started_at = datetime.utcnow()
+    elapsed = fleet.run(duration)
+    fleet.close()
+
+    # Let queued readings and pending detector ticks land before counting
+    time.sleep(2)
+    reading_writer.flush()
+
+    with app.app_context():
+        stored = SensorReading.query.filter(SensorReading.sensor_id.in_(ids),
+                                            SensorReading.timestamp >= started_at).count()
+        first_alerts = {}
+        for sensor_id, created_at in db.session.query(Alert.sensor_id, Alert.created_at).filter(
+                Alert.sensor_id.in_(ids), Alert.created_at >= started_at).order_by(Alert.created_at):
+            first_alerts.setdefault(sensor_id, created_at)
+
+        if not keep:
+            for sensor in Sensor.query.filter(Sensor.id.in_(ids)).all():
+                sensor.is_active = False
+            db.session.commit()
+    stop_sensor_monitoring()
+
+    # Negative latency: fire detection alerted before any threshold was crossed
+    crossed = [node for node in nodes if node.crossed_at]
+    latencies = [(first_alerts[node.sensor_id] - node.crossed_at).total_seconds() * 1000
+                 for node in crossed if node.sensor_id in first_alerts]
+    detection = [(first_alerts[node.sensor_id] - node.booted_at).total_seconds() * 1000 - node.ignite_at * 1000
+                 for node in nodes if node.scenario and node.sensor_id in first_alerts]
+    burning = {node.sensor_id for node in nodes if node.scenario}
+    false_alarms = [sensor_id for sensor_id in first_alerts if sensor_id not in burning]
+
+    results = {
+        'nodes': count,
+        'transport': transport,
+        'interval_s': interval,
+        'duration_s': round(elapsed, 2),
+        'readings_sent': fleet.readings_sent,
+        'control_frames_sent': fleet.control_sent,
+        'dropped': fleet.dropped,
+        'sent_per_sec': round(fleet.readings_sent / elapsed, 1),
+        'readings_stored': stored,
+        'stored_per_sec': round(stored / elapsed, 1),
+        'fires': len(burning),
+        'crossed_threshold': len(crossed),
+        'alerted': len(latencies),
+        'missed': len(crossed) - len(latencies),
+        'alerted_early': sum(1 for latency in latencies if latency < 0),
+        'false_alarms': len(false_alarms),
+    }
+    if latencies:
+        results.update({
+            'alert_latency_p50_ms': round(percentile(latencies, 0.50), 1),
+            'alert_latency_p95_ms': round(percentile(latencies, 0.95), 1),
+            'alert_latency_p99_ms': round(percentile(latencies, 0.99), 1),
+            'alert_latency_max_ms': round(max(latencies), 1),
+        })
+    if detection:
+        results.update({
+            'ignition_to_alert_p50_ms': round(percentile(detection, 0.50), 1),
+            'ignition_to_alert_p95_ms': round(percentile(detection, 0.95), 1),
+        })
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--nodes', type=int, default=1000)
+    parser.add_argument('--transport', choices=TRANSPORTS, default='tcp')
+    parser.add_argument('--duration', type=float, default=60, help='seconds to send for')
+    parser.add_argument('--interval', type=float, default=5, help='seconds between readings per node')
+    parser.add_argument('--heartbeat', type=float, default=30, help='seconds between heartbeats per node')
+    parser.add_argument('--fires', type=int, help='nodes that catch fire (default 1%% of nodes)')
+    parser.add_argument('--scenario', choices=sorted(SCENARIOS) + ['mixed'], default='flaming')
+    parser.add_argument('--keep', action='store_true', help='leave the SIM- sensors active afterwards')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    parser.add_argument('--database-url', help='database to run against (default: a scratch SQLite '
+                                               'database, so no real contacts are notified)')
+    args = parser.parse_args()
+
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    else:
+        if os.path.exists(SCRATCH_DB_PATH):
+            os.remove(SCRATCH_DB_PATH)
+        os.environ["DATABASE_URL"] = f"sqlite:///{SCRATCH_DB_PATH}"
+        # Keep readings spooled during the run out of the app's own spool
+        os.environ.setdefault("READING_SPOOL_PATH", SCRATCH_DB_PATH + ".spool")
+
+    results = simulate(count=args.nodes, transport=args.transport, duration=args.duration,
+                       interval=args.interval, heartbeat_interval=args.heartbeat,
+                       fires=args.fires, scenario=args.scenario, keep=args.keep)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"Sensor fleet: {args.nodes:,} nodes over {args.transport}, {args.scenario} fires")
+    print("=" * 60)
+    for key, value in results.items():
+        label = key.replace('_', ' ')
+        print(f"{label:24}: {value:>14,}" if isinstance(value, (int, float)) else f"{label:24}: {value:>14}")
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,170 @@
+import time
+import socket
+import selectors
+import logging
+import alert_trace
+from threading import Thread, Lock
+from line_framer import LineFramer, decode_line
+
+logger = logging.getLogger(__name__)
+
+# How long the selector waits before re-checking the running flag
+SELECT_TIMEOUT = 1.0
+
+class PortState:
+    """Per-port bookkeeping held by the multiplexer"""
+
+    def __init__(self, key, connection, context):
+        self.key = key
+        self.connection = connection
+        self.context = context
+        self.fd = None
+        self.framer = LineFramer()
+
+class SerialMultiplexer:
+    """Reads every registered serial port from one selector thread"""
+
+    def __init__(self, on_line, on_disconnect=None):
+        self.on_line = on_line
+        self.on_disconnect = on_disconnect
+        self.selector = selectors.DefaultSelector()
+        self.ports = {}
+        self.running = False
+        self._thread = None
+        self._changes = []
+        self._lock = Lock()
+        # Writing to this socket pair wakes the selector when ports are added or removed
+        self._wakeup_reader, self._wakeup_writer = socket.socketpair()
+        self._wakeup_reader.setblocking(False)
+        self._wakeup_writer.setblocking(False)
+        self.selector.register(self._wakeup_reader, selectors.EVENT_READ)
+
+    def start(self):
+        """Start the selector thread"""
+        if self._thread and self._thread.is_alive():
+            return
+        self.running = True
+        self._thread = Thread(target=self._run, name="serial-multiplexer")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop the selector thread and unregister every port"""
+        self.running = False
+        self._wakeup()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        for state in list(self.ports.values()):
+            self._unregister(state)
+        self._changes.clear()
+
+    def add(self, key, connection, context=None):
+        """Register an open serial connection; context is handed back with every line"""
+        if not hasattr(connection, 'fileno'):
+            logger.warning(f"Connection for {key} has no file descriptor and cannot be multiplexed")
+            return False
+        with self._lock:
+            self._changes.append(('add', PortState(key, connection, context)))
+        self._wakeup()
+        return True
+
+    def update_context(self, key, context):
+        """Replace the context handed back with a port's lines without re-registering it"""
+        state = self.ports.get(key)
+        if state:
+            state.context = context
+
+    def remove(self, key):
+        """Unregister a port; the caller stays responsible for closing it"""
+        with self._lock:
+            self._changes.append(('remove', key))
+        self._wakeup()
+
+    def _wakeup(self):
+        try:
+            self._wakeup_writer.send(b"\0")
+        except (BlockingIOError, OSError):
+            # The selector is already due to wake up
+            pass
+
+    def _apply_changes(self):
+        """Apply registrations queued by other threads; selectors are not thread-safe"""
+        with self._lock:
+            changes, self._changes = self._changes, []
+
+        for action, item in changes:
+            if action == 'add':
+                if item.key in self.ports:
+                    self._unregister(self.ports[item.key])
+                try:
+                    item.fd = item.connection.fileno()
+                    self.selector.register(item.fd, selectors.EVENT_READ, item)
+                    self.ports[item.key] = item
+                    logger.debug(f"Registered {item.key} with serial multiplexer")
+                except (OSError, ValueError) as e:
+                    logger.error(f"Could not register {item.key} with serial multiplexer: {e}")
+            elif action == 'remove' and item in self.ports:
+                self._unregister(self.ports[item])
+
+    def _unregister(self, state):
+        if self.ports.get(state.key) is state:
+            del self.ports[state.key]
+        try:
+            self.selector.unregister(state.fd)
+        except (KeyError, OSError, ValueError):
+            pass
+
+    def _run(self):
+        """Wait for any port to become readable and read only those that are"""
+        while self.running:
+            self._apply_changes()
+            try:
+                events = self.selector.select(timeout=SELECT_TIMEOUT)
+            except OSError as e:
+                logger.error(f"Serial multiplexer select failed: {e}")
+                continue
+
+            # Lines are traced from when the selector saw their port become readable
+            with alert_trace.received('serial', time.monotonic()):
+                for key, _ in events:
+                    if key.fileobj is self._wakeup_reader:
+                        try:
+                            while self._wakeup_reader.recv(4096):
+                                pass
+                        except BlockingIOError:
+                            pass
+                        continue
+                    # Skip events for ports removed earlier in this batch
+                    if self.ports.get(key.data.key) is key.data:
+                        self._read_port(key.data)
+
+    def _read_port(self, state):
+        """Drain a readable port in one read and hand complete lines to the callback"""
+        try:
+            count = state.framer.read_from(state.fd)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            self._drop_port(state, e)
+            return
+
+        if not count:
+            # Readable with no data means the device went away
+            self._drop_port(state, "device disconnected")
+            return
+
+        for raw in state.framer.lines():
+            line = decode_line(raw)
+            if not line:
+                continue
+            try:
+                self.on_line(state.context, line)
+            except Exception as e:
+                logger.error(f"Error handling line from {state.key}: {e}")
+
+    def _drop_port(self, state, reason):
+        logger.error(f"Serial error on {state.key}: {reason}")
+        self._unregister(state)
+        if self.on_disconnect:
+            self.on_disconnect(state.key, state.context, state.connection)
@@ -0,0 +1,207 @@
+import os
+import re
+import json
+import queue
+import logging
+import itertools
+import multiprocessing
+from threading import Lock, Thread
+from ingest_worker import BatchError, run_worker
+from sensor_registry import sensor_registry
+
+logger = logging.getLogger(__name__)
+
+# Worker processes for batch ingest; 0 parses and checks batches in the web process
+INGEST_WORKERS = int(os.environ.get("INGEST_WORKERS", "0"))
+
+# Seconds to wait for every shard of a batch before giving up on it
+INGEST_WORKER_TIMEOUT = float(os.environ.get("INGEST_WORKER_TIMEOUT", "30"))
+
+# Reads a frame's sensor id without decoding the JSON, so lines can be routed to their shard;
+# it only matches a sensor_id that is the object's first key, other lines are decoded
+SENSOR_ID_PATTERN = re.compile(rb'\s*\{\s*"sensor_id"\s*:\s*("?)(\d+)\1\s*[,}]')
+
+class ShardedIngest:
+    """Partitions batch ingest across worker processes by sensor id.
+
+    Workers parse, threshold-check and aggregate their shard of a batch and
+    send back compact rows and rollup deltas; the calling process stays the
+    single database writer. Rate-of-rise detection runs in a second round,
+    once every shard has accepted the batch, so a rejected batch never
+    reaches the workers' detectors. Sensor configs are sent to a worker
+    only when the registry version has changed since it last got them.
+
+    Only /api/readings/batch goes through the workers; serial and socket
+    readings are still handled in the web process. Several batches may be
+    in flight at once: a router thread hands each result to the request
+    waiting for its job.
+    """
+
+    def __init__(self, workers=INGEST_WORKERS):
+        self.workers = workers
+        # spawn, not fork: the web process runs threads that must not be copied mid-flight
+        self._context = multiprocessing.get_context('spawn')
+        self._processes = []
+        self._inboxes = []
+        self._outbox = None
+        self._sent_versions = []
+        self._jobs = itertools.count(1)
+        self._waiting = {}  # job_id -> queue.Queue its shard results are routed to
+        self._router = None
+        self._lock = Lock()
+
+    def start(self):
+        """Start any worker processes that are not running"""
+        if self._outbox is None:
+            self._outbox = self._context.Queue()
+        for shard in range(self.workers):
+            if shard < len(self._processes) and self._processes[shard].is_alive():
+                continue
+            inbox = self._context.Queue()
+            process = self._context.Process(target=run_worker, args=(shard, self.workers, inbox, self._outbox),
+                                            name=f"ingest-worker-{shard}", daemon=True)
+            process.start()
+            if shard < len(self._processes):
+                logger.warning(f"Restarted ingest worker {shard}")
+                self._processes[shard], self._inboxes[shard] = process, inbox
+                self._sent_versions[shard] = None
+            else:
+                self._processes.append(process)
+                self._inboxes.append(inbox)
+                self._sent_versions.append(None)
+        if self._router is None or not self._router.is_alive():
+            self._router = Thread(target=self._route, name="ingest-results", daemon=True)
+            self._router.start()
+        logger.info(f"Sharded ingest running with {self.workers} worker processes")
+
+    def stop(self):
+        """Ask every worker to exit and wait for it"""
+        for inbox in self._inboxes:
+            inbox.put(None)
+        for process in self._processes:
+            process.join(timeout=5)
+        if self._router is not None:
+            self._outbox.put(None)
+            self._router.join(timeout=5)
+            self._router = None
+        self._processes, self._inboxes, self._sent_versions = [], [], []
+
+    def _route(self):
+        """Hand each worker result to the batch waiting for it"""
+        while True:
+            result = self._outbox.get()
+            if result is None:
+                break
+            with self._lock:
+                waiting = self._waiting.get(result[0])
+            # Nobody waits any more for a batch that timed out
+            if waiting is not None:
+                waiting.put(result[1:])
+
+    def process(self, data, max_frames):
+        """Process one decompressed NDJSON batch of at most max_frames frames across the workers.
+
+        Returns (rows, deltas, latest, worst, detections) merged from every shard, in
+        the form ingest_worker.process_shard and observe_shard return them. Raises BatchError
+        for a batch that must be rejected and RuntimeError when a worker fails.
+        """
+        shards = split_lines(data, self.workers)
+        frames = sum(len(lines) for lines in shards)
+        if not frames:
+            raise BatchError('Empty batch')
+        if frames > max_frames:
+            raise BatchError(f'Batch exceeds {max_frames} frames')
+
+        # The lock only covers handing out the shards, so each worker still
+        # gets every batch's lines for its sensors in order
+        results = queue.Queue()
+        with self._lock:
+            if len(self._processes) < self.workers or not all(p.is_alive() for p in self._processes):
+                self.start()
+            version, configs = sensor_registry.snapshot()
+            job_id = next(self._jobs)
+            self._waiting[job_id] = results
+            pending = set()
+            for shard, lines in enumerate(shards):
+                if not lines:
+                    continue
+                stale = self._sent_versions[shard] != version
+                self._inboxes[shard].put((job_id, configs if stale else None, lines))
+                self._sent_versions[shard] = version
+                pending.add(shard)
+
+        try:
+            answers = self._collect(job_id, results, pending)
+            errors = [error for error, _ in answers.values() if error]
+            # Workers hold each shard's readings until they hear whether the whole batch stands
+            self._settle(job_id, pending, not errors)
+            if errors:
+                # A BatchError is the client's fault; anything else is ours
+                raise next((e for e in errors if isinstance(e, BatchError)), errors[0])
+            detections = self._collect(job_id, results, pending)
+        finally:
+            with self._lock:
+                self._waiting.pop(job_id, None)
+
+        rows, deltas, latest, worst, detected = [], [], {}, {}, []
+        for shard in pending:
+            error, shard_detections = detections[shard]
+            if error:
+                raise error
+            shard_rows, shard_deltas, shard_latest, shard_worst = answers[shard][1]
+            # Shards hold disjoint sensors, so their results never overlap
+            rows.extend(shard_rows)
+            deltas.extend(shard_deltas)
+            latest.update(shard_latest)
+            worst.update(shard_worst)
+            detected.extend(shard_detections)
+        return rows, deltas, latest, worst, detected
+
+    def _collect(self, job_id, results, shards):
+        """Wait for the next answer about a job from every shard; returns {shard: (error, result)}"""
+        answers = {}
+        while len(answers) < len(shards):
+            try:
+                shard, error, result = results.get(timeout=INGEST_WORKER_TIMEOUT)
+            except queue.Empty:
+                # The job may still finish later; it must not reach the detectors then,
+                # and which configs a worker holds can't be trusted
+                self._settle(job_id, shards, False)
+                with self._lock:
+                    self._sent_versions = [None] * len(self._sent_versions)
+                raise RuntimeError(f'Ingest workers did not answer within {INGEST_WORKER_TIMEOUT}s')
+            answers[shard] = (error, result)
+        return answers
+
+    def _settle(self, job_id, shards, accepted):
+        """Tell each shard whether to feed the readings it holds for a job to its detector or drop them"""
+        with self._lock:
+            for shard in shards:
+                if shard < len(self._inboxes):
+                    self._inboxes[shard].put((job_id, accepted))
+
+def split_lines(data, shards):
+    """Split NDJSON bytes into per-shard lists of (line_number, line) by sensor_id % shards.
+
+    Lines whose top-level sensor_id can't be read go to shard 0, whose
+    parser reports them as invalid.
+    """
+    split = [[] for _ in range(shards)]
+    match = SENSOR_ID_PATTERN.match
+    for line_number, line in enumerate(data.split(b'\n'), 1):
+        if not line.strip():
+            continue
+        found = match(line)
+        sensor_id = int(found.group(2)) if found else frame_sensor_id(line)
+        split[sensor_id % shards if sensor_id is not None else 0].append((line_number, line))
+    return split
+
+def frame_sensor_id(line):
+    """Decode a line to read its top-level sensor_id the way the workers will, or None"""
+    try:
+        return int(json.loads(line)['sensor_id'])
+    except (ValueError, TypeError, KeyError, IndexError, OverflowError):
+        return None
+
+# Global sharded ingest instance; workers start on the first batch
+sharded_ingest = ShardedIngest()
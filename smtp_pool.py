@@ -0,0 +1,113 @@
+import time
+import smtplib
+import logging
+from threading import Lock, BoundedSemaphore
+
+logger = logging.getLogger(__name__)
+
+class SMTPPool:
+    """Pool of authenticated SMTP sessions shared by every notification thread.
+
+    Opening a session costs a TCP connect, EHLO, STARTTLS and LOGIN, so
+    sessions are kept open and reused across recipients and alerts. Sessions
+    idle longer than idle_timeout are closed rather than reused, since
+    servers drop them; a reused session the server has already dropped is
+    replaced and the send retried once on a fresh one.
+    """
+
+    def __init__(self, host, port, username, password, size=4, idle_timeout=60, timeout=30):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self._idle = []  # (session, last used monotonic time), most recently used last
+        self._lock = Lock()
+        self._slots = BoundedSemaphore(size)
+        self.opened = 0
+        self.reused = 0
+        self.reconnected = 0
+
+    def _connect(self):
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            server.starttls()
+            server.login(self.username, self.password)
+        except Exception:
+            _close(server)
+            raise
+        self.opened += 1
+        return server
+
+    def _checkout(self):
+        """The most recently used idle session, or None; sessions past idle_timeout are closed"""
+        with self._lock:
+            now = time.monotonic()
+            expired = [server for server, last_used in self._idle if now - last_used >= self.idle_timeout]
+            self._idle = [(server, last_used) for server, last_used in self._idle
+                          if now - last_used < self.idle_timeout]
+            server = self._idle.pop()[0] if self._idle else None
+        for stale in expired:
+            _close(stale)
+        return server
+
+    def _checkin(self, server):
+        with self._lock:
+            self._idle.append((server, time.monotonic()))
+
+    def sendmail(self, from_addr, to_addrs, message):
+        """Send message to to_addrs over a pooled session; returns smtplib's refused-recipients dict"""
+        with self._slots:
+            server = self._checkout()
+            if server is not None:
+                self.reused += 1
+                try:
+                    return self._send(server, from_addr, to_addrs, message)
+                except smtplib.SMTPServerDisconnected:
+                    pass
+                except smtplib.SMTPResponseException as e:
+                    # 421: the server is closing the session, typically on idle timeout
+                    if e.smtp_code != 421:
+                        raise
+                # The server dropped the session before accepting the message; resend on a new one
+                logger.info(f"Pooled SMTP session to {self.host} was closed by the server; reconnecting")
+                self.reconnected += 1
+            return self._send(self._connect(), from_addr, to_addrs, message)
+
+    def _send(self, server, from_addr, to_addrs, message):
+        try:
+            refused = server.sendmail(from_addr, to_addrs, message)
+        except smtplib.SMTPRecipientsRefused:
+            # smtplib resets the session, so it stays usable
+            self._checkin(server)
+            raise
+        except Exception:
+            _close(server)
+            raise
+        self._checkin(server)
+        return refused
+
+    def close(self):
+        """QUIT every idle session"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for server, _ in idle:
+            _close(server)
+
+    def stats(self):
+        return {
+            'idle': len(self._idle),
+            'opened': self.opened,
+            'reused': self.reused,
+            'reconnected': self.reconnected,
+        }
+
+def _close(server):
+    try:
+        server.quit()
+    except Exception:
+        try:
+            server.close()
+        except Exception:
+            pass
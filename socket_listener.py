@@ -0,0 +1,226 @@
+import os
+import json
+import time
+import queue
+import asyncio
+import logging
+from threading import Thread
+from line_framer import LineFramer, decode_line
+from ingest_queue import IngestQueue
+import alert_trace
+
+logger = logging.getLogger(__name__)
+
+# Where Wi-Fi sensor nodes connect; a port of 0 disables that transport
+SENSOR_LISTEN_HOST = os.environ.get("SENSOR_LISTEN_HOST", "0.0.0.0")
+SENSOR_TCP_PORT = int(os.environ.get("SENSOR_TCP_PORT", "0"))
+SENSOR_UDP_PORT = int(os.environ.get("SENSOR_UDP_PORT", "0"))
+
+# Line buffer per TCP connection; kept small so thousands of idle nodes stay cheap
+NODE_LINE_BUFFER_SIZE = int(os.environ.get("NODE_LINE_BUFFER_SIZE", "4096"))
+
+# TCP connections silent for this many seconds are closed (0 keeps them open)
+NODE_IDLE_TIMEOUT = int(os.environ.get("NODE_IDLE_TIMEOUT", "900"))
+
+# Received line batches waiting for the worker thread; when full the oldest are dropped,
+# since the event loop must never block, unless they carry a threshold crossing
+NODE_QUEUE_SIZE = int(os.environ.get("NODE_QUEUE_SIZE", "10000"))
+
+class NodeStream(asyncio.Protocol):
+    """A persistent TCP connection from one sensor node"""
+
+    def __init__(self, listener):
+        self.listener = listener
+        self.framer = LineFramer(NODE_LINE_BUFFER_SIZE)
+        self.transport = None
+        self.peer = None
+        self.sensor = None  # bound by the first frame that carries a sensor_id
+        self.last_seen = time.monotonic()
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.peer = transport.get_extra_info('peername')
+        self.listener.streams.add(self)
+        logger.debug(f"Sensor node connected from {self.peer}")
+
+    def data_received(self, data):
+        self.last_seen = time.monotonic()
+        lines = [decode_line(raw) for raw in self.framer.feed(data)]
+        if lines:
+            self.listener.submit('tcp', self.last_seen, lines, self.peer, self)
+
+    def connection_lost(self, exc):
+        self.listener.streams.discard(self)
+        name = self.sensor.name if self.sensor else self.peer
+        logger.debug(f"Sensor node {name} disconnected")
+
+class NodeDatagrams(asyncio.DatagramProtocol):
+    """UDP frames from sensor nodes; every line must carry its sensor_id"""
+
+    def __init__(self, listener):
+        self.listener = listener
+
+    def datagram_received(self, data, addr):
+        self.listener.submit('udp', time.monotonic(), [decode_line(raw) for raw in data.splitlines()], addr)
+
+class SensorListener:
+    """Accepts fire_sensor_node.ino JSON lines over UDP and TCP on one asyncio loop thread.
+
+    The loop only frames lines and queues them; a worker thread resolves
+    their sensors and runs on_line, so database work never blocks the loop.
+    When the queue is full, is_crossing(line, sensor) is asked about the
+    batch about to be dropped; one with a threshold crossing is kept. It
+    must not touch the database.
+    """
+
+    def __init__(self, on_line, resolve_sensor, is_crossing=None, host=SENSOR_LISTEN_HOST,
+                 tcp_port=SENSOR_TCP_PORT, udp_port=SENSOR_UDP_PORT):
+        self.on_line = on_line
+        self.resolve_sensor = resolve_sensor
+        self.is_crossing = is_crossing
+        self.host = host
+        self.tcp_port = tcp_port
+        self.udp_port = udp_port
+        self.streams = set()
+        self.rejected = 0
+        self.queue = IngestQueue(NODE_QUEUE_SIZE, 'drop_quiet', name="listener",
+                                 is_critical=self._carries_crossing if is_crossing else None)
+        self.loop = None
+        self._server = None
+        self._datagrams = None
+        self._thread = None
+        self._worker = None
+        self._working = False
+
+    def start(self):
+        """Open the configured ports in a background thread; returns False when none are configured"""
+        if not (self.tcp_port or self.udp_port):
+            return False
+        if self._thread and self._thread.is_alive():
+            return True
+        self._working = True
+        self._worker = Thread(target=self._work, name="sensor-listener-worker")
+        self._worker.daemon = True
+        self._worker.start()
+        self.loop = asyncio.new_event_loop()
+        self._thread = Thread(target=self._run, name="sensor-listener")
+        self._thread.daemon = True
+        self._thread.start()
+        return True
+
+    def stop(self):
+        """Close every connection and stop the loop thread"""
+        if not self._thread:
+            return
+        if self.loop.is_running():
+            self.loop.call_soon_threadsafe(self._close)
+        self._thread.join()
+        self._thread = None
+        # The worker finishes the lines already received, then exits
+        self._working = False
+        self._worker.join()
+        self._worker = None
+
+    def submit(self, source, received, lines, peer, stream=None):
+        """Queue lines read at monotonic time received for the worker thread"""
+        self.queue.put(peer, (source, received, lines, peer, stream))
+
+    def _carries_crossing(self, item):
+        _, _, lines, _, stream = item
+        sensor = stream.sensor if stream is not None else None
+        return any(self.is_crossing(line, sensor) for line in lines if line)
+
+    def _work(self):
+        while self._working or not self.queue.empty():
+            try:
+                source, received, lines, peer, stream = self.queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            with alert_trace.received(source, received):
+                for line in lines:
+                    if stream is None:
+                        self.handle_line(line, None, peer)
+                    else:
+                        stream.sensor = self.handle_line(line, stream.sensor, peer)
+
+    def handle_line(self, line, sensor, peer):
+        """Route one line to the sensor it names, or to the connection's bound sensor.
+
+        Returns the sensor the line was attributed to so streams can remember it.
+        """
+        if not line:
+            return sensor
+        try:
+            frame = json.loads(line)
+        except ValueError:
+            frame = None
+
+        if isinstance(frame, dict):
+            if 'sensor_id' in frame:
+                sensor = self.resolve_sensor(frame['sensor_id'])
+            data = frame
+        else:
+            # Bare values are only accepted once the connection has named its sensor
+            data = line
+
+        if sensor is None:
+            self.rejected += 1
+            logger.debug(f"Dropping frame from {peer} without a known sensor_id: {line}")
+            return None
+
+        try:
+            self.on_line(sensor, data)
+        except Exception as e:
+            logger.error(f"Error handling frame from {peer}: {e}")
+        return sensor
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self._open())
+        except OSError as e:
+            logger.error(f"Could not open sensor listener on {self.host}: {e}")
+            self._close_transports()
+        else:
+            self.loop.run_forever()
+        finally:
+            # Let transports finish closing before the loop goes away
+            self.loop.run_until_complete(asyncio.sleep(0))
+            self.loop.close()
+
+    async def _open(self):
+        if self.tcp_port:
+            self._server = await self.loop.create_server(
+                lambda: NodeStream(self), self.host, self.tcp_port,
+                reuse_address=True, backlog=1024
+            )
+            logger.info(f"Listening for sensor nodes on tcp://{self.host}:{self.tcp_port}")
+        if self.udp_port:
+            self._datagrams, _ = await self.loop.create_datagram_endpoint(
+                lambda: NodeDatagrams(self), local_addr=(self.host, self.udp_port)
+            )
+            logger.info(f"Listening for sensor nodes on udp://{self.host}:{self.udp_port}")
+        if self.tcp_port and NODE_IDLE_TIMEOUT:
+            self.loop.call_later(min(NODE_IDLE_TIMEOUT, 60), self._close_idle)
+
+    def _close_idle(self):
+        """Drop TCP connections that have been silent for NODE_IDLE_TIMEOUT seconds"""
+        cutoff = time.monotonic() - NODE_IDLE_TIMEOUT
+        for stream in [s for s in self.streams if s.last_seen < cutoff]:
+            logger.info(f"Closing idle sensor node connection from {stream.peer}")
+            stream.transport.close()
+        self.loop.call_later(min(NODE_IDLE_TIMEOUT, 60), self._close_idle)
+
+    def _close(self):
+        self._close_transports()
+        self.loop.stop()
+
+    def _close_transports(self):
+        if self._server:
+            self._server.close()
+            self._server = None
+        if self._datagrams:
+            self._datagrams.close()
+            self._datagrams = None
+        for stream in list(self.streams):
+            stream.transport.close()
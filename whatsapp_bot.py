@@ -6,10 +6,9 @@ from twilio.rest import Client
 from twilio.twiml.messaging_response import MessagingResponse
 from app import app, db
 from models import Alert, AlertType, AlertStatus
-from notifier import send_alert_notifications
+from notification_outbox import notification_outbox
 from gps_navigator import geocode_address, reverse_geocode
 import re
-import threading
 import requests
 from datetime import datetime
 
@@ -402,12 +401,11 @@ def create_fire_alert_from_whatsapp(session_data, reporter_phone):
             )
 
             db.session.add(alert)
+            notification_outbox.enqueue(alert)
             db.session.commit()
 
             # Send notifications to emergency responders
-            notification_thread = threading.Thread(target=send_alert_notifications, args=(alert.id,))
-            notification_thread.daemon = True
-            notification_thread.start()
+            notification_outbox.wake(alert.id)
 
             logger.info(f"Fire alert created from WhatsApp: {alert.id}")
             return alert.id